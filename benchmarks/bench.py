@@ -0,0 +1,271 @@
+########
+#
+# Filename: bench.py
+# Name: pyoocouchdb benchmarks
+#
+# Description: Runs pyoocouchdb operations against the local CouchDB stand-in (standin.py, in its own
+#              process so only client work is timed and traced) and prints machine-readable JSON:
+#              ops/sec, latency percentiles, requests and bytes per operation, and allocations.
+#
+#              python benchmarks/bench.py [--only NAME ...] [--scale X] [--codec orjson] [--emulated] [--output FILE] [--compare OLD.json]
+#
+##########
+
+# Imports
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from pyoocouchdb import Server, Database, Instrumentation, EmulatorTransport
+from pyoocouchdb.Document import Document
+
+
+# Starts standin.py in a child process, returns (process, port)
+def start_standin():
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, "standin.py")], stdout=subprocess.PIPE, text=True)
+    for line in process.stdout:
+        if line.startswith("PORT "):
+            return process, int(line.split()[1])
+    process.kill()
+    raise RuntimeError("Stand-in exited before listening")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def sample_doc(index):
+    return {"type": "even" if index % 2 == 0 else "odd", "n": index, "name": f"user {index}", "tags": ["a", "b", "c"], "profile": {"age": index % 90, "active": True}}
+
+
+def make_db(server, name, docs=0):
+    db = Database(server, name)
+    if db.exists:
+        db.delete()
+    db = Database(server, name)
+    db.create()
+    if docs:
+        db.bulk_create(dict(sample_doc(index), _id=f"doc{index:08d}") for index in range(docs))
+    return db
+
+
+# Benchmark definitions: name -> (iterations, items per op, setup(server) -> state, op(state, index))
+# iterations are scaled by --scale, items per op turn ops/sec into items/sec (docs, rows, databases)
+def document_create_setup(server):
+    return {"db": make_db(server, "bench_create")}
+
+def document_create(state, index):
+    Document(state["db"], content=sample_doc(index)).create()
+
+def document_create_with_id(state, index):
+    Document(state["db"], doc_id=f"id{index:08d}", content=sample_doc(index), lazy=True).create()
+
+def document_read_setup(server):
+    return {"db": make_db(server, "bench_read", docs=100)}
+
+def document_read(state, index):
+    Document(state["db"], doc_id=f"doc{index % 100:08d}").content
+
+def document_update_setup(server):
+    db = make_db(server, "bench_update", docs=1)
+    return {"db": db, "doc": Document(db, doc_id="doc00000000")}
+
+def document_update(state, index):
+    state["doc"].content["n"] = index
+    state["doc"].update()
+
+def document_delete_setup(server):
+    return {"db": make_db(server, "bench_delete", docs=20000)}
+
+def document_delete(state, index):
+    Document(state["db"], doc_id=f"doc{index:08d}").delete()
+
+def bulk_create_setup(server):
+    return {"db": make_db(server, "bench_bulk")}
+
+def bulk_create(state, index):
+    state["db"].bulk_create(dict(sample_doc(number), _id=f"b{index:06d}-{number:04d}") for number in range(1000))
+
+def read_setup(server):
+    return {"db": make_db(server, "bench_scan", docs=2000)}
+
+def all_docs(state, index):
+    state["db"].all_docs(include_docs=True)
+
+def iter_all_docs(state, index):
+    for row in state["db"].iter_all_docs(page_size=500, include_docs=True):
+        pass
+
+def find(state, index):
+    for doc in state["db"].iter_find({"type": "even"}, page_size=500, on_full_scan=None):
+        pass
+
+def changes(state, index):
+    state["db"].changes(since=0)
+
+def fleet_setup(server):
+    for index in range(100):
+        make_db(server, f"bench_fleet_{index:03d}")
+    return {"server": server}
+
+def fleet_all_dbs(state, index):
+    state["server"].all_dbs()
+
+def fleet_dbs_info(state, index):
+    state["server"].dbs_info()
+
+def fleet_snapshot_setup(server):
+    state = fleet_setup(server)
+    state["snapshot"] = server.fleet_snapshot(ttl=0, include="bench_fleet_*")
+    state["snapshot"].refresh()
+    return state
+
+def fleet_snapshot(state, index):
+    state["snapshot"].databases()
+
+def fleet_compact_all(state, index):
+    state["server"].compact_all(include=["bench_fleet_*"])
+
+def fleet_sync_all_shards(state, index):
+    state["server"].sync_all_shards(include=["bench_fleet_*"])
+
+
+BENCHMARKS = {
+    "document_create": (1000, 1, document_create_setup, document_create),
+    "document_create_with_id": (1000, 1, document_create_setup, document_create_with_id),
+    "document_read": (1000, 1, document_read_setup, document_read),
+    "document_update": (1000, 1, document_update_setup, document_update),
+    "document_delete": (1000, 1, document_delete_setup, document_delete),
+    "bulk_create": (20, 1000, bulk_create_setup, bulk_create),
+    "all_docs": (20, 2000, read_setup, all_docs),
+    "iter_all_docs": (20, 2000, read_setup, iter_all_docs),
+    "find": (20, 1000, read_setup, find),
+    "changes": (20, 2000, read_setup, changes),
+    "fleet_all_dbs": (200, 1, fleet_setup, fleet_all_dbs),
+    "fleet_dbs_info": (50, 100, fleet_setup, fleet_dbs_info),
+    "fleet_snapshot": (200, 100, fleet_snapshot_setup, fleet_snapshot),
+    "fleet_compact_all": (10, 100, fleet_setup, fleet_compact_all),
+    "fleet_sync_all_shards": (10, 100, fleet_setup, fleet_sync_all_shards),
+}
+
+
+# Times iterations of op, then runs a tenth of them again under tracemalloc
+def measure(server, iterations, items, setup, op):
+    state = setup(server)
+    warmup = max(1, iterations // 20)
+    for index in range(warmup):
+        op(state, index)
+    latencies = []
+    with server.instrumentation.track() as tracker:
+        started = time.perf_counter()
+        for index in range(warmup, warmup + iterations):
+            begin = time.perf_counter()
+            op(state, index)
+            latencies.append(time.perf_counter() - begin)
+        elapsed = time.perf_counter() - started
+    traced = max(1, iterations // 10)
+    peaks = []
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for index in range(warmup + iterations, warmup + iterations + traced):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        op(state, index)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return {
+        "iterations": iterations,
+        "seconds": round(elapsed, 6),
+        "ops_per_sec": round(iterations / elapsed, 2),
+        "items_per_sec": round(iterations * items / elapsed, 2),
+        "latency_ms": {
+            "mean": round(elapsed / iterations * 1000, 4),
+            "p50": round(percentile(latencies, 0.5) * 1000, 4),
+            "p99": round(percentile(latencies, 0.99) * 1000, 4),
+            "max": round(max(latencies) * 1000, 4)
+        },
+        "requests_per_op": round(tracker.requests / iterations, 3),
+        "error_responses": tracker.errors,
+        "bytes_sent_per_op": round(tracker.bytes_sent / iterations, 1),
+        "bytes_received_per_op": round(tracker.bytes_received / iterations, 1),
+        "alloc_peak_bytes_per_op": round(sum(peaks) / len(peaks), 1),
+        "alloc_retained_bytes_per_op": round(retained / traced, 1)
+    }
+
+
+# Prints how each benchmark moved against an earlier run
+def compare(results, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+    for name, result in results.items():
+        if name not in baseline.keys():
+            continue
+        old = baseline[name]
+        speed = (result["ops_per_sec"] / old["ops_per_sec"] - 1) * 100
+        requests = result["requests_per_op"] - old["requests_per_op"]
+        allocations = result["alloc_peak_bytes_per_op"] - old["alloc_peak_bytes_per_op"]
+        print(f"{name:<24} ops/sec {speed:+7.1f}%  p99 {old['latency_ms']['p99']:.3f} -> {result['latency_ms']['p99']:.3f} ms  requests/op {requests:+.3f}  peak alloc/op {allocations:+.0f} B", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pyoocouchdb benchmarks against a local CouchDB stand-in")
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="benchmarks to run, all by default")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier for the iterations of every benchmark")
+    parser.add_argument("--codec", default=None, help="JSON codec of the Server (json, orjson, ujson, fastest)")
+    parser.add_argument("--emulated", action="store_true", help="run against an in-process EmulatorTransport instead of the HTTP stand-in")
+    parser.add_argument("--output", help="file to write the JSON results to, stdout by default")
+    parser.add_argument("--compare", help="earlier results file to compare against, printed to stderr")
+    args = parser.parse_args()
+
+    if args.emulated:
+        process = None
+        server = Server("emulator", instrumentation=Instrumentation(), codec=args.codec, transport=EmulatorTransport())
+    else:
+        process, port = start_standin()
+        server = Server("127.0.0.1", port=port, instrumentation=Instrumentation(), codec=args.codec)
+    try:
+        results = {}
+        for name in args.only or BENCHMARKS.keys():
+            iterations, items, setup, op = BENCHMARKS[name]
+            print(f"Running {name}", file=sys.stderr)
+            results[name] = measure(server, max(1, int(iterations * args.scale)), items, setup, op)
+        server.close()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "codec": server.codec.name,
+            "transport": "emulator" if args.emulated else "http",
+            "scale": args.scale
+        },
+        "results": results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
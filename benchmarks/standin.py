@@ -0,0 +1,102 @@
+########
+#
+# Filename: standin.py
+# Name: CouchDB stand-in for the benchmarks
+#
+# Description: pyoocouchdb.Emulator served over HTTP/1.1 with keep-alive, so the benchmarks
+#              exercise the real connection pool: /, _all_dbs, _dbs_info, _uuids, db GET/PUT/DELETE,
+#              doc CRUD, _bulk_docs, _all_docs, _find, _changes, _compact, _sync_shards and the rest
+#              of what the emulator answers.
+#              Run it as "python benchmarks/standin.py [--port N]", it prints "PORT <n>" once listening.
+#
+##########
+
+# Imports
+import argparse
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyoocouchdb.Emulator import Emulator, REASONS
+
+
+# Request Handler Class - HTTP/1.1 keep-alive, one write per response
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            data = b""
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                data += self.rfile.read(size)
+                self.rfile.readline()
+            return data
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _handle(self):
+        status, headers, body = self.server.emulator.handle(self.command, self.path, dict(self.headers.items()), self._read_body())
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"] + [f"{key}: {value}" for key, value in headers.items()]
+        if type(body) is bytes:
+            head.append(f"Content-Length: {len(body)}")
+            self.wfile.write("\r\n".join(head).encode() + b"\r\n\r\n" + body)
+            return
+        # Feeds (continuous _changes, _db_updates) go out chunk by chunk as rows appear
+        self.wfile.write("\r\n".join(head).encode() + b"\r\n\r\n")
+        try:
+            for chunk in body:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        finally:
+            body.close()
+
+    do_GET = do_PUT = do_POST = do_DELETE = do_HEAD = _handle
+
+
+# Threaded HTTP server in front of a pyoocouchdb Emulator
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, emulator=None):
+        ThreadingHTTPServer.__init__(self, ("127.0.0.1", port), StandInHandler)
+        self.emulator = emulator if emulator is not None else Emulator()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+# Starts a stand-in in a background thread, returns the server
+def start(port=0):
+    server = StandInServer(port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory CouchDB stand-in")
+    parser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args()
+    server = StandInServer(args.port)
+    print(f"PORT {server.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
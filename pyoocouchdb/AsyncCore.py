@@ -0,0 +1,66 @@
+########
+#
+# Filename: AsyncCore.py
+# Name: couchdblib asyncio endpoint
+#
+# Description: Awaitable counterpart of Core.endpoint_api
+#
+##########
+
+# Imports
+import asyncio
+import http.client
+import logging
+from .Core import get_server, build_headers, encode_body, decode_response
+
+
+# API Endpoint Interaction
+async def endpoint_api(object, endpoint, headers={}, data={}, json_data={}, method='GET', admin=False, compatibility=False, raw=False):
+    logger = logging.getLogger('async_endpoint_api')
+    try:
+        response = await endpoint_response(object, endpoint, headers=headers, data=data, json_data=json_data, method=method, admin=admin)
+        logger.debug("Crude response >>> %s %s", response.status, response.reason)
+        if raw:
+            return response.body
+        return decode_response(response, get_server(object).codec)
+    except asyncio.CancelledError:
+        raise
+    except http.client.HTTPException as he:
+        logger.error('HTTPException while trying the connection')
+        logger.debug(he)
+        return {
+            'status': 'error',
+            'headers': {},
+            'content': str(he)
+        }
+    except Exception as e:
+        logger.critical(e.__str__())
+        return {
+            'status': 'error',
+            'fullerror': e.__str__()
+        }
+
+
+# Sends a request and returns the PoolResponse itself (status, headers, body), errors are raised
+async def endpoint_response(object, endpoint, headers={}, data={}, json_data={}, method='GET', admin=False):
+    logger = logging.getLogger('async_endpoint_response')
+    endpoint_url = f"{object.url}{endpoint}"
+    logger.debug("%s %s", method, endpoint_url)
+    default_header = len(headers.keys()) == 0
+    # Every object shares the pool and credentials of its AsyncServer
+    server = get_server(object)
+    headers = build_headers(server, headers, admin=admin, default_header=default_header)
+    body = encode_body(data=data, json_data=json_data, method=method.upper(), codec=server.codec)
+    if body is not None and "Content-Type" not in headers:
+        headers["Content-Type"] = "application/json"
+    instrumentation = getattr(server, "instrumentation", None)
+    info = instrumentation.before(method.upper(), endpoint_url, server.url, body) if instrumentation is not None else None
+    try:
+        response = await server.pool.request(method=method.upper(), url=endpoint_url, headers=headers, body=body)
+    except BaseException as e:
+        if info is not None:
+            instrumentation.after(info, error=e)
+        raise
+    if info is not None:
+        instrumentation.after(info, status=response.status, bytes_received=len(response.body))
+    return response
@@ -0,0 +1,82 @@
+import logging
+from . import AsyncCore as f
+from .AsyncDocument import AsyncDocument
+
+
+# Async Database Class - asyncio mirror of Database
+class AsyncDatabase(object):
+    # Initialization, existence is unknown (None) until load()
+    def __init__(self, server, name):
+        self.server = server
+        self.name = name
+        self.url = f"{self.server.url}{name}/"
+        self.exists = None
+
+    def __str__(self):
+        return self.url
+
+    # Looks for the database on the server
+    async def load(self):
+        logger = logging.getLogger('AsyncDatabase::load')
+        resp = await f.endpoint_api(self, endpoint='')
+        if 'db_name' in resp.keys():
+            logger.debug("Database found!")
+            self.exists = True
+        else:
+            logger.debug("Database NOT found!")
+            self.exists = False
+        return resp
+
+    # Creates a non-existent database
+    async def create(self):
+        response = await f.endpoint_api(self, endpoint='', method='PUT')
+        if response.get("ok"):
+            self.exists = True
+        return response
+
+    # Deletes existing database
+    async def delete(self):
+        response = await f.endpoint_api(self, endpoint='', method='DELETE')
+        if response.get("ok"):
+            self.exists = False
+        return response
+
+    async def all_docs(self, include_docs=False):
+        endpoint = "_all_docs?include_docs=true" if include_docs else "_all_docs"
+        return await f.endpoint_api(self, endpoint=endpoint)
+
+    # Returns the change log of the DB
+    async def changes(self, since=None):
+        endpoint = f"_changes?since={since}" if since is not None else "_changes"
+        return await f.endpoint_api(self, endpoint=endpoint)
+
+    # Find document by ID
+    async def find_by_id(self, doc_id):
+        doc = AsyncDocument(self, doc_id=doc_id)
+        await doc.load()
+        return doc
+
+    # Find using the JSON query syntax
+    async def find(self, query=None):
+        headers = {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+        return await f.endpoint_api(self, endpoint='_find', headers=headers, json_data=query, method='POST')
+
+    # Bulk Insert
+    async def bulk_create(self, docs):
+        headers = {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+        }
+        if type(docs) is not dict:
+            docs = {"docs": list(docs)}
+        return await f.endpoint_api(self, endpoint='_bulk_docs', headers=headers, json_data=docs, method='POST')
+
+    # Security Data
+    async def get_security_data(self):
+        return await f.endpoint_api(self, endpoint='_security')
+
+    async def set_security_data(self, definition):
+        return await f.endpoint_api(self, endpoint='_security', json_data=definition, method='PUT')
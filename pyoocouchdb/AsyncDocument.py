@@ -0,0 +1,127 @@
+import json
+import logging
+import uuid
+from . import AsyncCore as f
+
+
+# Async Document Class - asyncio mirror of Document
+class AsyncDocument(object):
+    # Initialization, existence is unknown (None) until load() or a write
+    def __init__(self, database, doc_id=None, content={}):
+        self.database = database
+        self.content = dict(content)
+        self.revision = self.content.get('_rev')
+        self.exists = None
+        if doc_id is None:
+            # A taken id surfaces as a 409 on create(), no lookup needed
+            doc_id = self.content.get('_id') or uuid.uuid4().hex
+        self.id = doc_id
+        self.content['_id'] = doc_id
+        self.url = f"{database.url}{self.id}"
+
+    # Returns a string description
+    def __str__(self):
+        dict_json = {}
+        dict_json["_id"] = self.id
+        dict_json["database"] = self.database.name
+        dict_json["content"] = self.content
+        dict_json["revision"] = self.revision
+        dict_json["url"] = self.url
+        dict_json["exists"] = self.exists
+        return json.dumps(dict_json, indent=4)
+
+    # Fetches content and revision from the server
+    async def load(self):
+        resp = await f.endpoint_api(self, endpoint='')
+        if "_id" in resp.keys():
+            self.exists = True
+            self.revision = resp['_rev']
+            self.content = resp
+        else:
+            self.exists = False
+        return resp
+
+    # Checks and updates existence of a document
+    async def is_there(self):
+        await self.load()
+        return self.exists
+
+    # Creates a non-existent document
+    async def create(self):
+        logger = logging.getLogger('AsyncDocument::create')
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json"
+        }
+        response = await f.endpoint_api(self, endpoint='', headers=headers, json_data=self.content, method='PUT')
+        if "rev" in response.keys():
+            self.revision = response["rev"]
+            self.content['_rev'] = self.revision
+            self.exists = True
+        elif response.get("error") == "conflict":
+            logger.warning('Document exists already, no need to create it')
+        return response
+
+    # Set the revision of the document
+    async def current_revision(self):
+        await self.load()
+        return self.revision
+
+    # Revision currently on the server from a HEAD (the ETag), without touching the content
+    async def _server_revision(self):
+        logger = logging.getLogger('AsyncDocument::_server_revision')
+        try:
+            response = await f.endpoint_response(self, endpoint='', headers={'Accept': 'application/json'}, method='HEAD')
+        except Exception as e:
+            logger.critical(e.__str__())
+            response = None
+        if response is not None and response.status == 200 and response.headers.get("etag"):
+            self.revision = response.headers["etag"].strip('"')
+            self.exists = True
+        else:
+            self.revision = None
+            self.exists = False
+        return self.revision
+
+    # Updates existing document with the revision held, fetching the revision alone when it is unknown
+    # or on a conflict, the content set by the caller is what gets written
+    async def update(self, retries=1):
+        logger = logging.getLogger('AsyncDocument::update')
+        if self.revision is None and await self._server_revision() is None:
+            logger.warning('Document not found')
+            return {"status": "error", "errcode": "400", "errmsg": "Document doesn't exist!"}
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json"
+        }
+        while True:
+            content = dict(self.content)
+            content['_rev'] = self.revision
+            response = await f.endpoint_api(self, endpoint='', headers=headers, json_data=content, method='PUT')
+            if response.get("error") == "conflict" and retries > 0:
+                retries -= 1
+                logger.debug("Revision conflict, fetching the current revision and retrying")
+                if await self._server_revision() is None:
+                    logger.warning('Document not found')
+                    return {"status": "error", "errcode": "400", "errmsg": "Document doesn't exist!"}
+                continue
+            break
+        if "rev" in response.keys():
+            self.revision = response["rev"]
+            self.content['_rev'] = self.revision
+            self.exists = True
+        return response
+
+    # Deletes existing document
+    async def delete(self):
+        if self.revision is None:
+            await self._server_revision()
+        headers = {
+            'Accept': 'application/json',
+            'If-Match': self.revision or ''
+        }
+        response = await f.endpoint_api(self, endpoint='', headers=headers, method='DELETE')
+        if response.get("ok"):
+            self.revision = response["rev"]
+            self.exists = False
+        return response
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import ssl
+from urllib.parse import urlsplit
+from .Pool import PoolResponse
+try:
+    import aiohttp
+    aiohttp_module = True
+except ModuleNotFoundError as err:
+    aiohttp_module = False
+
+
+# Async Connection Pool Class - Keep-alive connections shared by everything hanging from an AsyncServer
+class AsyncConnectionPool(object):
+    # Initialization
+    # size: connections in flight across all hosts
+    # per_host: connections allowed at the same time against a single host
+    def __init__(self, size=100, per_host=100, timeout=None):
+        self.size = size
+        self.per_host = per_host
+        self.timeout = timeout
+        self.session = None
+        self._idle = {}
+        self._host_slots = {}
+        self._slots = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    # Binds the pool to the running loop
+    async def open(self):
+        logger = logging.getLogger('AsyncConnectionPool::open')
+        if aiohttp_module:
+            if self.session is None or self.session.closed:
+                logger.debug(f"Opening aiohttp session with {self.size} connections, {self.per_host} per host")
+                connector = aiohttp.TCPConnector(limit=self.size, limit_per_host=self.per_host)
+                self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout), auto_decompress=True)
+        elif self._slots is None:
+            logger.debug(f"Using asyncio streams pool with {self.size} connections, {self.per_host} per host")
+            self._slots = asyncio.Semaphore(self.size)
+
+    # Sends a request through a pooled connection and returns a PoolResponse
+    async def request(self, method, url, headers={}, body=None):
+        await self.open()
+        if aiohttp_module:
+            async with self.session.request(method, url, headers=headers, data=body) as response:
+                payload = await response.read()
+                return PoolResponse(response.status, response.reason, dict(response.headers), payload)
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        if key not in self._host_slots:
+            self._host_slots[key] = asyncio.Semaphore(self.per_host)
+        host_slots = self._host_slots[key]
+        async with self._slots, host_slots:
+            if self.timeout:
+                return await asyncio.wait_for(self._request(key, method, path, headers, body), self.timeout)
+            return await self._request(key, method, path, headers, body)
+
+    # Closes every idle connection
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        idle = self._idle
+        self._idle = {}
+        for conns in idle.values():
+            for reader, writer in conns:
+                writer.close()
+
+    async def _request(self, key, method, path, headers, body):
+        conns = self._idle.get(key)
+        if conns:
+            conn = conns.pop()
+            try:
+                return await self._send(key, conn, method, path, headers, body)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                # Server dropped an idle keep-alive connection, retry once on a fresh one
+                conn[1].close()
+        conn = await self._connect(key)
+        return await self._send(key, conn, method, path, headers, body)
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        context = ssl.create_default_context() if scheme == 'https' else None
+        return await asyncio.open_connection(host, port, ssl=context)
+
+    async def _send(self, key, conn, method, path, headers, body):
+        reader, writer = conn
+        lines = [f"{method} {path} HTTP/1.1"]
+        for name, value in headers.items():
+            lines.append(f"{name}: {value}")
+        if body is not None or method in ('PUT', 'POST'):
+            lines.append(f"Content-Length: {len(body or b'')}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        if body:
+            writer.write(body)
+        await writer.drain()
+        try:
+            status_line = await reader.readuntil(b"\r\n")
+            version, status, reason = (status_line.decode('latin-1').rstrip("\r\n").split(" ", 2) + [""])[:3]
+            response_headers = {}
+            while True:
+                line = await reader.readuntil(b"\r\n")
+                if line == b"\r\n":
+                    break
+                name, _, value = line.decode('latin-1').partition(":")
+                response_headers[name.strip().lower()] = value.strip()
+            keep_alive = version == "HTTP/1.1" and response_headers.get("connection", "").lower() != "close"
+            if method == 'HEAD' or status in ("204", "304"):
+                payload = b""
+            elif response_headers.get("transfer-encoding", "").lower() == "chunked":
+                payload = await self._read_chunked(reader)
+            elif "content-length" in response_headers:
+                payload = await reader.readexactly(int(response_headers["content-length"]))
+            else:
+                payload = await reader.read()
+                keep_alive = False
+        except BaseException:
+            writer.close()
+            raise
+        if keep_alive:
+            self._idle.setdefault(key, []).append(conn)
+        else:
+            writer.close()
+        return PoolResponse(int(status), reason, response_headers, payload)
+
+    async def _read_chunked(self, reader):
+        chunks = []
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            if size == 0:
+                # Trailers, if any, end with an empty line
+                while await reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
@@ -0,0 +1,107 @@
+import logging
+from . import AsyncCore as f
+from .AsyncPool import AsyncConnectionPool
+from .Core import basic_auth_header
+from .Codec import get_codec
+
+
+# Async Server Class - asyncio mirror of Server, sharing the same endpoints
+class AsyncServer(object):
+    # Initialization, no network I/O happens until connect() or "async with"
+    def __init__(self, hostname, port=5984, admin_port=5986, username="", password="", compatibility=False, pool_size=100, pool_per_host=100, timeout=None, instrumentation=None, codec=None, transport=None):
+        self.hostname = hostname
+        self.admin_port = admin_port
+        self.port = str(port)
+        self.username = username
+        self.password = password
+        self.couchdb_host = f"{self.hostname}:{self.port}"
+        self.admin_host = f"{self.hostname}:{self.admin_port}"
+        self.url = f'http://{self.couchdb_host}/'
+        self.admin_url = f'http://{self.admin_host}/'
+        self.compatible = compatibility
+        self.auth_header = basic_auth_header(username, password)
+        self.codec = get_codec(codec)
+        # transport: replaces the pool, e.g. an AsyncEmulatorTransport
+        self.pool = transport if transport is not None else AsyncConnectionPool(size=pool_size, per_host=pool_per_host, timeout=timeout)
+        self.instrumentation = instrumentation
+
+    async def __aenter__(self):
+        await self.pool.open()
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    # Reads the server welcome document
+    async def connect(self):
+        logger = logging.getLogger('AsyncServer::connect')
+        response = await self.endpoint(endpoint="")
+        if "error" not in response.keys():
+            if "version" in response.keys():
+                self.version = response['version']
+            if "features" in response.keys():
+                self.features = response['features']
+            if "vendor" in response.keys():
+                self.vendor = response['vendor']['name']
+            if "all_nodes" in response.keys():
+                self.all_nodes = (await self.membership())['all_nodes']
+            if "version" in dir(self):
+                logger.info(f'Connected to CouchDB v{self.version} instance on {self.hostname}')
+            else:
+                logger.info(f'Connected to CouchDB instance on {self.hostname}')
+        else:
+            logger.info(f'Error connecting to CouchDB: {response}')
+        return response
+
+    # Close pooled connections
+    async def close(self):
+        await self.pool.close()
+
+    # API Endpoint Interaction
+    async def endpoint(self, endpoint, headers={}, data=None, json_data=None, method='GET', admin=False):
+        return await f.endpoint_api(self, endpoint=endpoint, headers=headers, data=data, json_data=json_data, method=method, admin=admin, compatibility=self.compatible)
+
+    # Active tasks
+    async def active_tasks(self):
+        return await self.endpoint(endpoint='_active_tasks')
+
+    # All DBs
+    async def all_dbs(self):
+        headers = {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+        return await self.endpoint(endpoint='_all_dbs', headers=headers)
+
+    # DBs Info
+    async def dbs_info(self, dbs_list=None):
+        if dbs_list is None:
+            dbs = await self.all_dbs()
+        elif type(dbs_list) is str:
+            dbs = dbs_list.split(',')
+            if len(dbs) == 1:
+                dbs = dbs_list.split(' ')
+        else:
+            dbs = dbs_list
+        headers = {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+        return await self.endpoint(endpoint='_dbs_info', headers=headers, json_data={'keys': dbs}, method='POST')
+
+    # DB Updates
+    async def db_updates(self):
+        return await self.endpoint(endpoint='_db_updates')
+
+    # Cluster Membership
+    async def membership(self):
+        return await self.endpoint(endpoint='_membership')
+
+    # Up
+    async def up(self):
+        return await self.endpoint(endpoint='_up')
+
+    # UUIDs
+    async def uuids(self, count=1):
+        return await self.endpoint(endpoint=f'_uuids?count={count}')
@@ -0,0 +1,90 @@
+import base64
+import hashlib
+import io
+import os
+import stat
+
+
+# Raised by streamed attachment reads, which have no response dict to hand back
+class AttachmentError(Exception):
+    def __init__(self, status, error, reason=""):
+        Exception.__init__(self, f"{status} {error}: {reason}")
+        self.status = status
+        self.error = error
+        self.reason = reason
+
+
+# Raised once a downloaded attachment does not match the digest CouchDB keeps for it
+class DigestMismatchError(AttachmentError):
+    def __init__(self, expected, actual):
+        AttachmentError.__init__(self, None, "digest_mismatch", f"expected md5-{expected}, got md5-{actual}")
+        self.expected = expected
+        self.actual = actual
+
+
+# Upload body for an attachment source, returns (body, length, opened)
+#   bytes, bytearray, memoryview: sent as is
+#   str or os.PathLike: path of a file opened here (opened is True, the caller closes it)
+#   file objects and mmap: read from their current position, length known when they can seek
+#   other iterables of bytes: chunked transfer, length None
+# Real files with a known length go out with sendfile on the http.client pool, never read into Python
+def attachment_body(source, length=None):
+    if type(source) in (bytes, bytearray):
+        return source, len(source), False
+    if type(source) is memoryview:
+        return source, source.nbytes, False
+    if isinstance(source, (str, os.PathLike)):
+        source = open(source, "rb")
+        return source, length if length is not None else os.fstat(source.fileno()).st_size, True
+    if hasattr(source, "read"):
+        if length is None:
+            length = remaining_length(source)
+        return source, length, False
+    return (bytes(chunk) if type(chunk) is not bytes else chunk for chunk in source), length, False
+
+
+# Bytes left to read in a file object or mmap, None when it cannot tell
+def remaining_length(source):
+    try:
+        position = source.tell()
+    except (OSError, ValueError, AttributeError, io.UnsupportedOperation):
+        return None
+    try:
+        if hasattr(source, "fileno"):
+            status = os.fstat(source.fileno())
+            if stat.S_ISREG(status.st_mode):
+                return status.st_size - position
+    except (OSError, ValueError, io.UnsupportedOperation):
+        pass
+    # mmap, whose len() is the mapped size
+    if hasattr(source, "madvise"):
+        return len(source) - position
+    try:
+        end = source.seek(0, io.SEEK_END)
+        source.seek(position)
+        return end - position
+    except (OSError, ValueError, io.UnsupportedOperation):
+        return None
+
+
+# Digest Check Class - md5 of the bytes going through, compared with the base64 md5 CouchDB keeps
+class DigestCheck(object):
+    def __init__(self, expected=None):
+        if expected is not None and expected.startswith("md5-"):
+            expected = expected[4:]
+        self.expected = expected
+        self.md5 = hashlib.md5()
+        self.length = 0
+
+    def update(self, chunk):
+        self.md5.update(chunk)
+        self.length += len(chunk)
+
+    @property
+    def digest(self):
+        return base64.b64encode(self.md5.digest()).decode()
+
+    def verify(self):
+        if self.expected is not None and self.expected != self.digest:
+            raise DigestMismatchError(self.expected, self.digest)
+        return self.expected is not None
@@ -0,0 +1,112 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from . import Core as f
+
+
+# Bulk Loader Class - feeds any iterable of docs to _bulk_docs in bounded batches
+# batch_size / max_bytes: a batch is sent when either bound is reached
+# concurrency: batches in flight at once, also the most batches held in memory
+# retry_conflicts: resend conflicting docs once with the current server revision (overwriting it)
+class BulkLoader(object):
+    def __init__(self, database, batch_size=1000, max_bytes=4194304, concurrency=4, retry_conflicts=False):
+        self.database = database
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.concurrency = concurrency
+        self.retry_conflicts = retry_conflicts
+
+    # Loads every doc, returns the aggregated per-document report
+    def load(self, docs):
+        logger = logging.getLogger('BulkLoader::load')
+        report = {
+            "ok": 0,
+            "conflict": 0,
+            "error": 0,
+            "batches": 0,
+            "conflicts": [],
+            "errors": []
+        }
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = set()
+            for batch in self._batches(docs):
+                if len(pending) >= self.concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._merge(report, future.result())
+                pending.add(executor.submit(self._send_batch, batch))
+            for future in pending:
+                self._merge(report, future.result())
+        logger.info(f"Loaded {report['ok']} docs in {report['batches']} batches, {report['conflict']} conflicts, {report['error']} errors")
+        return report
+
+    # Groups docs into batches of (doc, encoded doc), encoding each doc once
+    def _batches(self, docs):
+        dumps = self.database.server.codec.dumps
+        batch = []
+        size = 0
+        for doc in docs:
+            encoded = dumps(doc)
+            if batch and (len(batch) >= self.batch_size or size + len(encoded) > self.max_bytes):
+                yield batch
+                batch = []
+                size = 0
+            batch.append((doc, encoded))
+            size += len(encoded) + 1
+        if batch:
+            yield batch
+
+    def _post(self, batch):
+        headers = {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+        }
+        body = b'{"docs":[' + b','.join(encoded for doc, encoded in batch) + b']}'
+        return f.endpoint_api(self.database, endpoint='_bulk_docs', headers=headers, data=body, method='POST')
+
+    def _send_batch(self, batch):
+        response = self._post(batch)
+        if type(response) is not list:
+            # The whole request failed, every doc in it is an error
+            return [{"id": doc.get("_id"), "error": "request_failed", "reason": response} for doc, encoded in batch]
+        if self.retry_conflicts:
+            conflicted = [index for index, row in enumerate(response) if row.get("error") == "conflict"]
+            if conflicted:
+                response = self._retry(batch, response, conflicted)
+        cache = self.database.document_cache()
+        if cache is not None:
+            for row in response:
+                if "id" in row.keys():
+                    cache.discard(f"{self.database.url}{row['id']}")
+        return response
+
+    # Resends conflicting docs with the revision currently on the server
+    def _retry(self, batch, response, conflicted):
+        ids = [response[index]["id"] for index in conflicted]
+        current = f.endpoint_api(self.database, endpoint='_all_docs', json_data={"keys": ids}, method='POST')
+        revisions = {}
+        for row in current.get("rows", []):
+            if "value" in row.keys():
+                revisions[row["key"]] = row["value"]["rev"]
+        retry = []
+        for index in conflicted:
+            doc = dict(batch[index][0])
+            if doc.get("_id") in revisions:
+                doc["_rev"] = revisions[doc["_id"]]
+            retry.append((doc, self.database.server.codec.dumps(doc)))
+        retried = self._post(retry)
+        if type(retried) is list:
+            for index, row in zip(conflicted, retried):
+                response[index] = row
+        return response
+
+    def _merge(self, report, results):
+        report["batches"] += 1
+        for row in results:
+            if row.get("ok") or ("rev" in row.keys() and "error" not in row.keys()):
+                report["ok"] += 1
+            elif row.get("error") == "conflict":
+                report["conflict"] += 1
+                report["conflicts"].append(row)
+            else:
+                report["error"] += 1
+                report["errors"].append(row)
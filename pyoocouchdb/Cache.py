@@ -0,0 +1,88 @@
+import collections
+import threading
+import time
+
+
+# Document Cache Class - LRU cache of document bodies keyed by document URL
+# max_entries / max_bytes: least recently used entries are evicted past either bound
+# ttl: seconds an entry may live, None keeps it until evicted or invalidated
+# revalidate: True sends If-None-Match: "<rev>" on every read (a 304 costs no body),
+#             False serves entries straight from memory until ttl or a write through pyoocouchdb
+class DocumentCache(object):
+    def __init__(self, max_entries=10000, max_bytes=67108864, ttl=None, revalidate=True):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.revalidate = revalidate
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # (revision, body) for a key, None when missing or expired
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            revision, body, stored = entry
+            if self.ttl is not None and time.monotonic() - stored > self.ttl:
+                self._remove(key)
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return revision, body
+
+    def put(self, key, revision, body):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if len(body) > self.max_bytes:
+                return
+            self._entries[key] = (revision, body, time.monotonic())
+            self.bytes += len(body)
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def hit(self, revalidated=False):
+        with self._lock:
+            self.hits += 1
+            if revalidated:
+                self.revalidations += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    # Drops a key, called on every write made through pyoocouchdb
+    def discard(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    # Counters for monitoring
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.bytes
+        }
+
+    def _remove(self, key):
+        revision, body, stored = self._entries.pop(key)
+        self.bytes -= len(body)
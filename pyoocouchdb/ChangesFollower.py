@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import threading
+from . import Core as f
+
+
+# File Checkpoint Class - keeps the last processed seq in a local file
+class FileCheckpoint(object):
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as checkpoint_file:
+            return json.load(checkpoint_file).get("since")
+
+    def save(self, since):
+        # Write and rename, a crash never leaves a half written checkpoint
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as checkpoint_file:
+            json.dump({"since": since}, checkpoint_file)
+        os.replace(temporary, self.path)
+
+
+# Local Document Checkpoint Class - keeps the last processed seq in a _local doc (not replicated)
+class LocalDocCheckpoint(object):
+    def __init__(self, database, name):
+        self.database = database
+        self.endpoint = f"_local/{name}"
+        self.revision = None
+
+    def load(self):
+        response = f.endpoint_api(self.database, endpoint=self.endpoint)
+        if "_rev" in response.keys():
+            self.revision = response["_rev"]
+            return response.get("since")
+        return None
+
+    def save(self, since):
+        content = {"since": since}
+        if self.revision:
+            content["_rev"] = self.revision
+        response = f.endpoint_api(self.database, endpoint=self.endpoint, json_data=content, method="PUT")
+        if response.get("error") == "conflict":
+            self.load()
+            content["_rev"] = self.revision
+            response = f.endpoint_api(self.database, endpoint=self.endpoint, json_data=content, method="PUT")
+        if "rev" in response.keys():
+            self.revision = response["rev"]
+        return response
+
+
+# Changes Follower Class - follows _changes and hands out changes in batches
+# feed: continuous (one long response, heartbeats keep it open) or longpoll (one request per batch)
+# since: where to start when the checkpoint holds nothing, "now" skips history
+# checkpoint: object with load() and save(since), saved once a batch has been handled
+# batch_size: most changes per batch, a heartbeat flushes a partial batch
+class ChangesFollower(object):
+    def __init__(self, database, feed="continuous", since=None, heartbeat=10000, timeout=None, include_docs=False, filter=None, selector=None, doc_ids=None, batch_size=100, checkpoint=None, retry_delay=1, max_retry_delay=60):
+        self.database = database
+        self.feed = feed
+        self.heartbeat = heartbeat
+        self.timeout = timeout
+        self.include_docs = include_docs
+        self.filter = filter
+        self.selector = selector
+        self.doc_ids = doc_ids
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.since = since
+        if checkpoint is not None:
+            saved = checkpoint.load()
+            if saved is not None:
+                self.since = saved
+        self._stopped = threading.Event()
+        self._stream = None
+
+    # Yields lists of changes, the checkpoint moves once the consumer asks for the next batch
+    def __iter__(self):
+        logger = logging.getLogger('ChangesFollower::__iter__')
+        delay = self.retry_delay
+        self._stopped.clear()
+        while not self._stopped.is_set():
+            try:
+                if self.feed == "longpoll":
+                    batches = self._longpoll()
+                else:
+                    batches = self._continuous()
+                for batch, since in batches:
+                    delay = self.retry_delay
+                    yield batch
+                    self.since = since
+                    self.commit()
+                    if self._stopped.is_set():
+                        return
+            except Exception as e:
+                if self._stopped.is_set():
+                    return
+                logger.error(f"Change feed interrupted, retrying in {delay}s: {e}")
+                self._stopped.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    # Calls handler with every batch until stop()
+    def follow(self, handler):
+        for batch in self:
+            handler(batch)
+
+    # Stops following, safe to call from another thread
+    def stop(self):
+        self._stopped.set()
+        if self._stream is not None:
+            self._stream.close()
+
+    # Saves the current position
+    def commit(self):
+        if self.checkpoint is not None and self.since is not None:
+            self.checkpoint.save(self.since)
+
+    def _query(self, feed, limit=None):
+        return self.database._changes_query(since=self.since, feed=feed, limit=limit, include_docs=self.include_docs, filter=self.filter, selector=self.selector, doc_ids=self.doc_ids, heartbeat=self.heartbeat if feed == "continuous" else None, timeout=self.timeout)
+
+    def _longpoll(self):
+        while not self._stopped.is_set():
+            endpoint, json_data, method = self._query("longpoll", limit=self.batch_size)
+            response = f.endpoint_api(self.database, endpoint=endpoint, json_data=json_data, method=method)
+            if "last_seq" not in response.keys():
+                raise ValueError(f"Unexpected _changes response: {response}")
+            if response["results"]:
+                yield response["results"], response["last_seq"]
+            else:
+                self.since = response["last_seq"]
+
+    def _continuous(self):
+        endpoint, json_data, method = self._query("continuous")
+        self._stream = f.endpoint_stream(self.database, endpoint=endpoint, json_data=json_data, method=method)
+        stream = self._stream
+        try:
+            if stream.status >= 400:
+                raise ValueError(f"Unexpected _changes response: {stream.read().decode(errors='replace')}")
+            batch = []
+            buffer = b""
+            for chunk in stream.iter_content():
+                buffer += chunk
+                lines = buffer.split(b"\n")
+                buffer = lines.pop()
+                for line in lines:
+                    line = line.strip()
+                    if not line:
+                        # Heartbeat, the feed is idle so hand out what we have
+                        if batch:
+                            yield batch, batch[-1]["seq"]
+                            batch = []
+                        continue
+                    change = self.database.server.codec.loads(line)
+                    if "last_seq" in change.keys():
+                        # Server side timeout, reconnect from where it ended
+                        if batch:
+                            yield batch, batch[-1]["seq"]
+                            batch = []
+                        self.since = change["last_seq"]
+                        return
+                    batch.append(change)
+                    if len(batch) >= self.batch_size:
+                        yield batch, batch[-1]["seq"]
+                        batch = []
+            if batch:
+                yield batch, batch[-1]["seq"]
+            raise ConnectionError("Change feed closed by the server")
+        finally:
+            stream.close()
+            self._stream = None
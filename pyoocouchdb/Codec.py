@@ -0,0 +1,75 @@
+import json
+try:
+    import orjson
+    orjson_module = True
+except ModuleNotFoundError as err:
+    orjson_module = False
+try:
+    import ujson
+    ujson_module = True
+except ModuleNotFoundError as err:
+    ujson_module = False
+
+
+# JSON Codec Class - standard library json, compact output, always available
+# Every codec turns an object into bytes (dumps) and bytes or str back into an object (loads)
+class JSONCodec(object):
+    name = "json"
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+# orjson Codec Class - encodes straight to bytes, the fastest of the three
+class OrjsonCodec(object):
+    name = "orjson"
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+# ujson Codec Class
+class UjsonCodec(object):
+    name = "ujson"
+
+    def dumps(self, obj):
+        return ujson.dumps(obj, ensure_ascii=False).encode()
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+# Codec for a Server setting:
+# None or "json": standard library, "orjson" / "ujson": that module (ImportError when missing),
+# "fastest": orjson, then ujson, then json, whichever is installed,
+# any object with dumps(obj) -> bytes and loads(bytes) -> obj is used as is
+def get_codec(codec=None):
+    if codec is None or codec == "json":
+        return JSONCodec()
+    if codec == "fastest":
+        if orjson_module:
+            return OrjsonCodec()
+        if ujson_module:
+            return UjsonCodec()
+        return JSONCodec()
+    if codec == "orjson":
+        if not orjson_module:
+            raise ImportError("Codec 'orjson' asked for but module 'orjson' is not installed")
+        return OrjsonCodec()
+    if codec == "ujson":
+        if not ujson_module:
+            raise ImportError("Codec 'ujson' asked for but module 'ujson' is not installed")
+        return UjsonCodec()
+    if hasattr(codec, "dumps") and hasattr(codec, "loads"):
+        return codec
+    raise ValueError(f"Unknown JSON codec: {codec}")
+
+
+# Shared default for objects without a Server codec
+DEFAULT_CODEC = JSONCodec()
@@ -1,200 +1,189 @@
-########
-#
-# Filename: couchdblib.py
-# Author: Jesus Alejandro Sanchez Davila
-# Name: couchdblib
-#
-# Description: Library for CouchDB v2.x.x
-#
-##########
-
-# Imports
-import http.client
-from inspect import currentframe, getframeinfo
-import json
-import logging
-from urllib3 import make_headers
-import uuid
-from .Database import Database
-from .Document import Document
-from .Node import Node
-from .Server import Server
-try:
-    import requests
-    requests_module = True
-except ModuleNotFoundError as err:
-    print("WARNING::Import Section: Module 'requests' not found, falling back to 'http.client'")
-    requests_module = False
-
-
-def get_linenumber():
-    cf = currentframe()
-    return cf.f_back.f_lineno
-
-# API Endpoint Interaction
-def endpoint_api(object, endpoint, headers={}, data={}, json_data={}, method='GET', admin=False, compatibility=False):
-    logger = logging.getLogger('endpoint_api')
-    endpoint_url = f"{object.url}{endpoint}"
-    logger.debug(f"[{get_linenumber()}] Endpoint URL: {endpoint_url}")
-    logger.debug(f"[{get_linenumber()}] Method: {method}")
-    logger.debug(f"[{get_linenumber()}] Headers: {headers}")
-    if len(headers.keys()) == 0:
-        logger.debug(f"[{get_linenumber()}] Empty header detected, using default")
-        default_header = True
-    else:
-        default_header = False
-        logger.debug(f"[{get_linenumber()}] Headers: {json.dumps(headers, indent=2)}")
-    if data is None:
-        logger.debug(f"[{get_linenumber()}] Empty data detected")
-    else:
-        logger.debug(f"[{get_linenumber()}] Data: {data}")
-    if json_data is None:
-        logger.debug(f"[{get_linenumber()}] Empty json detected")
-    else:
-        logger.debug(f"[{get_linenumber()}] Data: {json.dumps(json_data, indent=2)}")
-
-    # Set credentials
-    if type(object) is Server:
-        creds = (object.username,object.password)
-    elif type(object) is Database:
-        creds = (object.server.username,object.server.password)
-    elif type(object) is Node:
-        creds = (object.server.username,object.server.password)
-    elif type(object) is Document:
-        creds = (object.database.server.username,object.database.server.password)
-    logger.debug(f"[{get_linenumber()}] Checking which module to use")
-    if requests_module: ## When the requests module is found
-        try:
-            if admin:
-                logger.debug(f"[{get_linenumber()}] Using admin mode")
-                if type(object) is Server:
-                    headers["Host"] = object.admin_host
-                    headers["Referer"] = f"http://{object.admin_host}"
-                    headers["Referer"] = object.admin_url
-                elif type(object) is Database:
-                    headers["Host"] = object.server.admin_host
-                    headers["Referer"] = f"http://{object.server.admin_host}"
-                    headers["Referer"] = object.server.admin_url
-                elif type(object) is Document:
-                    headers["Host"] = object.database.server.admin_host
-                    headers["Referer"] = f"http://{object.database.server.admin_host}"
-                    headers["Referer"] = object.database.server.admin_url
-            else:
-                if type(object) is Server:
-                    headers["Host"] = object.couchdb_host
-                    headers["Referer"] = f"http://{object.couchdb_host}"
-                    headers["Referer"] = object.url
-                elif type(object) is Database:
-                    headers["Host"] = object.server.couchdb_host
-                    headers["Referer"] = f"http://{object.server.couchdb_host}"
-                    headers["Referer"] = object.server.url
-                elif type(object) is Document:
-                    headers["Host"] = object.database.server.couchdb_host
-                    headers["Referer"] = f"http://{object.database.server.couchdb_host}"
-                    # headers["Referer"] = object.database.server.url
-            if default_header:
-                headers["accept"] = "application/json"
-            logger.debug(f"[{get_linenumber()}] Final header:\n{headers}")
-            if method.upper() == 'GET':
-                response = requests.get(url=endpoint_url, headers=headers, auth=creds, json=json_data, data=data)
-            elif method.upper() == 'PUT':
-                response = requests.put(url=endpoint_url, headers=headers, auth=creds, json=json_data, data=data)
-            elif method.upper() == 'POST':
-                response = requests.post(url=endpoint_url, headers=headers, auth=creds, json=json_data, data=data)
-            elif method.upper() == 'DELETE':
-                response = requests.delete(url=endpoint_url, headers=headers, auth=creds, json=json_data, data=data)
-            else:
-                response = requests.request(method=method.upper(), url=endpoint_url, headers=headers, auth=creds, json=json_data, data=data)
-        except requests.HTTPError as he:
-            logger.warning('HTTPError while trying the connection')
-            logger.debug(he)
-            response = {
-                'status': 'error',
-                'headers': {}
-            }
-        except Exception as e:
-            logger.critical(e.__str__())
-            response = {
-                'status': 'error',
-                'fullerror': e.__str__()
-            }
-        finally:            
-            if requests_module:
-                logger.debug(f"Crude response >>> \n{response}")  
-                if "json" in dir(response):
-                    return response.json()
-                else:
-                    return response.raw.read().decode()
-            else:
-                return response
-    else: ## Falback to http.client module
-        # Split Endpoint URL into base + path
-        host_end = endpoint_url.find("/",7)
-        url_base = endpoint_url[:host_end].split("/")[2]
-        url_path = endpoint_url[host_end:]
-        logger.debug(f"[{get_linenumber()}] URL Base: {url_base}\nURL Path: {url_path}")
-        try:
-            logger.debug(f"[{get_linenumber()}] Preparing request using http.client")
-            http_conn = http.client.HTTPConnection(host=url_base)
-            # http_conn.set_debuglevel(100)
-            headers_auth = make_headers(basic_auth=f"{creds[0]}:{creds[1]}")
-            if admin:
-                logger.debug(f"[{get_linenumber()}] Using admin mode")
-                if type(object) is Server:
-                    headers["Host"]=object.admin_host
-                    headers["Referer"]=f"http://{object.admin_host}"                    
-                elif type(object) is Database:
-                    headers["Host"]=object.server.admin_host
-                    headers["Referer"]=f"http://{object.server.admin_host}"                    
-                elif type(object) is Document:
-                    headers["Host"]=object.database.server.admin_host
-                    headers["Referer"]=f"http://{object.database.server.admin_host}"                    
-            else:
-                if type(object) is Server:
-                    headers["Host"]=object.couchdb_host
-                    headers["Referer"]=f"http://{object.couchdb_host}"                    
-                elif type(object) is Database:
-                    headers["Host"]=object.server.couchdb_host
-                    headers["Referer"]=f"http://{object.server.couchdb_host}"                    
-                elif type(object) is Document:
-                    headers["Host"]=object.database.server.couchdb_host
-                    headers["Referer"]=f"http://{object.database.server.couchdb_host}"                    
-            if default_header:
-                headers["accept"] = "application/json"
-            headers["authorization"] = headers_auth["authorization"]
-            logger.debug(f"[{get_linenumber()}] Final header:\n{headers}")
-            logger.debug(f"[{get_linenumber()}] Connection attempt: {http_conn.connect()}")
-            if data:
-                http_conn.request(method=method.upper(), url=url_path, body=data, headers=headers)    
-            elif json_data:
-                http_conn.request(method=method.upper(), url=url_path, body=bytes(json.dumps(json_data), 'utf-8'), headers=headers)
-            else:
-                http_conn.request(method=method.upper(), url=url_path, headers=headers)
-            response = json.loads(http_conn.getresponse().read().decode())
-        except http.client.HTTPException as he:
-            logger.error('HTTPException while trying the connection')
-            response = {
-                "status": f"{response.status}",
-                "reason": f"{response.reason}",
-                "content": str(he)
-            }
-        except Exception as e:
-            logger.critical(e.__str__())
-            response = {
-                'status': 'error',
-                'fullerror': e.__str__()
-            }
-        finally:
-            logger.debug(response)
-            if requests_module:
-                if response.json():
-                    return response.json()
-                else:
-                    return response.raw.read().decode()
-            else:
-                return response
-
-
-
-
-
+########
+#
+# Filename: couchdblib.py
+# Author: Jesus Alejandro Sanchez Davila
+# Name: couchdblib
+#
+# Description: Library for CouchDB v2.x.x
+#
+##########
+
+# Imports
+import base64
+import http.client
+import json
+import logging
+from .Pool import requests_module, PoolStream
+from .Codec import DEFAULT_CODEC
+if not requests_module:
+    print("WARNING::Import Section: Module 'requests' not found, falling back to 'http.client'")
+
+
+# Walks the object links up to the Server that owns the connection pool
+def get_server(object):
+    if hasattr(object, "database"):
+        return object.database.server
+    elif hasattr(object, "server"):
+        return object.server
+    return object
+
+# Basic auth header, built once per Server instead of once per request
+def basic_auth_header(username, password):
+    if not username:
+        return None
+    token = base64.b64encode(f"{username}:{password}".encode()).decode()
+    return f"Basic {token}"
+
+# Request body as bytes, JSON-encoding dicts and lists once with the server codec, bytes pass through untouched
+def encode_body(data=None, json_data=None, method='GET', codec=DEFAULT_CODEC):
+    if data:
+        if type(data) in (dict, list):
+            return codec.dumps(data)
+        elif type(data) is str:
+            return data.encode()
+        return data
+    elif json_data or (json_data is not None and method in ('PUT', 'POST')):
+        return codec.dumps(json_data)
+    return None
+
+# Request headers for a server, copied so the caller's dict (or a shared default) is never mutated
+def build_headers(server, headers, admin=False, default_header=False):
+    headers = dict(headers)
+    if admin:
+        headers["Host"] = server.admin_host
+        headers["Referer"] = server.admin_url
+    else:
+        headers["Host"] = server.couchdb_host
+        headers["Referer"] = server.url
+    if default_header:
+        headers["accept"] = "application/json"
+    if server.auth_header:
+        headers["Authorization"] = server.auth_header
+    return headers
+
+# JSON payload of a pooled response, or its text when it isn't JSON
+def decode_response(response, codec=DEFAULT_CODEC):
+    try:
+        return codec.loads(response.body)
+    except ValueError:
+        return response.text()
+
+# Payload logging limits, applied only when a record is actually emitted
+# PAYLOAD_LOG_LIMIT: characters kept of a logged payload (None keeps everything)
+# REDACTED_KEYS: keys whose values are masked at any depth (compared lower-cased)
+PAYLOAD_LOG_LIMIT = 1024
+REDACTED_KEYS = {"password", "authorization", "cookie", "set-cookie", "password_sha", "derived_key", "salt"}
+
+def configure_payload_logging(limit=1024, redact=None):
+    global PAYLOAD_LOG_LIMIT, REDACTED_KEYS
+    PAYLOAD_LOG_LIMIT = limit
+    if redact is not None:
+        REDACTED_KEYS = {key.lower() for key in redact}
+
+def redact(payload):
+    if type(payload) is dict:
+        return {key: "***" if str(key).lower() in REDACTED_KEYS else redact(value) for key, value in payload.items()}
+    elif type(payload) is list:
+        return [redact(item) for item in payload]
+    return payload
+
+# Lazily rendered payload for %s logging arguments, costs nothing while the level is disabled
+class Payload(object):
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self):
+        payload = self.payload
+        if type(payload) in (bytes, bytearray):
+            text = payload[:PAYLOAD_LOG_LIMIT].decode(errors='replace') if PAYLOAD_LOG_LIMIT is not None else payload.decode(errors='replace')
+        elif type(payload) in (dict, list):
+            text = json.dumps(redact(payload), default=str)
+        else:
+            text = str(payload)
+        if PAYLOAD_LOG_LIMIT is not None and len(text) > PAYLOAD_LOG_LIMIT:
+            text = f"{text[:PAYLOAD_LOG_LIMIT]}... ({len(text)} chars)"
+        return text
+
+# API Endpoint Interaction
+# raw: hand back the response body bytes undecoded, for pass-through uses like proxies and dumps
+def endpoint_api(object, endpoint, headers={}, data={}, json_data={}, method='GET', admin=False, compatibility=False, raw=False):
+    logger = logging.getLogger('endpoint_api')
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s %s%s", method, object.url, endpoint)
+        logger.debug("Headers: %s", Payload(headers))
+        if data:
+            logger.debug("Data: %s", Payload(data))
+        if json_data:
+            logger.debug("JSON: %s", Payload(json_data))
+
+    try:
+        response = endpoint_response(object, endpoint, headers=headers, data=data, json_data=json_data, method=method, admin=admin)
+        logger.debug("Crude response >>> %s %s", response.status, response.reason)
+        if raw:
+            return response.body
+        return decode_response(response, get_server(object).codec)
+    except http.client.HTTPException as he:
+        logger.error('HTTPException while trying the connection')
+        logger.debug(he)
+        return {
+            'status': 'error',
+            'headers': {},
+            'content': str(he)
+        }
+    except Exception as e:
+        logger.critical(e.__str__())
+        return {
+            'status': 'error',
+            'fullerror': e.__str__()
+        }
+
+# Sends a request and returns the PoolResponse itself (status, headers, body), errors are raised
+def endpoint_response(object, endpoint, headers={}, data={}, json_data={}, method='GET', admin=False):
+    logger = logging.getLogger('endpoint_response')
+    endpoint_url = f"{object.url}{endpoint}"
+    # Every object shares the pool and credentials of its Server
+    server = get_server(object)
+    headers = build_headers(server, headers, admin=admin, default_header=len(headers.keys()) == 0)
+    body = encode_body(data=data, json_data=json_data, method=method.upper(), codec=server.codec)
+    if body is not None and "Content-Type" not in headers:
+        headers["Content-Type"] = "application/json"
+    logger.debug("Final header: %s", Payload(headers))
+    instrumentation = getattr(server, "instrumentation", None)
+    if instrumentation is None:
+        return server.pool.request(method=method.upper(), url=endpoint_url, headers=headers, body=body)
+    info = instrumentation.before(method.upper(), endpoint_url, server.url, body)
+    try:
+        response = server.pool.request(method=method.upper(), url=endpoint_url, headers=headers, body=body)
+    except Exception as e:
+        instrumentation.after(info, error=e)
+        raise
+    instrumentation.after(info, status=response.status, bytes_received=len(response.body))
+    return response
+
+# Streamed API Endpoint Interaction, returns a PoolStream to be read incrementally
+def endpoint_stream(object, endpoint, headers={}, data={}, json_data={}, method='GET', admin=False, chunk_size=65536):
+    logger = logging.getLogger('endpoint_stream')
+    endpoint_url = f"{object.url}{endpoint}"
+    logger.debug("Endpoint URL: %s", endpoint_url)
+    server = get_server(object)
+    headers = build_headers(server, headers, admin=admin, default_header=len(headers.keys()) == 0)
+    body = encode_body(data=data, json_data=json_data, method=method.upper(), codec=server.codec)
+    if body is not None and "Content-Type" not in headers:
+        headers["Content-Type"] = "application/json"
+    # Streams are timed up to the response headers, their body is read later by the caller
+    instrumentation = getattr(server, "instrumentation", None)
+    info = instrumentation.before(method.upper(), endpoint_url, server.url, body) if instrumentation is not None else None
+    try:
+        stream = server.pool.stream(method=method.upper(), url=endpoint_url, headers=headers, body=body, chunk_size=chunk_size)
+        if info is not None:
+            instrumentation.after(info, status=stream.status)
+        return stream
+    except Exception as e:
+        if info is not None:
+            instrumentation.after(info, error=e)
+        logger.critical(e.__str__())
+        error = {
+            'status': 'error',
+            'fullerror': e.__str__()
+        }
+        return PoolStream(599, 'error', {}, iter([json.dumps(error).encode()]), None)
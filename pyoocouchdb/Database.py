@@ -1,21 +1,52 @@
 import logging
 import http.client
 import json
-import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 from . import Core as f
 from .Document import Document
+from .Stream import RowStream
+from .ChangesFollower import ChangesFollower
+from .BulkLoader import BulkLoader
+from .Query import FindIterator
+from .View import ViewQuery
 
 # Database Class
 class Database(object):
     # Initialization
-    def __init__(self, server, name):
+    # lazy: no network I/O here, existence is fetched on first access
+    # cache: DocumentCache for this database's documents, the server's cache is used when None
+    def __init__(self, server, name, lazy=False, cache=None):
         logger = logging.getLogger('Database::__init__')
         logger.debug('Initializing Database object')
         self.server = server
         self.name = name
         self.url = f"{self.server.url}{name}/"
+        self._exists = None
+        self._loaded = False
+        self.cache = cache
         # if "urlopener" in dir(server):
         #     self.urlopener = server.urlopener
+        if not lazy:
+            self.load()
+
+    # Lazily loaded attributes
+    @property
+    def exists(self):
+        if not self._loaded:
+            self.load()
+        return self._exists
+
+    @exists.setter
+    def exists(self, value):
+        self._exists = value
+        self._loaded = True
+
+    # Looks for the database once
+    def load(self):
+        logger = logging.getLogger('Database::load')
+        if self._loaded:
+            return self
         headers = {
             'Accept': 'application/json',
             'Content-Type': 'application/json',
@@ -23,7 +54,7 @@ class Database(object):
         try:
             logger.debug('Looking for the database')
             resp = f.endpoint_api(self, endpoint='', headers=headers)
-            logger.debug('Response from server: ' + json.dumps(resp, indent=2))
+            logger.debug('Response from server: %s', f.Payload(resp))
         except http.client.HTTPException as he:
             logger.error('HTTPException while trying the connection')
             resp = {
@@ -36,18 +67,37 @@ class Database(object):
                 'content': ue
             }
         logger.debug("Finishing initialization")
-        if 'db_name' in resp.keys():
-            logger.debug("Database found!")
-            self.name = resp['db_name']
-            self.exists = True
+        self.fill(resp)
+        return self
+
+    # Looks for the database again
+    def refresh(self):
+        self._loaded = False
+        return self.load()
+
+    # Fills existence from database info already held, e.g. a _dbs_info row
+    def fill(self, info):
+        if "info" in info.keys():
+            info = info["info"]
+        if 'db_name' in info.keys():
+            logging.getLogger('Database::fill').debug("Database found!")
+            self.name = info['db_name']
+            self._exists = True
         else:
-            logger.debug("Database NOT found!")
-            self.name = name
-            self.exists = False
+            logging.getLogger('Database::fill').debug("Database NOT found!")
+            self._exists = False
+        self._loaded = True
+        return self
 
     def __str__(self):
         return self.url
 
+    # DocumentCache in use for this database, if any
+    def document_cache(self):
+        if self.cache is not None:
+            return self.cache
+        return getattr(self.server, "cache", None)
+
     # Creates a non-existent database
     def create(self):
         logger = logging.getLogger('Database::create')
@@ -82,35 +132,151 @@ class Database(object):
                     self.exists = False
             return response
 
-    def all_docs(self):
-        return f.endpoint_api(self, endpoint="_all_docs")
+    def all_docs(self, include_docs=False, keys=None, descending=False, startkey=None, endkey=None, inclusive_end=True, limit=None):
+        params = self._all_docs_params(include_docs=include_docs, descending=descending, startkey=startkey, endkey=endkey, inclusive_end=inclusive_end, limit=limit)
+        if keys is not None:
+            return f.endpoint_api(self, endpoint=f"_all_docs{params}", json_data={"keys": keys}, method="POST")
+        return f.endpoint_api(self, endpoint=f"_all_docs{params}")
+
+    # Streams _all_docs rows page by page, memory stays bounded by one row
+    # Pages continue from the last key seen (startkey + limit), no skip involved
+    def iter_all_docs(self, page_size=1000, include_docs=False, keys=None, descending=False, startkey=None, endkey=None, inclusive_end=True, limit=None):
+        logger = logging.getLogger('Database::iter_all_docs')
+        yielded = 0
+        if keys is not None:
+            keys = list(keys)
+            for start in range(0, len(keys), page_size):
+                params = self._all_docs_params(include_docs=include_docs)
+                stream = f.endpoint_stream(self, endpoint=f"_all_docs{params}", json_data={"keys": keys[start:start + page_size]}, method="POST")
+                for row in RowStream(stream, key="rows"):
+                    yield row
+                    yielded += 1
+                    if limit is not None and yielded >= limit:
+                        return
+            return
+        next_key = startkey
+        while True:
+            # One extra row tells whether there is another page and where it starts
+            params = self._all_docs_params(include_docs=include_docs, descending=descending, startkey=next_key, endkey=endkey, inclusive_end=inclusive_end, limit=page_size + 1)
+            logger.debug(f"Fetching page starting at {next_key}")
+            stream = f.endpoint_stream(self, endpoint=f"_all_docs{params}")
+            rows = RowStream(stream, key="rows")
+            count = 0
+            next_key = None
+            for row in rows:
+                if count == page_size:
+                    # Last row of the response, reading on hands the connection back to the pool
+                    next_key = row["key"]
+                    continue
+                count += 1
+                yield row
+                yielded += 1
+                if limit is not None and yielded >= limit:
+                    stream.close()
+                    return
+            stream.close()
+            if next_key is None:
+                return
 
-    def delete_all_docs(self):
-        result = self.all_docs()
-        if "rows" in result.keys():
-            for row in result["rows"]:
-                print(row)
-                doc = Document(database = self, doc_id = row["id"])
-                doc.delete()
-        self.purge_all()
+    def _all_docs_params(self, include_docs=False, descending=False, startkey=None, endkey=None, inclusive_end=True, limit=None):
+        params = []
+        if include_docs:
+            params.append("include_docs=true")
+        if descending:
+            params.append("descending=true")
+        if startkey is not None:
+            params.append(f"startkey={quote(json.dumps(startkey))}")
+        if endkey is not None:
+            params.append(f"endkey={quote(json.dumps(endkey))}")
+        if not inclusive_end:
+            params.append("inclusive_end=false")
+        if limit is not None:
+            params.append(f"limit={limit}")
+        return f"?{'&'.join(params)}" if params else ""
+
+    # Deletes every document with _bulk_docs tombstones, one _all_docs page of batch_size * concurrency docs at a time
+    # Each page is read whole before its tombstones are sent, so no connection is held open while writing
+    def delete_all_docs(self, batch_size=1000, concurrency=4, purge=True):
+        logger = logging.getLogger('Database::delete_all_docs')
+        page_size = batch_size * concurrency
+        deleted = {"ok": 0, "conflict": 0, "error": 0, "batches": 0, "conflicts": [], "errors": []}
+        next_key = None
+        while True:
+            # One extra row gives the startkey of the next page
+            page = self.all_docs(startkey=next_key, limit=page_size + 1)
+            if "rows" not in page.keys():
+                logger.error(f"Error listing docs: {page}")
+                deleted["errors"].append(page)
+                break
+            rows = page["rows"]
+            tombstones = [{"_id": row["id"], "_rev": row["value"]["rev"], "_deleted": True} for row in rows[:page_size]]
+            report = self.bulk_create(tombstones, batch_size=batch_size, concurrency=concurrency)
+            for count in ("ok", "conflict", "error", "batches"):
+                deleted[count] += report[count]
+            deleted["conflicts"].extend(report["conflicts"])
+            deleted["errors"].extend(report["errors"])
+            if len(rows) <= page_size:
+                break
+            next_key = rows[page_size]["key"]
+        result = {
+            "deleted": deleted
+        }
+        logger.info(f"Deleted {deleted['ok']} docs")
+        if purge:
+            result["purged"] = self.purge_all()
+        return result
 
     # Returns the change log of the DB
-    def changes(self):
+    def changes(self, since=None, feed=None, limit=None, include_docs=False, descending=False, filter=None, selector=None, doc_ids=None):
         logger = logging.getLogger('Database::changes')
         logger.debug('Building endpoint')
-        return f.endpoint_api(self, endpoint='_changes')
+        endpoint, json_data, method = self._changes_query(since=since, feed=feed, limit=limit, include_docs=include_docs, descending=descending, filter=filter, selector=selector, doc_ids=doc_ids)
+        return f.endpoint_api(self, endpoint=endpoint, json_data=json_data, method=method)
+
+    # Follows the change feed continuously, see ChangesFollower
+    def follow_changes(self, **kwargs):
+        return ChangesFollower(database=self, **kwargs)
+
+    # Endpoint, body and method for a _changes request
+    def _changes_query(self, since=None, feed=None, limit=None, include_docs=False, descending=False, filter=None, selector=None, doc_ids=None, heartbeat=None, timeout=None):
+        params = []
+        json_data = None
+        if feed:
+            params.append(f"feed={feed}")
+        if since is not None:
+            params.append(f"since={quote(str(since))}")
+        if limit is not None:
+            params.append(f"limit={limit}")
+        if include_docs:
+            params.append("include_docs=true")
+        if descending:
+            params.append("descending=true")
+        if heartbeat is not None:
+            params.append(f"heartbeat={heartbeat}")
+        if timeout is not None:
+            params.append(f"timeout={timeout}")
+        if selector is not None:
+            params.append("filter=_selector")
+            json_data = {"selector": selector}
+        elif doc_ids is not None:
+            params.append("filter=_doc_ids")
+            json_data = {"doc_ids": list(doc_ids)}
+        elif filter is not None:
+            params.append(f"filter={quote(filter)}")
+        endpoint = f"_changes?{'&'.join(params)}" if params else "_changes"
+        return endpoint, json_data, "POST" if json_data is not None else "GET"
 
     # Security Data
     def get_security_data(self):
         logger = logging.getLogger("Database::set_security_data")
         resp = self.server.endpoint(endpoint=f"{self.name}/_security", method="GET")
-        logger.debug(json.dumps(resp,indent=2))
+        logger.debug('%s', f.Payload(resp))
         return(resp)
 
     def set_security_data(self, definition):
         logger = logging.getLogger("Database::set_security_data")
         resp = self.server.endpoint(endpoint=f"{self.name}/_security", json_data=definition, method="PUT")
-        logger.info(json.dumps(resp,indent=2))
+        logger.info('%s', f.Payload(resp))
     
     def add_admin_user(self, username):
         logger = logging.getLogger("Database::add_admin_user")
@@ -217,10 +383,72 @@ class Database(object):
             logger.error(f"{role_name} is not part of the members group")
 
     # Find document by ID
-    def find_by_id(self, doc_id):
+    def find_by_id(self, doc_id, lazy=False):
         logger = logging.getLogger('Database::find_by_id')
         logger.debug('Looking for the doc')
-        return Document(self, doc_id=doc_id)
+        return Document(self, doc_id=doc_id, lazy=lazy)
+
+    # Fetch many documents at once, through _bulk_get or _all_docs?include_docs=true on older servers
+    # Returns {"docs": [...], "missing": [...], "deleted": [...]}, docs in the order of ids
+    def get_many(self, ids, as_documents=True, chunk_size=500, concurrency=1):
+        logger = logging.getLogger('Database::get_many')
+        ids = list(ids)
+        chunks = [ids[start:start + chunk_size] for start in range(0, len(ids), chunk_size)]
+        logger.debug(f"Fetching {len(ids)} docs in {len(chunks)} chunks")
+        if concurrency > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                fetched = list(executor.map(self._get_chunk, chunks))
+        else:
+            fetched = [self._get_chunk(chunk) for chunk in chunks]
+        result = {
+            "docs": [],
+            "missing": [],
+            "deleted": []
+        }
+        for found, missing, deleted in fetched:
+            result["missing"].extend(missing)
+            result["deleted"].extend(deleted)
+            for doc in found:
+                if as_documents:
+                    doc = Document(self, doc_id=doc["_id"], data=doc)
+                result["docs"].append(doc)
+        return result
+
+    # (docs, missing ids, deleted ids) for one chunk of ids
+    def _get_chunk(self, ids):
+        if getattr(self, "_bulk_get_supported", True):
+            response = f.endpoint_api(self, endpoint='_bulk_get', json_data={"docs": [{"id": doc_id} for doc_id in ids]}, method='POST')
+            if "results" in response.keys():
+                self._bulk_get_supported = True
+                found, missing, deleted = [], [], []
+                for result in response["results"]:
+                    for entry in result["docs"]:
+                        if "ok" in entry.keys():
+                            found.append(entry["ok"])
+                        elif entry["error"].get("reason") == "deleted":
+                            deleted.append(result["id"])
+                        else:
+                            missing.append(result["id"])
+                return found, missing, deleted
+            elif response.get("error") in ("not_found", "method_not_allowed", "illegal_docid", "bad_request"):
+                logging.getLogger('Database::get_many').info("_bulk_get not available, using _all_docs")
+                self._bulk_get_supported = False
+            else:
+                logging.getLogger('Database::get_many').error(f"Error fetching docs: {response}")
+                return [], list(ids), []
+        response = self.all_docs(include_docs=True, keys=ids)
+        if "rows" not in response.keys():
+            logging.getLogger('Database::get_many').error(f"Error fetching docs: {response}")
+            return [], list(ids), []
+        found, missing, deleted = [], [], []
+        for row in response["rows"]:
+            if "error" in row.keys():
+                missing.append(row["key"])
+            elif row["value"].get("deleted"):
+                deleted.append(row["key"])
+            else:
+                found.append(row["doc"])
+        return found, missing, deleted
 
     # Find using the JSON query syntax
     def find(self, query = None):
@@ -235,16 +463,26 @@ class Database(object):
                             headers=headers, json_data=query, method='POST')
         return resp
 
-    # Bulk Insert
-    def bulk_create(self, docs):
-        logger = logging.getLogger('Database::create_index')
-        logger.debug('Creating headers')
+    # Streams every doc matching a query, following bookmarks, see FindIterator
+    def iter_find(self, query, fields=None, sort=None, use_index=None, page_size=1000, limit=None, execution_stats=False, on_full_scan="warn"):
+        return FindIterator(database=self, query=query, fields=fields, sort=sort, use_index=use_index, page_size=page_size, limit=limit, execution_stats=execution_stats, on_full_scan=on_full_scan)
+
+    # Query plan for a _find query
+    def explain(self, query):
         headers = {
             'Accept': 'application/json',
-            'Content-Type': 'application/json',
+            'Content-Type': 'application/json'
         }
-        endpoint = '_bulk_docs'
-        return f.endpoint_api(self, endpoint=endpoint, headers=headers, data=docs, method='POST')
+        return f.endpoint_api(self, endpoint='_explain', headers=headers, json_data=query, method='POST')
+
+    # Bulk Insert, docs may be any iterable or generator of dicts (or a {"docs": [...]} body)
+    def bulk_create(self, docs, batch_size=1000, max_bytes=4194304, concurrency=4, retry_conflicts=False):
+        logger = logging.getLogger('Database::bulk_create')
+        logger.debug('Loading docs in batches')
+        if type(docs) is dict:
+            docs = docs.get("docs", [])
+        loader = BulkLoader(database=self, batch_size=batch_size, max_bytes=max_bytes, concurrency=concurrency, retry_conflicts=retry_conflicts)
+        return loader.load(docs)
 
     # Create Index on a Database
     def create_index(self, definition):
@@ -256,7 +494,7 @@ class Database(object):
         }
         logger.debug('Checking index definition')
         if 'index' in definition.keys():
-            if 'fields' in definition.index.keys():
+            if 'fields' in definition['index'].keys():
                 if 'name' in definition.keys():
                     if 'type' in definition.keys():
                         if definition['type'] in ['json', 'text']:
@@ -288,36 +526,68 @@ class Database(object):
         )
         return(view.create())
 
-    # Purge deleted docs
-    def purge_all(self):
+    # Queries a view in one request, keys are POSTed, see ViewQuery for the parameters
+    def view(self, ddoc, view, keys=None, limit=None, **params):
+        query = ViewQuery(database=self, ddoc=ddoc, view=view, **params)
+        endpoint = query.path + query.params(startkey=query.startkey, startkey_docid=query.startkey_docid, limit=limit)
+        if keys is not None:
+            return f.endpoint_api(self, endpoint=query.path + query.params(endkey=None, limit=limit), json_data={"keys": list(keys)}, method="POST")
+        return f.endpoint_api(self, endpoint=endpoint)
+
+    # Streams the rows of a view page by page (keys in POSTed batches), see ViewQuery
+    def iter_view(self, ddoc, view, **params):
+        return ViewQuery(database=self, ddoc=ddoc, view=view, **params)
+
+    # Purge deleted docs, found by streaming _changes and purged in bounded batches
+    # batch_size: doc ids per _purge request (CouchDB allows 100 by default)
+    def purge_all(self, batch_size=100):
         logger = logging.getLogger('Database::purge_all')
         headers = {
             'Accept': 'application/json',
             'Content-Type': 'application/json'
         }
-        data = {
-            "selector": {
-                "deleted": True
-            }
+        result = {
+            "purged": 0,
+            "batches": 0,
+            "errors": []
         }
+
+        def send(batch):
+            purge = f.endpoint_api(object=self, endpoint='_purge', headers=headers, json_data=batch, method='POST')
+            result["batches"] += 1
+            if "purged" in purge.keys():
+                result["purged"] += len(purge["purged"])
+            else:
+                logger.error(f"Error purging docs: {purge}")
+                result["errors"].append(purge)
+
         logger.debug("Finding deleted documents")
-        changes = f.endpoint_api(
-            object=self, endpoint='_changes', headers=headers, data=data, method='POST')
-        logger.debug('Changes: ' + json.dumps(changes, indent=2))
-        purge_id = uuid.uuid4().hex
-        logger.debug('purge_id: ' + purge_id)
-        data = {
-            purge_id: []
-        }
-        latest_change = changes['last_seq']
-        for doc in changes['results']:
-            if "deleted" in doc.keys():
-                if doc['deleted'] and doc['seq'] == latest_change:
-                    for change in doc['changes']:
-                        data[purge_id].append(change['rev'])
-        purge = f.endpoint_api(object=self, endpoint='_purge',
-                             headers=headers, data=data, method='POST')
-        return purge
+        # One _changes page at a time, read whole before purging so no connection is held open while writing
+        # style=all_docs lists every leaf revision, conflicts included
+        batch = {}
+        since = None
+        while True:
+            endpoint = f"_changes?style=all_docs&limit={batch_size}"
+            if since is not None:
+                endpoint += f"&since={quote(str(since))}"
+            page = f.endpoint_api(object=self, endpoint=endpoint)
+            if "results" not in page.keys():
+                logger.error(f"Error reading changes: {page}")
+                result["errors"].append(page)
+                break
+            for change in page["results"]:
+                if change.get("deleted"):
+                    batch[change["id"]] = [leaf["rev"] for leaf in change["changes"]]
+                    if len(batch) >= batch_size:
+                        send(batch)
+                        batch = {}
+            if len(page["results"]) < batch_size:
+                break
+            since = page["last_seq"]
+        if batch:
+            send(batch)
+        logger.info(f"Purged {result['purged']} docs in {result['batches']} batches")
+        return result
 
     # Sync Shards
     def sync_shards(self):
@@ -325,4 +595,8 @@ class Database(object):
 
     # Compact DB
     def compact(self):
-        return f.endpoint_api(object=self, endpoint="_sync_shards", method="POST")
+        headers = {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+        return f.endpoint_api(object=self, endpoint="_compact", headers=headers, method="POST")
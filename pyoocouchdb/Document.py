@@ -1,62 +1,168 @@
 import json
 import logging
-import uuid
+import os
+import zlib
+from urllib.parse import quote
 from . import Core as f
+from .Attachment import attachment_body, AttachmentError, DigestCheck
 
 
 # Document Class
 class Document(object):
     # Initialization
-    def __init__(self, database, doc_id=None, content={}):
+    # lazy: no network I/O here, existence, revision and content are fetched on first access
+    # data: document already held, used instead of a GET
+    # row: _all_docs?include_docs=true row already held, same as data with the row's doc
+    def __init__(self, database, doc_id=None, content={}, lazy=False, data=None, row=None):
         logger = logging.getLogger('Document::__init__')
         logger.debug('Initializing attributes')
         self.id = doc_id
         # self.content = json.dumps(content, ensure_ascii=False)
-        self.content = content
+        self._content = dict(content)
+        self._content_set = False
         self.database = database
-        self.revision = None
+        self._revision = None
+        self._exists = None
+        self._loaded = False
         # if "urlopener" in dir(database):
         #     self.urlopener = database.urlopener
-        headers = {
-            'Accept': 'application/json'
-        }
+        if data is not None or row is not None:
+            self.fill(data=data, row=row)
         if self.id:
             self.url = f"{database.url}{self.id}"
-            logger.debug('Looking for the document')
-            resp = f.endpoint_api(self, endpoint='', headers=headers)
-            logger.debug('Response from server: ' + json.dumps(resp, indent=2))
-            logger.debug('Getting all content')
-            if 'status' in resp.keys():
-                if resp['status'] == 'error':
-                    self.exists = False
-            elif "error" in resp.keys():
-                self.exists = False
-            else:
-                self.exists = True
-                self.revision = resp['_rev']
-                for key in resp.keys():
-                    content[key] = resp[key]
+            if not lazy and not self._loaded:
+                self.load()
         else:
-            doc_id = uuid.uuid4().hex
-            lookup = f.endpoint_api(
-                object=self.database,
-                endpoint=doc_id,
-                headers=headers,
-                method='GET'
-            )
-            if "id" in lookup.keys():
-                while "error" not in lookup.keys():
-                    doc_id = uuid.uuid4().hex
-                    lookup = f.endpoint_api(
-                        object=self.database,
-                        endpoint=doc_id,
-                        headers=headers,
-                        method='GET'
-                    )
-            self.id = doc_id
-            self.exists = False
+            # Server-issued ids are unique, no lookup needed
+            self.id = database.server.uuid_pool.next()
+            self._exists = False
+            self._loaded = True
             self.url = f"{self.database.url}{self.id}"
-            self.content['_id'] = doc_id
+            self._content['_id'] = self.id
+
+    # Lazily loaded attributes
+    @property
+    def exists(self):
+        if not self._loaded:
+            self.load()
+        return self._exists
+
+    @exists.setter
+    def exists(self, value):
+        self._exists = value
+        self._loaded = True
+
+    @property
+    def revision(self):
+        if not self._loaded:
+            self.load()
+        return self._revision
+
+    @revision.setter
+    def revision(self, value):
+        self._revision = value
+        self._loaded = True
+
+    @property
+    def content(self):
+        if not self._loaded:
+            self.load()
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        # Content set by the caller is kept when the document loads afterwards
+        self._content = value
+        self._content_set = True
+
+    # Fetches the document once, merging the server copy into the content
+    def load(self):
+        logger = logging.getLogger('Document::load')
+        if self._loaded:
+            return self
+        logger.debug('Looking for the document')
+        resp = self._get()
+        logger.debug('Response from server: %s', f.Payload(resp))
+        logger.debug('Getting all content')
+        self._loaded = True
+        if 'status' in resp.keys():
+            if resp['status'] == 'error':
+                self._exists = False
+        elif "error" in resp.keys():
+            self._exists = False
+        else:
+            self._exists = True
+            self._revision = resp['_rev']
+            if not self._content_set:
+                for key in resp.keys():
+                    self._content[key] = resp[key]
+        return self
+
+    # GET of the document, answered from the document cache when one is configured
+    def _get(self):
+        headers = {
+            'Accept': 'application/json'
+        }
+        cache = self.database.document_cache()
+        if cache is None:
+            return f.endpoint_api(self, endpoint='', headers=headers)
+        entry = cache.get(self.url)
+        if entry is not None and not cache.revalidate:
+            cache.hit()
+            return self.database.server.codec.loads(entry[1])
+        if entry is not None:
+            headers['If-None-Match'] = f'"{entry[0]}"'
+        try:
+            response = f.endpoint_response(self, endpoint='', headers=headers)
+        except Exception as e:
+            logging.getLogger('Document::_get').critical(e.__str__())
+            return {
+                'status': 'error',
+                'fullerror': e.__str__()
+            }
+        if response.status == 304 and entry is not None:
+            cache.hit(revalidated=True)
+            return self.database.server.codec.loads(entry[1])
+        cache.miss()
+        resp = f.decode_response(response, self.database.server.codec)
+        if response.status == 200 and type(resp) is dict and "_rev" in resp.keys():
+            cache.put(self.url, resp["_rev"], response.body)
+        else:
+            cache.discard(self.url)
+        return resp
+
+    # Drops the cached copy after a write
+    def _invalidate(self):
+        cache = self.database.document_cache()
+        if cache is not None:
+            cache.discard(self.url)
+
+    # Fetches the document again, replacing the content with the server copy
+    def refresh(self):
+        self._loaded = False
+        self._content_set = False
+        self._content = {}
+        return self.load()
+
+    # Fills the document from data already held, a document or an _all_docs?include_docs=true row
+    # A document may have a field named doc, so rows are only taken as row=
+    def fill(self, data=None, row=None):
+        if row is not None:
+            if self.id is None:
+                self.id = row.get("id")
+            # Deleted rows come back with a null doc
+            data = row.get("doc") or {}
+        if self.id is None:
+            self.id = data.get("_id")
+        if data.get("_deleted") or data.get("_rev") is None:
+            self._exists = False
+        else:
+            self._exists = True
+            self._revision = data["_rev"]
+        self._content = data
+        self._content_set = False
+        self._loaded = True
+        return self
 
     # Returns a string description
     def __str__(self):
@@ -82,72 +188,259 @@ class Document(object):
             self.exists = True
             return True
 
-    # Creates a non-existent document
+    # Creates a non-existent document, a single PUT that conflicts when the id is taken
     def create(self):
         logger = logging.getLogger('Document::create')
-        logger.debug(f"Cheking if document exists at {self.url}")
-        self.is_there()
-        if self.exists:
+        logger.debug(f"Creating document at {self.url}")
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json"
+        }
+        # A lazy document is not fetched first, the PUT answers whether the id is taken
+        loaded = self._loaded
+        content = dict(self.content if loaded else self._content)
+        content.pop('_rev', None)
+        response = f.endpoint_api(self, endpoint='', headers=headers, json_data=content, method='PUT')
+        self._invalidate()
+        if "rev" in response.keys():
+            self.revision = response["rev"]
+            self._content['_rev'] = response["rev"]
+            self.exists = True
+        elif response.get("error") == "conflict":
             logger.warning('Document exists already, no need to create it')
-            return {"status": "error", "errcode": "400", "errmsg": "Document already exists!"}
-        else:
-            headers = {
-                "Accept": "application/json",
-                "Content-Type": "application/json"
-            }
-            response = f.endpoint_api(self, endpoint='', headers=headers, json_data=self.content, method='PUT')
-            if "rev" in response.keys():
-                self.revision = response["rev"]
+            if loaded:
                 self.exists = True
-            # if response["ok"]:
-            logger.debug(f"{json.dumps(response,indent=2)}")
-            return response
+            return {"status": "error", "errcode": "400", "errmsg": "Document already exists!"}
+        logger.debug("%s", f.Payload(response))
+        return response
     
     # Set the revision of the document
     def current_revision(self):
         logger = logging.getLogger('Document::current_revision')
         logger.debug("Getting revision set")
-        data = self.database.find_by_id(doc_id = self.id)
-        self.revision = data.revision
-        self.content = data.content
+        self.refresh()
+        return self.revision
+
+    # Revision currently on the server, without touching the content
+    def _server_revision(self):
+        response = f.endpoint_api(self, endpoint='', headers={'Accept': 'application/json'})
+        if "_rev" in response.keys():
+            self.revision = response["_rev"]
+            self.exists = True
+        else:
+            self.revision = None
+            self.exists = False
+        return self.revision
 
-    # Updates existing document
-    def update(self):
+    # Updates existing document with the revision held, fetching it again only on a conflict
+    def update(self, retries=1):
         logger = logging.getLogger('Document::update')
-        logger.debug("Saving updated content")
-        updated_content = json.loads(json.dumps(self.content))
-        logger.debug(f"Saved Data: {json.dumps(updated_content,indent=2)}")
-        logger.debug(f"Cheking if document exists at {self.url}")
-        if self.is_there():
-            self.current_revision()
-        if self.exists:
-            logger.debug(f"Document found!")
+        logger.debug(f"Saving updated content at {self.url}")
+        if not self.exists:
+            logger.warning('Document not found')
+            return {"status": "error", "errcode": "400", "errmsg": "Document doesn't exist!"}
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json"
+        }
+        while True:
+            content = dict(self.content)
+            content['_rev'] = self.revision
+            response = f.endpoint_api(self, endpoint='', headers=headers, json_data=content, method='PUT')
+            self._invalidate()
+            if response.get("error") == "conflict" and retries > 0:
+                retries -= 1
+                logger.debug("Revision conflict, fetching the current revision and retrying")
+                if self._server_revision() is None:
+                    logger.warning('Document not found')
+                    return {"status": "error", "errcode": "400", "errmsg": "Document doesn't exist!"}
+                continue
+            break
+        if "rev" in response.keys():
+            self.revision = response["rev"]
+            self._content['_rev'] = response["rev"]
+        logger.debug("%s", f.Payload(response))
+        return response
+
+    # Deletes existing document with the revision held, fetching it again only on a conflict
+    def delete(self, retries=1):
+        logger = logging.getLogger('Document::delete')
+        logger.debug('Deleting document')
+        if not self.exists:
+            logger.warning('Document does not exist, no need to delete it')
+            return {"status": "error", "errcode": "400", "errmsg": "Document doesn't exist!"}
+        while True:
             headers = {
-                "Accept": "application/json",
-                "Content-Type": "application/json",
+                'Accept': 'application/json',
                 'If-Match': self.revision
             }
-            logger.debug(f"Saved Data before endpoint call: {json.dumps(updated_content,indent=2)}")
-            response = f.endpoint_api(self, endpoint='', headers=headers, json_data=updated_content, method='PUT')
-            self.current_revision()
-            logger.debug(f"{json.dumps(response,indent=2)}")
-            return response
-        else:
+            response = f.endpoint_api(self, endpoint='', headers=headers, method='DELETE')
+            self._invalidate()
+            if response.get("error") == "conflict" and retries > 0:
+                retries -= 1
+                logger.debug("Revision conflict, fetching the current revision and retrying")
+                if self._server_revision() is None:
+                    break
+                continue
+            break
+        if response.get("error") == "not_found" or not self.exists:
+            logger.warning('Document does not exist, no need to delete it')
+            self.exists = False
+            return {"status": "error", "errcode": "400", "errmsg": "Document doesn't exist!"}
+        if "rev" in response.keys():
+            self.revision = response["rev"]
+            self.exists = False
+        return response
+
+    # Attachment stubs of the document: name -> content_type, length, digest, revpos
+    def attachments(self):
+        return dict(self.content.get('_attachments') or {})
+
+    # Uploads an attachment, streamed from its source without loading it whole
+    # source: bytes, a path, a file object, an mmap or an iterable of bytes (sent with chunked transfer)
+    # length: bytes to send when the source cannot tell, files and mmaps are measured from their current position
+    # Creates the document when it does not exist yet
+    def put_attachment(self, name, source, content_type="application/octet-stream", length=None):
+        logger = logging.getLogger('Document::put_attachment')
+        logger.debug(f"Uploading attachment {name} to {self.url}")
+        body, length, opened = attachment_body(source, length)
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": content_type
+        }
+        if length is not None:
+            headers["Content-Length"] = str(length)
+        endpoint = f"/{quote(name, safe='')}"
+        if self.exists:
+            endpoint = f"{endpoint}?rev={self.revision}"
+        try:
+            response = f.endpoint_response(self, endpoint=endpoint, headers=headers, data=body, json_data=None, method='PUT')
+            resp = f.decode_response(response, self.database.server.codec)
+        except Exception as e:
+            logger.critical(e.__str__())
+            return {
+                'status': 'error',
+                'fullerror': e.__str__()
+            }
+        finally:
+            if opened:
+                body.close()
+        self._invalidate()
+        if type(resp) is dict and "rev" in resp.keys():
+            self.revision = resp["rev"]
+            self.exists = True
+            self._content['_rev'] = resp["rev"]
+            # Stub so a later update() keeps the attachment
+            self._content.setdefault('_attachments', {})[name] = {"content_type": content_type, "stub": True}
+        logger.debug("%s", f.Payload(resp))
+        return resp
+
+    # Removes an attachment, making a new revision of the document
+    def delete_attachment(self, name):
+        logger = logging.getLogger('Document::delete_attachment')
+        logger.debug(f"Deleting attachment {name} of {self.url}")
+        if not self.exists:
             logger.warning('Document not found')
-            return {"status": "error", "errcode": "400", "errmsg": "Document already exists!"}
+            return {"status": "error", "errcode": "400", "errmsg": "Document doesn't exist!"}
+        response = f.endpoint_api(self, endpoint=f"/{quote(name, safe='')}?rev={self.revision}", headers={'Accept': 'application/json'}, method='DELETE')
+        self._invalidate()
+        if "rev" in response.keys():
+            self.revision = response["rev"]
+            self._content['_rev'] = response["rev"]
+            (self._content.get('_attachments') or {}).pop(name, None)
+        return response
 
-    # Deletes existing document
-    def delete(self):
-        logger = logging.getLogger('Document::create')
-        logger.debug('Cheking if document exists')
-        self.current_revision()
-        if self.is_there():
-            if not self.exists:
-                logger.warning('Document does not exist, no need to delete it')
-                return {"status": "error", "errcode": "400", "errmsg": "Document doesn't exist!"}
-            else:
-                headers = {
-                    'Accept': 'application/json',
-                    'If-Match': self.revision
-                }
-                return f.endpoint_api(self, endpoint='', headers=headers, method='DELETE')
+    # Streams an attachment chunk by chunk, never holding it whole
+    # start, end: byte range, both inclusive like the Range header, end None for the rest
+    # verify: check the whole attachment against its digest, raising DigestMismatchError after the last chunk
+    # Raises AttachmentError when the attachment can't be read
+    def iter_attachment(self, name, start=None, end=None, chunk_size=1048576, verify=True):
+        logger = logging.getLogger('Document::iter_attachment')
+        ranged = start is not None or end is not None
+        # Compressible attachments are stored gzipped and their stub digest covers the gzip bytes,
+        # so those are asked for as stored, checked, and inflated here
+        encoding = self._stub(name).get("encoding")
+        headers = {
+            "Accept": "*/*",
+            "Accept-Encoding": encoding or "identity"
+        }
+        if ranged and not encoding:
+            headers["Range"] = f"bytes={start or 0}-{'' if end is None else end}"
+        stream = f.endpoint_stream(self, endpoint=f"/{quote(name, safe='')}", headers=headers, chunk_size=chunk_size)
+        if stream.status >= 400:
+            body = stream.read()
+            try:
+                error = self.database.server.codec.loads(body)
+            except ValueError:
+                error = {"error": body.decode(errors='replace')}
+            raise AttachmentError(stream.status, error.get("error", "error"), error.get("reason") or error.get("fullerror", ""))
+        skip, left = 0, None
+        if ranged and stream.status == 200:
+            # Range not asked for or ignored by the server, cut it here
+            logger.debug("Server sent the whole attachment, slicing the range locally")
+            skip = start or 0
+            left = None if end is None else end - skip + 1
+        inflate = zlib.decompressobj(16 + zlib.MAX_WBITS) if stream.headers.get("content-encoding") == "gzip" else None
+        expected = stream.headers.get("content-md5")
+        if expected is None and (inflate is not None or not encoding):
+            # The stub digest is only good for the bytes as stored
+            expected = self._stub(name).get("digest")
+        check = DigestCheck(expected) if verify and not ranged else None
+
+        def chunks():
+            for chunk in stream.iter_content():
+                if check is not None:
+                    check.update(chunk)
+                yield chunk if inflate is None else inflate.decompress(chunk)
+            if inflate is not None:
+                yield inflate.flush()
+
+        with stream:
+            for chunk in chunks():
+                if skip:
+                    if len(chunk) <= skip:
+                        skip -= len(chunk)
+                        continue
+                    chunk = chunk[skip:]
+                    skip = 0
+                if left is not None:
+                    chunk = chunk[:left]
+                    left -= len(chunk)
+                if chunk:
+                    yield chunk
+                if left == 0:
+                    return
+        if check is not None:
+            check.verify()
+
+    # Downloads an attachment to a path or a writable file object, chunk by chunk
+    # Returns the bytes written and the digest, or an error dict (the partial file at a path is removed)
+    def download_attachment(self, name, target, start=None, end=None, chunk_size=1048576, verify=True):
+        logger = logging.getLogger('Document::download_attachment')
+        opened = type(target) is str
+        output = open(target, "wb") if opened else target
+        written = 0
+        try:
+            for chunk in self.iter_attachment(name, start=start, end=end, chunk_size=chunk_size, verify=verify):
+                output.write(chunk)
+                written += len(chunk)
+        except AttachmentError as ae:
+            logger.error(ae.__str__())
+            if opened:
+                output.close()
+                os.remove(target)
+            return {
+                'status': 'error',
+                'error': ae.error,
+                'fullerror': ae.__str__()
+            }
+        finally:
+            if opened:
+                output.close()
+        return {"ok": True, "name": name, "length": written}
+
+    # Stub of an attachment from the document already held, empty when the document isn't loaded
+    def _stub(self, name):
+        if not self._loaded:
+            return {}
+        return (self._content.get('_attachments') or {}).get(name) or {}
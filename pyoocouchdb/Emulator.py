@@ -0,0 +1,1224 @@
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit, parse_qsl, unquote
+from .Pool import PoolResponse, PoolStream
+
+DB_NAME = re.compile(r"^[a-z][a-z0-9_$()+/-]*$")
+SYSTEM_DBS = ("_users", "_replicator", "_global_changes", "_nodes", "_dbs")
+REASONS = {
+    200: "OK",
+    201: "Created",
+    202: "Accepted",
+    206: "Partial Content",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Object Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    412: "Precondition Failed",
+    416: "Requested Range Not Satisfiable",
+    500: "Internal Server Error",
+    501: "Not Implemented"
+}
+DEFAULT_SECURITY = {"members": {"roles": ["_admin"]}, "admins": {"roles": ["_admin"]}}
+FULL_SCAN_WARNING = "No matching index found, create an index to optimize query time."
+
+
+# Raised inside the emulator to answer with a CouchDB error body
+class EmulatedError(Exception):
+    def __init__(self, status, error, reason):
+        Exception.__init__(self, f"{status} {error}: {reason}")
+        self.status = status
+        self.error = error
+        self.reason = reason
+
+
+# Sort key following CouchDB collation: null < false < true < numbers < strings < arrays < objects
+# Strings compare by code point, CouchDB uses ICU collation for them
+def collate(value):
+    if value is None:
+        return (0,)
+    if value is False:
+        return (1,)
+    if value is True:
+        return (2,)
+    if type(value) in (int, float):
+        return (3, value)
+    if type(value) is str:
+        return (4, value)
+    if type(value) is list:
+        return (5, [collate(item) for item in value])
+    return (6, [(key, collate(item)) for key, item in value.items()])
+
+
+# (found, value) of a dotted field path
+def get_field(doc, path):
+    value = doc
+    for name in path.split("."):
+        if type(value) is not dict or name not in value.keys():
+            return False, None
+        value = value[name]
+    return True, value
+
+
+# Mango selector match, with the combination and condition operators of CouchDB
+def match(doc, selector):
+    for key, condition in selector.items():
+        if key == "$and":
+            if not all(match(doc, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(match(doc, part) for part in condition):
+                return False
+        elif key == "$nor":
+            if any(match(doc, part) for part in condition):
+                return False
+        elif key == "$not":
+            if match(doc, condition):
+                return False
+        elif key.startswith("$"):
+            raise EmulatedError(400, "invalid_operator", f"Invalid operator: {key}")
+        else:
+            found, value = get_field(doc, key)
+            if not match_field(found, value, condition):
+                return False
+    return True
+
+
+def match_field(found, value, condition):
+    if type(condition) is not dict:
+        return found and collate(value) == collate(condition)
+    if not any(key.startswith("$") for key in condition.keys()):
+        # {"profile": {"age": 3}} selects on sub fields
+        return found and type(value) is dict and match(value, condition)
+    for operator, operand in condition.items():
+        if operator == "$exists":
+            if found != operand:
+                return False
+            continue
+        if operator == "$not":
+            if match_field(found, value, operand):
+                return False
+            continue
+        if operator == "$and":
+            if not all(match_field(found, value, part) for part in operand):
+                return False
+            continue
+        if operator == "$or":
+            if not any(match_field(found, value, part) for part in operand):
+                return False
+            continue
+        if not found:
+            return False
+        if operator == "$eq":
+            result = collate(value) == collate(operand)
+        elif operator == "$ne":
+            result = collate(value) != collate(operand)
+        elif operator == "$gt":
+            result = collate(value) > collate(operand)
+        elif operator == "$gte":
+            result = collate(value) >= collate(operand)
+        elif operator == "$lt":
+            result = collate(value) < collate(operand)
+        elif operator == "$lte":
+            result = collate(value) <= collate(operand)
+        elif operator == "$in":
+            result = any(collate(value) == collate(item) for item in operand)
+        elif operator == "$nin":
+            result = not any(collate(value) == collate(item) for item in operand)
+        elif operator == "$type":
+            result = json_type(value) == operand
+        elif operator == "$size":
+            result = type(value) is list and len(value) == operand
+        elif operator == "$regex":
+            result = type(value) is str and re.search(operand, value) is not None
+        elif operator == "$mod":
+            result = type(value) is int and value % operand[0] == operand[1]
+        elif operator == "$all":
+            result = type(value) is list and all(any(collate(item) == collate(wanted) for item in value) for wanted in operand)
+        elif operator == "$elemMatch":
+            result = type(value) is list and any(match_field(True, item, operand) for item in value)
+        elif operator == "$allMatch":
+            result = type(value) is list and len(value) > 0 and all(match_field(True, item, operand) for item in value)
+        else:
+            raise EmulatedError(400, "invalid_operator", f"Invalid operator: {operator}")
+        if not result:
+            return False
+    return True
+
+
+def json_type(value):
+    if value is None:
+        return "null"
+    if type(value) is bool:
+        return "boolean"
+    if type(value) in (int, float):
+        return "number"
+    if type(value) is str:
+        return "string"
+    if type(value) is list:
+        return "array"
+    return "object"
+
+
+# Projection of a document on dotted field paths
+def project(doc, fields):
+    projected = {}
+    for field in fields:
+        found, value = get_field(doc, field)
+        if not found:
+            continue
+        target = projected
+        names = field.split(".")
+        for name in names[:-1]:
+            target = target.setdefault(name, {})
+        target[names[-1]] = value
+    return projected
+
+
+# Feed Class - a streamed body that waits for new rows, closable from any thread
+# rows(since) -> (rows, last_seq) is called under the emulator lock, each row is sent as one JSON line
+class Feed(object):
+    def __init__(self, emulator, rows, since, limit=None, heartbeat=None, timeout=60000):
+        self.emulator = emulator
+        self.rows = rows
+        self.since = since
+        self.limit = limit
+        self.heartbeat = heartbeat / 1000 if heartbeat else None
+        self.deadline = time.monotonic() + (timeout / 1000 if timeout is not None else 60)
+        self.closed = False
+
+    def __iter__(self):
+        sent = 0
+        while not self.closed:
+            with self.emulator.changed:
+                rows, last_seq = self.rows(self.since)
+                if not rows:
+                    remaining = self.deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.emulator.changed.wait(min(remaining, self.heartbeat or remaining))
+                    rows, last_seq = self.rows(self.since)
+            if self.closed:
+                return
+            if not rows:
+                if self.heartbeat is not None and time.monotonic() < self.deadline:
+                    yield b"\n"
+                continue
+            for row in rows:
+                yield json.dumps(row, separators=(",", ":")).encode() + b"\n"
+                self.since = row["seq"]
+                sent += 1
+                if self.limit is not None and sent >= self.limit:
+                    break
+            if self.limit is not None and sent >= self.limit:
+                break
+        if not self.closed:
+            yield json.dumps({"last_seq": self.since, "pending": 0}, separators=(",", ":")).encode() + b"\n"
+
+    def close(self):
+        self.closed = True
+        with self.emulator.changed:
+            self.emulator.changed.notify_all()
+
+
+# Emulator Class - in-process CouchDB HTTP API, keeping everything in memory
+# Documents keep their current revision only (no revision tree),
+# views run Python map functions registered with define_view (no JavaScript) and the built-in reduces,
+# Mango supports selectors, fields, sort, skip/limit, bookmarks, indexes and _explain,
+# attachments are standalone (PUT/GET with single byte ranges/DELETE) or inline base64 on write,
+# every request is accepted whatever its credentials
+class Emulator(object):
+    def __init__(self, node="nonode@nohost", version="3.3.3"):
+        self.node = node
+        self.version = version
+        self.uuid = uuid.uuid4().hex
+        self.started = time.time()
+        self.dbs = {}
+        self.config = {}
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+        self.updates = {}
+        self.update_seq = 0
+        self.requests = {}
+        self.statuses = {}
+        self.reads = 0
+        self.writes = 0
+        # (db, ddoc, view) -> (map function, reduce)
+        self.views = {}
+        with self.lock:
+            for name in ("_users", "_replicator", "_nodes"):
+                self._create_db(name)
+
+    # Stands in for the JavaScript map function of a view: map_function(doc) returns (key, value) pairs
+    # reduce: "_count", "_sum", "_stats", a Python reduce(keys, values) or None to use the design document's built-in one
+    def define_view(self, db, ddoc, view, map_function, reduce=None):
+        if ddoc.startswith("_design/"):
+            ddoc = ddoc[len("_design/"):]
+        with self.lock:
+            self.views[(db, ddoc, view)] = (map_function, reduce)
+
+    # Answers a request, returns (status, headers, body) where body is bytes or an iterable of bytes
+    def handle(self, method, url, headers={}, body=None):
+        method = method.upper()
+        parts = urlsplit(url)
+        segments = [unquote(segment) for segment in parts.path.split("/") if segment]
+        query = dict(parse_qsl(parts.query, keep_blank_values=True))
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        extra = {}
+        try:
+            body = self._read(body)
+            # Standalone attachments take the body as it is, everything else is JSON
+            data = body if self._is_attachment(segments) else self._parse(body, headers)
+            with self.lock:
+                answer = self._route(method, segments, query, headers, data)
+            status, payload = answer[0], answer[1]
+            if len(answer) > 2:
+                extra = answer[2]
+        except EmulatedError as ee:
+            status, payload = ee.status, {"error": ee.error, "reason": ee.reason}
+        except Exception as e:
+            status, payload = 500, {"error": "unknown_error", "reason": e.__str__()}
+        with self.lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        response_headers = {"Server": f"CouchDB/{self.version} (pyoocouchdb emulator)", "Content-Type": "application/json"}
+        response_headers.update(extra)
+        if isinstance(payload, Feed):
+            response_headers["Transfer-Encoding"] = "chunked"
+            return status, response_headers, payload
+        if status == 304 or method == "HEAD":
+            return status, response_headers, b""
+        if type(payload) is bytes:
+            return status, response_headers, payload
+        return status, response_headers, json.dumps(payload, separators=(",", ":")).encode() + b"\n"
+
+    # Request body as bytes, whatever was handed to the transport: bytes, str, files, mmaps or iterables
+    def _read(self, body):
+        if body is None or type(body) is bytes:
+            return body
+        if type(body) is str:
+            return body.encode()
+        if type(body) in (bytearray, memoryview):
+            return bytes(body)
+        if hasattr(body, "read"):
+            return body.read()
+        return b"".join(body)
+
+    def _is_attachment(self, segments):
+        return len(segments) > 2 and not (segments[0].startswith("_") and segments[0] not in SYSTEM_DBS) and not segments[1].startswith("_")
+
+    def _parse(self, body, headers):
+        if not body:
+            return None
+        try:
+            return json.loads(body)
+        except ValueError:
+            raise EmulatedError(400, "bad_request", "invalid UTF-8 JSON")
+
+    def _route(self, method, segments, query, headers, data):
+        if not segments:
+            return 200, {"couchdb": "Welcome", "version": self.version, "git_sha": "emulator", "uuid": self.uuid, "features": ["access-ready", "partitioned", "pluggable-storage-engines", "reshard", "scheduler"], "vendor": {"name": "pyoocouchdb emulator"}}
+        first = segments[0]
+        if first.startswith("_") and first not in SYSTEM_DBS:
+            return self._server_endpoint(method, segments, query, data)
+        if len(segments) == 1:
+            return self._database(method, first, data)
+        db = self._get_db(first)
+        return self._database_endpoint(method, first, db, segments[1:], query, headers, data)
+
+    # Server level endpoints
+    def _server_endpoint(self, method, segments, query, data):
+        first = segments[0]
+        if first == "_all_dbs":
+            names = sorted(self.dbs)
+            return 200, self._key_range(names, query)
+        if first == "_dbs_info":
+            if method == "GET":
+                return 200, [{"key": name, "info": self._db_info(name)} for name in self._key_range(sorted(self.dbs), query)]
+            if type(data) is not dict or type(data.get("keys")) is not list:
+                raise EmulatedError(400, "bad_request", "`keys` member must exist.")
+            return 200, [{"key": name, "info": self._db_info(name)} if name in self.dbs else {"key": name, "error": "not_found"} for name in data["keys"]]
+        if first == "_uuids":
+            count = int(query.get("count", "1"))
+            if count > 1000:
+                raise EmulatedError(400, "bad_request", "count parameter too large")
+            return 200, {"uuids": [uuid.uuid4().hex for index in range(count)]}
+        if first == "_up":
+            return 200, {"status": "ok", "seeds": {}}
+        if first == "_membership":
+            return 200, {"all_nodes": [self.node], "cluster_nodes": [self.node]}
+        if first == "_active_tasks":
+            return 200, []
+        if first == "_session":
+            return 200, {"ok": True, "userCtx": {"name": None, "roles": ["_admin"]}, "info": {"authentication_handlers": ["cookie", "default"]}}
+        if first == "_cluster_setup":
+            if method == "GET":
+                return 200, {"state": "single_node_enabled"}
+            return 201, {"ok": True}
+        if first == "_scheduler" and len(segments) > 1:
+            return 200, {"total_rows": 0, "offset": 0, segments[1]: []}
+        if first == "_db_updates":
+            return self._db_updates(query)
+        if first == "_node" and len(segments) > 2:
+            return self._node_endpoint(method, segments[2:], query, data)
+        raise EmulatedError(400, "illegal_database_name", f"Name: '{first}'. Only lowercase characters (a-z), digits (0-9), and any of the characters _, $, (, ), +, -, and / are allowed. Must begin with a letter.")
+
+    def _node_endpoint(self, method, segments, query, data):
+        section = segments[0]
+        if section == "_nodes":
+            if len(segments) == 1:
+                return self._database(method, "_nodes", data)
+            return self._database_endpoint(method, "_nodes", self.dbs["_nodes"], segments[1:], query, {}, data)
+        if section == "_config":
+            if len(segments) == 1:
+                return 200, self.config
+            values = self.config.setdefault(segments[1], {})
+            if len(segments) == 2:
+                return 200, values
+            key = segments[2]
+            if method == "PUT":
+                old = values.get(key, "")
+                values[key] = data
+                return 200, old
+            if method == "DELETE":
+                if key not in values.keys():
+                    raise EmulatedError(404, "not_found", "unknown_config_value")
+                return 200, values.pop(key)
+            if key not in values.keys():
+                raise EmulatedError(404, "not_found", "unknown_config_value")
+            return 200, values[key]
+        if section == "_stats":
+            return 200, self._stats()
+        if section == "_system":
+            return 200, {
+                "uptime": int(time.time() - self.started),
+                "memory": {"other": 0, "atom": 0, "atom_used": 0, "processes": 0, "processes_used": 0, "binary": 0, "code": 0, "ets": 0},
+                "run_queue": 0,
+                "ets_table_count": 0,
+                "context_switches": 0,
+                "reductions": 0,
+                "garbage_collection_count": 0,
+                "words_reclaimed": 0,
+                "io_input": 0,
+                "io_output": 0,
+                "os_proc_count": 0,
+                "stale_proc_count": 0,
+                "process_count": len(self.dbs),
+                "process_limit": 262144,
+                "message_queues": {},
+                "internal_replication_jobs": 0,
+                "distribution": {}
+            }
+        raise EmulatedError(400, "bad_request", f"Unknown node endpoint: {section}")
+
+    # Counters in the _node/_local/_stats layout
+    def _stats(self):
+        def counter(value, desc):
+            return {"value": value, "type": "counter", "desc": desc}
+        return {
+            "couchdb": {
+                "httpd": {"requests": counter(sum(self.requests.values()), "number of HTTP requests")},
+                "database_reads": counter(self.reads, "number of times a document was read from a database"),
+                "database_writes": counter(self.writes, "number of times a database was changed"),
+                "open_databases": {"value": len(self.dbs), "type": "gauge", "desc": "number of open databases"},
+                "httpd_request_methods": {method: counter(count, f"number of HTTP {method} requests") for method, count in self.requests.items()},
+                "httpd_status_codes": {str(status): counter(count, f"number of HTTP {status} responses") for status, count in self.statuses.items()}
+            }
+        }
+
+    def _db_updates(self, query):
+        feed = query.get("feed", "normal")
+        since = self._since(query.get("since", "0"), self.update_seq)
+
+        def rows(since):
+            found = [{"db_name": name, "type": kind, "seq": self._seq(seq)} for name, (seq, kind) in self.updates.items() if seq > self._since(since, self.update_seq)]
+            return found, self._seq(self.update_seq)
+        if feed == "continuous":
+            return 200, Feed(self, rows, self._seq(since), heartbeat=self._int(query, "heartbeat"), timeout=self._int(query, "timeout", 60000))
+        if feed == "longpoll":
+            self._wait(lambda: rows(self._seq(since))[0], self._int(query, "timeout", 60000))
+        found, last_seq = rows(self._seq(since))
+        return 200, {"results": found, "last_seq": last_seq}
+
+    # Database create, info and delete
+    def _database(self, method, name, data):
+        if method in ("GET", "HEAD"):
+            self._get_db(name)
+            return 200, self._db_info(name)
+        if method == "PUT":
+            if name in self.dbs:
+                raise EmulatedError(412, "file_exists", "The database could not be created, the file already exists.")
+            if not DB_NAME.match(name) and name not in SYSTEM_DBS:
+                raise EmulatedError(400, "illegal_database_name", f"Name: '{name}'. Only lowercase characters (a-z), digits (0-9), and any of the characters _, $, (, ), +, -, and / are allowed. Must begin with a letter.")
+            self._create_db(name)
+            return 201, {"ok": True}
+        if method == "DELETE":
+            self._get_db(name)
+            del self.dbs[name]
+            self._db_updated(name, "deleted")
+            return 200, {"ok": True}
+        if method == "POST":
+            db = self._get_db(name)
+            if type(data) is not dict:
+                raise EmulatedError(400, "bad_request", "Document must be a JSON object")
+            result = self._write(name, db, data.get("_id") or uuid.uuid4().hex, data, data.get("_rev"))
+            if "error" in result.keys():
+                raise EmulatedError(409, result["error"], result["reason"])
+            return 201, result, {"ETag": f'"{result["rev"]}"', "Location": result["id"]}
+        raise EmulatedError(405, "method_not_allowed", "Only DELETE,GET,HEAD,POST,PUT allowed")
+
+    def _create_db(self, name):
+        self.dbs[name] = {
+            "docs": {},
+            "order": {},
+            "sizes": {},
+            "live": 0,
+            "bytes": 0,
+            "local": {},
+            "seq": 0,
+            "purge_seq": 0,
+            "security": json.loads(json.dumps(DEFAULT_SECURITY)),
+            # Attachment bodies by digest, shared by every revision pointing at them
+            "blobs": {},
+            "created": time.time()
+        }
+        self._db_updated(name, "created")
+
+    def _get_db(self, name):
+        if name not in self.dbs:
+            raise EmulatedError(404, "not_found", "Database does not exist.")
+        return self.dbs[name]
+
+    def _db_info(self, name):
+        db = self.dbs[name]
+        live = db["live"]
+        active = db["bytes"]
+        return {
+            "db_name": name,
+            "purge_seq": self._seq(db["purge_seq"]),
+            "update_seq": self._seq(db["seq"]),
+            "sizes": {"file": 8192 + active * 2, "external": active, "active": active},
+            "props": {},
+            "doc_del_count": len(db["docs"]) - live,
+            "doc_count": live,
+            "disk_format_version": 8,
+            "compact_running": False,
+            "cluster": {"q": 2, "n": 1, "w": 1, "r": 1},
+            "instance_start_time": "0"
+        }
+
+    def _db_updated(self, name, kind):
+        self.update_seq += 1
+        self.updates.pop(name, None)
+        self.updates[name] = (self.update_seq, kind)
+        self.changed.notify_all()
+
+    # Endpoints under a database
+    def _database_endpoint(self, method, name, db, segments, query, headers, data):
+        first = segments[0]
+        if first == "_all_docs":
+            return self._all_docs(db, query, data)
+        if first == "_bulk_docs":
+            return self._bulk_docs(name, db, data)
+        if first == "_bulk_get":
+            return self._bulk_get(db, data)
+        if first == "_changes":
+            return self._changes(db, query, data)
+        if first == "_find":
+            return self._find(name, db, data, explain=False)
+        if first == "_explain":
+            return self._find(name, db, data, explain=True)
+        if first == "_index":
+            return self._index(method, name, db, segments[1:], data)
+        if first == "_security":
+            if method == "PUT":
+                if type(data) is not dict:
+                    raise EmulatedError(400, "bad_request", "Security object must be a JSON object")
+                db["security"] = data
+                self._db_updated(name, "updated")
+                return 200, {"ok": True}
+            return 200, db["security"]
+        if first == "_purge":
+            return self._purge(name, db, data)
+        if first in ("_compact", "_view_cleanup", "_ensure_full_commit"):
+            return (201 if first == "_ensure_full_commit" else 202), {"ok": True}
+        if first == "_sync_shards":
+            return 202, {"ok": True}
+        if first == "_revs_limit":
+            return 200, 1000 if method == "GET" else {"ok": True}
+        if first == "_local":
+            if len(segments) < 2:
+                raise EmulatedError(400, "bad_request", "Missing document id")
+            return self._local(method, db, f"_local/{'/'.join(segments[1:])}", query, headers, data)
+        if first == "_design":
+            if len(segments) < 2:
+                raise EmulatedError(400, "bad_request", "Missing design document name")
+            if len(segments) == 4 and segments[2] == "_view":
+                return self._view(name, db, segments[1], segments[3], query, data)
+            if len(segments) > 2:
+                raise EmulatedError(501, "not_implemented", "Shows, lists, updates and view queries batches are not emulated")
+            return self._document(method, name, db, f"_design/{segments[1]}", query, headers, data)
+        if first.startswith("_"):
+            raise EmulatedError(400, "bad_request", f"Only reserved document ids may start with underscore.")
+        if len(segments) > 1:
+            return self._attachment(method, name, db, first, "/".join(segments[1:]), query, headers, data)
+        return self._document(method, name, db, first, query, headers, data)
+
+    # Single document GET, PUT, DELETE
+    def _document(self, method, name, db, doc_id, query, headers, data):
+        current = db["docs"].get(doc_id)
+        if method in ("GET", "HEAD"):
+            self.reads += 1
+            if current is None or current.get("_deleted"):
+                raise EmulatedError(404, "not_found", "deleted" if current is not None else "missing")
+            if "rev" in query.keys() and query["rev"] != current["_rev"]:
+                raise EmulatedError(404, "not_found", "missing")
+            etag = f'"{current["_rev"]}"'
+            if headers.get("if-none-match") == etag:
+                return 304, None, {"ETag": etag}
+            doc = dict(current)
+            if query.get("revs") == "true":
+                generation, digest = current["_rev"].split("-", 1)
+                doc["_revisions"] = {"start": int(generation), "ids": [digest]}
+            if query.get("local_seq") == "true":
+                doc["_local_seq"] = db["order"][doc_id]
+            return 200, doc, {"ETag": etag}
+        revision = query.get("rev") or headers.get("if-match") or ((data or {}).get("_rev") if type(data) is dict else None)
+        if method == "PUT":
+            if type(data) is not dict:
+                raise EmulatedError(400, "bad_request", "Document must be a JSON object")
+            result = self._write(name, db, doc_id, data, revision)
+            if "error" in result.keys():
+                raise EmulatedError(412 if result["error"] == "missing_stub" else 409, result["error"], result["reason"])
+            return 201, result, {"ETag": f'"{result["rev"]}"'}
+        if method == "DELETE":
+            if current is None or current.get("_deleted"):
+                raise EmulatedError(404, "not_found", "deleted" if current is not None else "missing")
+            result = self._write(name, db, doc_id, {"_deleted": True}, revision)
+            if "error" in result.keys():
+                raise EmulatedError(409, result["error"], result["reason"])
+            return 200, result, {"ETag": f'"{result["rev"]}"'}
+        raise EmulatedError(405, "method_not_allowed", "Only DELETE,GET,HEAD,PUT allowed")
+
+    # Standalone attachment GET (with Range), PUT and DELETE, each write making a new revision
+    def _attachment(self, method, name, db, doc_id, attachment, query, headers, data):
+        current = db["docs"].get(doc_id)
+        live = current is not None and not current.get("_deleted")
+        revision = query.get("rev") or headers.get("if-match")
+        if method in ("GET", "HEAD"):
+            self.reads += 1
+            if not live or ("rev" in query.keys() and query["rev"] != current["_rev"]):
+                raise EmulatedError(404, "not_found", "deleted" if current is not None else "missing")
+            stub = (current.get("_attachments") or {}).get(attachment)
+            if stub is None:
+                raise EmulatedError(404, "not_found", "Document is missing attachment")
+            content = db["blobs"][stub["digest"]]
+            digest = stub["digest"][4:]
+            extra = {"Content-Type": stub["content_type"], "ETag": f'"{digest}"', "Accept-Ranges": "bytes"}
+            if headers.get("if-none-match") == extra["ETag"]:
+                return 304, None, extra
+            ranged = re.match(r"^bytes=(\d*)-(\d*)$", headers.get("range", "").strip())
+            if ranged and ranged.group(1) + ranged.group(2):
+                first, last = ranged.groups()
+                if first:
+                    first, last = int(first), min(int(last), len(content) - 1) if last else len(content) - 1
+                else:
+                    first, last = max(0, len(content) - int(last)), len(content) - 1
+                if first > last:
+                    extra["Content-Range"] = f"bytes */{len(content)}"
+                    return 416, {"error": "requested_range_not_satisfiable", "reason": "Requested range not satisfiable"}, extra
+                extra["Content-Range"] = f"bytes {first}-{last}/{len(content)}"
+                return 206, content[first:last + 1], extra
+            extra["Content-MD5"] = digest
+            return 200, content, extra
+        if method == "PUT":
+            content = data or b""
+            digest = "md5-" + base64.b64encode(hashlib.md5(content).digest()).decode()
+            db["blobs"][digest] = content
+            doc = dict(current) if live else {}
+            attachments = dict(doc.get("_attachments") or {})
+            generation = int(current["_rev"].split("-")[0]) + 1 if current is not None else 1
+            attachments[attachment] = {"content_type": headers.get("content-type", "application/octet-stream"), "revpos": generation, "digest": digest, "length": len(content), "stub": True}
+            doc["_attachments"] = attachments
+            result = self._write(name, db, doc_id, doc, revision)
+            if "error" in result.keys():
+                raise EmulatedError(409, result["error"], result["reason"])
+            return 201, result, {"ETag": f'"{result["rev"]}"'}
+        if method == "DELETE":
+            if not live:
+                raise EmulatedError(404, "not_found", "deleted" if current is not None else "missing")
+            if attachment not in (current.get("_attachments") or {}).keys():
+                raise EmulatedError(404, "not_found", "Document is missing attachment")
+            doc = dict(current)
+            doc["_attachments"] = {key: stub for key, stub in current["_attachments"].items() if key != attachment}
+            if not doc["_attachments"]:
+                del doc["_attachments"]
+            result = self._write(name, db, doc_id, doc, revision)
+            if "error" in result.keys():
+                raise EmulatedError(409, result["error"], result["reason"])
+            return 200, result, {"ETag": f'"{result["rev"]}"'}
+        raise EmulatedError(405, "method_not_allowed", "Only DELETE,GET,HEAD,PUT allowed")
+
+    # Attachments of a new revision as stubs: inline data stored, stubs resolved against the current revision
+    # Returns the name of the first stub the current revision does not have instead
+    def _stubs(self, db, current, attachments, generation):
+        held = (current or {}).get("_attachments") or {}
+        stubs = {}
+        for attachment, stub in attachments.items():
+            if "data" in stub.keys():
+                content = base64.b64decode(stub["data"])
+                digest = "md5-" + base64.b64encode(hashlib.md5(content).digest()).decode()
+                db["blobs"][digest] = content
+                stubs[attachment] = {"content_type": stub.get("content_type", "application/octet-stream"), "revpos": generation, "digest": digest, "length": len(content), "stub": True}
+            elif "digest" in stub.keys() and stub["digest"] in db["blobs"].keys():
+                stubs[attachment] = dict(stub, stub=True, revpos=stub.get("revpos", generation))
+            elif attachment in held.keys():
+                stubs[attachment] = held[attachment]
+            else:
+                return attachment
+        return stubs
+
+    # _local documents: no revisions history, never in _all_docs or _changes
+    def _local(self, method, db, doc_id, query, headers, data):
+        current = db["local"].get(doc_id)
+        if method in ("GET", "HEAD"):
+            if current is None:
+                raise EmulatedError(404, "not_found", "missing")
+            return 200, current
+        if method == "PUT":
+            if type(data) is not dict:
+                raise EmulatedError(400, "bad_request", "Document must be a JSON object")
+            revision = query.get("rev") or data.get("_rev")
+            if current is not None and revision != current["_rev"]:
+                raise EmulatedError(409, "conflict", "Document update conflict.")
+            generation = int(current["_rev"].split("-")[1]) + 1 if current is not None else 1
+            doc = dict(data)
+            doc["_id"] = doc_id
+            doc["_rev"] = f"0-{generation}"
+            db["local"][doc_id] = doc
+            return 201, {"ok": True, "id": doc_id, "rev": doc["_rev"]}
+        if method == "DELETE":
+            if current is None:
+                raise EmulatedError(404, "not_found", "missing")
+            del db["local"][doc_id]
+            return 200, {"ok": True, "id": doc_id, "rev": "0-0"}
+        raise EmulatedError(405, "method_not_allowed", "Only DELETE,GET,HEAD,PUT allowed")
+
+    # Writes a document revision, returns the _bulk_docs style result row
+    def _write(self, name, db, doc_id, data, revision, new_edits=True):
+        if doc_id.startswith("_") and not doc_id.startswith("_design/"):
+            return {"id": doc_id, "error": "illegal_docid", "reason": "Only reserved document ids may start with underscore."}
+        current = db["docs"].get(doc_id)
+        if not new_edits:
+            # Replicated revision stored as is, kept when it wins over the current one
+            if "-" not in str(data.get("_rev", "")):
+                return {"id": doc_id, "error": "bad_request", "reason": "new_edits=false requires a _rev"}
+            if current is not None and int(current["_rev"].split("-")[0]) >= int(data["_rev"].split("-")[0]):
+                return {"id": doc_id, "rev": data["_rev"]}
+            generation, revision_id = data["_rev"].split("-", 1)
+            size = len(json.dumps(data, default=str))
+        else:
+            if current is not None and not current.get("_deleted"):
+                if revision != current["_rev"]:
+                    return {"id": doc_id, "error": "conflict", "reason": "Document update conflict."}
+            elif current is not None and revision is not None and revision != current["_rev"]:
+                return {"id": doc_id, "error": "conflict", "reason": "Document update conflict."}
+            elif current is None and revision is not None:
+                return {"id": doc_id, "error": "conflict", "reason": "Document update conflict."}
+            generation = int(current["_rev"].split("-")[0]) + 1 if current is not None else 1
+            if data.get("_attachments") and not data.get("_deleted"):
+                attachments = self._stubs(db, current, data["_attachments"], generation)
+                if type(attachments) is str:
+                    return {"id": doc_id, "error": "missing_stub", "reason": f"Invalid attachment stub in {doc_id} for {attachments}"}
+                data = dict(data, _attachments=attachments)
+            body = {key: value for key, value in data.items() if key not in ("_id", "_rev")}
+            digest = json.dumps([current["_rev"] if current is not None else None, body], sort_keys=True, default=str)
+            revision_id = hashlib.md5(digest.encode()).hexdigest()
+            size = len(digest)
+        doc = {"_id": doc_id, "_rev": f"{generation}-{revision_id}"}
+        if data.get("_deleted"):
+            doc["_deleted"] = True
+        else:
+            for key, value in data.items():
+                if key in ("_id", "_rev", "_revisions", "_conflicts", "_deleted_conflicts", "_local_seq", "_revs_info"):
+                    continue
+                doc[key] = value
+        db["seq"] += 1
+        self._forget(db, doc_id)
+        # Re-inserted so the dict stays in sequence order, which is what _changes walks
+        db["docs"][doc_id] = doc
+        db["order"][doc_id] = db["seq"]
+        db["sizes"][doc_id] = size
+        db["bytes"] += size
+        db["live"] += 0 if doc.get("_deleted") else 1
+        self.writes += 1
+        self._db_updated(name, "updated")
+        return {"ok": True, "id": doc_id, "rev": doc["_rev"]}
+
+    def _bulk_docs(self, name, db, data):
+        if type(data) is not dict or type(data.get("docs")) is not list:
+            raise EmulatedError(400, "bad_request", "POST body must include `docs` parameter.")
+        new_edits = data.get("new_edits", True)
+        results = []
+        for doc in data["docs"]:
+            if type(doc) is not dict:
+                raise EmulatedError(400, "bad_request", "Document must be a JSON object")
+            result = self._write(name, db, doc.get("_id") or uuid.uuid4().hex, doc, doc.get("_rev"), new_edits=new_edits)
+            if new_edits:
+                results.append(result)
+        return 201, results
+
+    def _bulk_get(self, db, data):
+        if type(data) is not dict or type(data.get("docs")) is not list:
+            raise EmulatedError(400, "bad_request", "Missing JSON list of 'docs'.")
+        results = []
+        for request in data["docs"]:
+            doc_id = request.get("id")
+            current = db["docs"].get(doc_id)
+            self.reads += 1
+            if current is None or current.get("_deleted") or ("rev" in request.keys() and request["rev"] != current["_rev"]):
+                reason = "deleted" if current is not None and current.get("_deleted") and "rev" not in request.keys() else "missing"
+                results.append({"id": doc_id, "docs": [{"error": {"id": doc_id, "rev": request.get("rev", "undefined"), "error": "not_found", "reason": reason}}]})
+            else:
+                results.append({"id": doc_id, "docs": [{"ok": dict(current)}]})
+        return 200, {"results": results}
+
+    def _all_docs(self, db, query, data):
+        include_docs = query.get("include_docs") == "true"
+        keys = None
+        if type(data) is dict and "keys" in data.keys():
+            keys = data["keys"]
+        elif "keys" in query.keys():
+            keys = json.loads(query["keys"])
+        elif "key" in query.keys():
+            keys = [json.loads(query["key"])]
+        if keys is not None:
+            rows = []
+            for key in keys:
+                doc = db["docs"].get(key)
+                if doc is None:
+                    rows.append({"key": key, "error": "not_found"})
+                    continue
+                row = {"id": key, "key": key, "value": {"rev": doc["_rev"]}}
+                if doc.get("_deleted"):
+                    row["value"]["deleted"] = True
+                if include_docs:
+                    row["doc"] = None if doc.get("_deleted") else dict(doc)
+                rows.append(row)
+            return 200, {"total_rows": db["live"], "offset": None, "rows": rows}
+        ids = sorted(doc_id for doc_id, doc in db["docs"].items() if not doc.get("_deleted"))
+        selected = self._key_range(ids, query)
+        ordered = list(reversed(ids)) if query.get("descending") == "true" else ids
+        offset = ordered.index(selected[0]) if selected else len(ids)
+        rows = []
+        for doc_id in selected:
+            doc = db["docs"][doc_id]
+            row = {"id": doc_id, "key": doc_id, "value": {"rev": doc["_rev"]}}
+            if include_docs:
+                row["doc"] = dict(doc)
+            rows.append(row)
+        self.reads += len(rows) if include_docs else 0
+        return 200, {"total_rows": len(ids), "offset": offset, "rows": rows}
+
+    # View query over rows mapped on the fly, sorted by key collation then doc id
+    def _view(self, name, db, ddoc, view, query, data):
+        design = db["docs"].get(f"_design/{ddoc}")
+        if design is None or design.get("_deleted"):
+            raise EmulatedError(404, "not_found", "missing")
+        definition = (design.get("views") or {}).get(view)
+        if definition is None:
+            raise EmulatedError(404, "not_found", "missing_named_view")
+        if (name, ddoc, view) not in self.views.keys():
+            raise EmulatedError(501, "not_implemented", f"JavaScript map functions are not run, register _design/{ddoc}/_view/{view} with Emulator.define_view")
+        mapper, reducer = self.views[(name, ddoc, view)]
+        reducer = reducer or definition.get("reduce")
+        rows = []
+        for doc_id, doc in db["docs"].items():
+            if doc.get("_deleted") or doc_id.startswith("_design/"):
+                continue
+            for key, value in mapper(doc) or ():
+                rows.append((collate(key), doc_id, key, value))
+        rows.sort(key=lambda row: (row[0], row[1]))
+        descending = query.get("descending") == "true"
+        if descending:
+            rows.reverse()
+        total = len(rows)
+        keys = None
+        if type(data) is dict and "keys" in data.keys():
+            keys = data["keys"]
+        elif "keys" in query.keys():
+            keys = json.loads(query["keys"])
+        elif "key" in query.keys():
+            keys = [json.loads(query["key"])]
+        if keys is not None:
+            selected = [row for key in keys for row in rows if row[0] == collate(key)]
+        else:
+            selected = [row for row in rows if self._in_view_range(row, query, descending)]
+        reduced = reducer is not None and query.get("reduce", "true") != "false"
+        include_docs = query.get("include_docs") == "true"
+        if reduced and include_docs:
+            raise EmulatedError(400, "query_parse_error", "`include_docs` is invalid for reduce")
+        if reduced:
+            group_level = self._int(query, "group_level")
+            if query.get("group") == "true":
+                group_level = "exact"
+            output = []
+            for row in selected:
+                key = None
+                if group_level == "exact":
+                    key = row[2]
+                elif group_level is not None:
+                    key = row[2][:group_level] if type(row[2]) is list else row[2]
+                if output and output[-1]["key"] == key:
+                    output[-1]["keys"].append(row[2])
+                    output[-1]["values"].append(row[3])
+                else:
+                    output.append({"key": key, "keys": [row[2]], "values": [row[3]]})
+            output = [{"key": group["key"], "value": self._reduce(reducer, group["keys"], group["values"])} for group in output]
+        else:
+            output = []
+            for row in selected:
+                item = {"id": row[1], "key": row[2], "value": row[3]}
+                if include_docs:
+                    item["doc"] = dict(db["docs"][row[1]])
+                output.append(item)
+        skip = self._int(query, "skip", 0)
+        output = output[skip:]
+        if "limit" in query.keys():
+            output = output[:self._int(query, "limit")]
+        self.reads += len(output) if include_docs else 0
+        if reduced:
+            return 200, {"rows": output}
+        offset = rows.index(selected[0]) + skip if selected else total
+        return 200, {"total_rows": total, "offset": offset, "rows": output}
+
+    # startkey / endkey with their doc ids and inclusive_end, for a (collated key, doc id, key, value) row
+    def _in_view_range(self, row, query, descending):
+        position = (row[0], row[1])
+        start = query.get("startkey", query.get("start_key"))
+        if start is not None:
+            start = collate(json.loads(start))
+            start_id = query.get("startkey_docid", query.get("start_key_doc_id"))
+            bound = (start, start_id) if start_id is not None else None
+            if descending and not (position <= bound if bound else row[0] <= start):
+                return False
+            if not descending and not (position >= bound if bound else row[0] >= start):
+                return False
+        end = query.get("endkey", query.get("end_key"))
+        if end is not None:
+            end = collate(json.loads(end))
+            end_id = query.get("endkey_docid", query.get("end_key_doc_id"))
+            bound = (end, end_id) if end_id is not None else None
+            inclusive = query.get("inclusive_end", "true") != "false"
+            if descending:
+                beyond = (position < bound if inclusive else position <= bound) if bound else (row[0] < end if inclusive else row[0] <= end)
+            else:
+                beyond = (position > bound if inclusive else position >= bound) if bound else (row[0] > end if inclusive else row[0] >= end)
+            if beyond:
+                return False
+        return True
+
+    def _reduce(self, reducer, keys, values):
+        if reducer == "_count":
+            return len(values)
+        if reducer == "_sum":
+            return sum(values)
+        if reducer == "_stats":
+            return {"sum": sum(values), "count": len(values), "min": min(values), "max": max(values), "sumsqr": sum(value * value for value in values)}
+        if callable(reducer):
+            return reducer(keys, values)
+        raise EmulatedError(501, "not_implemented", f"Only the built-in reduces and Python ones are run, not {reducer}")
+
+    # startkey / endkey / inclusive_end / descending / skip / limit over sorted names
+    def _key_range(self, names, query):
+        descending = query.get("descending") == "true"
+        if descending:
+            names = list(reversed(names))
+        start = query.get("startkey", query.get("start_key"))
+        end = query.get("endkey", query.get("end_key"))
+        inclusive_end = query.get("inclusive_end", "true") != "false"
+        if start is not None:
+            start = json.loads(start)
+            names = [name for name in names if (name <= start if descending else name >= start)]
+        if end is not None:
+            end = json.loads(end)
+            if inclusive_end:
+                names = [name for name in names if (name >= end if descending else name <= end)]
+            else:
+                names = [name for name in names if (name > end if descending else name < end)]
+        skip = int(query.get("skip", "0"))
+        names = names[skip:]
+        if "limit" in query.keys():
+            names = names[:int(query["limit"])]
+        return names
+
+    def _changes(self, db, query, data):
+        feed = query.get("feed", "normal")
+        since = self._since(query.get("since", "0"), db["seq"])
+        limit = self._int(query, "limit")
+        include_docs = query.get("include_docs") == "true"
+        descending = query.get("descending") == "true" and feed == "normal"
+        filter_name = query.get("filter")
+        doc_ids = None
+        selector = None
+        if filter_name == "_doc_ids":
+            doc_ids = set((data or {}).get("doc_ids") or json.loads(query.get("doc_ids", "[]")))
+        elif filter_name == "_selector":
+            selector = (data or {}).get("selector")
+            if type(selector) is not dict:
+                raise EmulatedError(400, "bad_request", "Selector must be specified in POST payload")
+        elif filter_name == "_design":
+            pass
+        elif filter_name:
+            raise EmulatedError(501, "not_implemented", f"Filter functions are not emulated: {filter_name}")
+
+        def rows(since):
+            since = self._since(since, db["seq"])
+            found = []
+            for doc_id, doc in db["docs"].items():
+                seq = db["order"][doc_id]
+                if seq <= since:
+                    continue
+                if doc_ids is not None and doc_id not in doc_ids:
+                    continue
+                if filter_name == "_design" and not doc_id.startswith("_design/"):
+                    continue
+                if selector is not None and (doc.get("_deleted") or not match(doc, selector)):
+                    continue
+                change = {"seq": self._seq(seq), "id": doc_id, "changes": [{"rev": doc["_rev"]}]}
+                if doc.get("_deleted"):
+                    change["deleted"] = True
+                if include_docs:
+                    change["doc"] = dict(doc)
+                found.append(change)
+            return found, self._seq(db["seq"])
+        if feed == "continuous":
+            return 200, Feed(self, rows, self._seq(since), limit=limit, heartbeat=self._int(query, "heartbeat"), timeout=self._int(query, "timeout", 60000))
+        if feed == "longpoll":
+            self._wait(lambda: rows(self._seq(since))[0], self._int(query, "timeout", 60000))
+        found, last_seq = rows(self._seq(since))
+        if descending:
+            found.reverse()
+        pending = 0
+        if limit is not None and len(found) > limit:
+            pending = len(found) - limit
+            found = found[:limit]
+            last_seq = found[-1]["seq"] if found else last_seq
+        return 200, {"results": found, "last_seq": last_seq, "pending": pending}
+
+    # Mango _find and _explain
+    def _find(self, name, db, data, explain=False):
+        if type(data) is not dict or type(data.get("selector")) is not dict:
+            raise EmulatedError(400, "missing_required_key", "Missing required key: selector")
+        started = time.perf_counter()
+        selector = data["selector"]
+        limit = data.get("limit", 25)
+        skip = data.get("skip", 0)
+        if data.get("bookmark") and data["bookmark"] != "nil":
+            try:
+                skip = json.loads(base64.urlsafe_b64decode(data["bookmark"].encode()))[0]
+            except (ValueError, IndexError, TypeError):
+                raise EmulatedError(400, "invalid_bookmark", f"Invalid bookmark value: {data['bookmark']}")
+        index = self._pick_index(db, selector, data.get("use_index"))
+        if explain:
+            return 200, {
+                "dbname": name,
+                "index": index,
+                "partitioned": False,
+                "selector": selector,
+                "opts": {"use_index": data.get("use_index", []), "bookmark": data.get("bookmark", "nil"), "limit": limit, "skip": skip, "sort": data.get("sort", {}), "fields": data.get("fields", []), "r": [49], "conflicts": False},
+                "limit": limit,
+                "skip": skip,
+                "fields": data.get("fields", "all_fields")
+            }
+        candidates = [doc for doc_id, doc in sorted(db["docs"].items()) if not doc.get("_deleted") and not doc_id.startswith("_design/")]
+        docs = [doc for doc in candidates if match(doc, selector)]
+        for entry in reversed(data.get("sort", [])):
+            field, direction = (entry, "asc") if type(entry) is str else next(iter(entry.items()))
+            docs.sort(key=lambda doc: collate(get_field(doc, field)[1]), reverse=direction == "desc")
+        page = docs[skip:skip + limit]
+        fields = data.get("fields")
+        response = {
+            "docs": [project(doc, fields) if fields else dict(doc) for doc in page],
+            "bookmark": base64.urlsafe_b64encode(json.dumps([skip + len(page)]).encode()).decode() if page else "nil"
+        }
+        self.reads += len(candidates)
+        if index["type"] == "special":
+            response["warning"] = FULL_SCAN_WARNING
+        if data.get("execution_stats"):
+            response["execution_stats"] = {
+                "total_keys_examined": 0,
+                "total_docs_examined": len(candidates),
+                "total_quorum_docs_examined": 0,
+                "results_returned": len(page),
+                "execution_time_ms": round((time.perf_counter() - started) * 1000, 3)
+            }
+        return 200, response
+
+    # Mango indexes live in design documents with "language": "query", as in CouchDB
+    def _indexes(self, db):
+        indexes = [{"ddoc": None, "name": "_all_docs", "type": "special", "def": {"fields": [{"_id": "asc"}]}}]
+        for doc_id, doc in sorted(db["docs"].items()):
+            if doc_id.startswith("_design/") and not doc.get("_deleted") and doc.get("language") == "query":
+                for index_name, view in doc.get("views", {}).items():
+                    indexes.append({"ddoc": doc_id, "name": index_name, "type": "json", "partitioned": False, "def": view["options"]["def"]})
+        return indexes
+
+    def _pick_index(self, db, selector, use_index):
+        indexes = self._indexes(db)
+        wanted = [use_index] if type(use_index) is str else (use_index or [])
+        for index in indexes[1:]:
+            fields = [next(iter(field)) if type(field) is dict else field for field in index["def"]["fields"]]
+            if wanted and index["ddoc"] not in (f"_design/{wanted[0]}", wanted[0]):
+                continue
+            if len(wanted) > 1 and index["name"] != wanted[1]:
+                continue
+            if fields and fields[0] in selector.keys():
+                return index
+        return indexes[0]
+
+    def _index(self, method, name, db, segments, data):
+        if method == "GET":
+            indexes = self._indexes(db)
+            return 200, {"total_rows": len(indexes), "indexes": indexes}
+        if method == "POST":
+            if type(data) is not dict or type(data.get("index")) is not dict or not data["index"].get("fields"):
+                raise EmulatedError(400, "missing_required_key", "Missing required key: index")
+            fields = [{field: "asc"} if type(field) is str else field for field in data["index"]["fields"]]
+            digest = hashlib.sha1(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+            index_name = data.get("name") or digest
+            ddoc_id = data.get("ddoc") or digest
+            ddoc_id = ddoc_id if ddoc_id.startswith("_design/") else f"_design/{ddoc_id}"
+            ddoc = db["docs"].get(ddoc_id)
+            if ddoc is not None and not ddoc.get("_deleted") and index_name in ddoc.get("views", {}).keys():
+                return 200, {"result": "exists", "id": ddoc_id, "name": index_name}
+            content = dict(ddoc) if ddoc is not None and not ddoc.get("_deleted") else {"language": "query", "views": {}}
+            content["views"] = dict(content.get("views", {}))
+            content["views"][index_name] = {"map": {"fields": {next(iter(field)): value for field in fields for value in field.values()}, "partial_filter_selector": data["index"].get("partial_filter_selector", {})}, "reduce": "_count", "options": {"def": {"fields": fields}}}
+            self._write(name, db, ddoc_id, content, ddoc["_rev"] if ddoc is not None else None)
+            return 200, {"result": "created", "id": ddoc_id, "name": index_name}
+        if method == "DELETE" and len(segments) >= 3:
+            # _index/{ddoc}/json/{name}, the ddoc with or without its _design/ prefix
+            if segments[0] == "_design":
+                segments = segments[1:]
+            ddoc_id = f"_design/{segments[0]}"
+            index_name = segments[-1]
+            ddoc = db["docs"].get(ddoc_id)
+            if ddoc is None or ddoc.get("_deleted") or index_name not in ddoc.get("views", {}).keys():
+                raise EmulatedError(404, "not_found", "Index not found")
+            content = dict(ddoc)
+            content["views"] = {key: value for key, value in ddoc["views"].items() if key != index_name}
+            if content["views"]:
+                self._write(name, db, ddoc_id, content, ddoc["_rev"])
+            else:
+                self._write(name, db, ddoc_id, {"_deleted": True}, ddoc["_rev"])
+            return 200, {"ok": True}
+        raise EmulatedError(405, "method_not_allowed", "Only GET,POST,DELETE allowed")
+
+    # Drops a document and its counters, before a new revision or on purge
+    def _forget(self, db, doc_id):
+        doc = db["docs"].pop(doc_id, None)
+        if doc is None:
+            return
+        del db["order"][doc_id]
+        db["bytes"] -= db["sizes"].pop(doc_id)
+        db["live"] -= 0 if doc.get("_deleted") else 1
+
+    def _purge(self, name, db, data):
+        if type(data) is not dict:
+            raise EmulatedError(400, "bad_request", "Purge body must be a JSON object")
+        purged = {}
+        for doc_id, revisions in data.items():
+            doc = db["docs"].get(doc_id)
+            if doc is not None and doc["_rev"] in revisions:
+                self._forget(db, doc_id)
+                purged[doc_id] = [doc["_rev"]]
+            else:
+                purged[doc_id] = []
+        db["purge_seq"] += 1
+        self._db_updated(name, "updated")
+        return 201, {"purge_seq": None, "purged": purged}
+
+    # Blocks until ready() has something or timeout_ms passed, the lock is released meanwhile
+    def _wait(self, ready, timeout_ms):
+        deadline = time.monotonic() + timeout_ms / 1000
+        while not ready():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self.changed.wait(remaining)
+
+    def _since(self, since, current):
+        if since == "now":
+            return current
+        try:
+            return int(str(since).split("-")[0])
+        except ValueError:
+            raise EmulatedError(400, "bad_request", "Malformed sequence supplied in 'since' parameter.")
+
+    def _seq(self, seq):
+        if type(seq) is str:
+            return seq
+        return f"{seq}-g1AAAAemulated"
+
+    def _int(self, query, key, default=None):
+        if key not in query.keys():
+            return default
+        try:
+            return int(query[key])
+        except ValueError:
+            raise EmulatedError(400, "query_parse_error", f"Invalid value for integer: \"{query[key]}\"")
+
+
+# Emulator Transport Class - stands in for the ConnectionPool of a Server, nothing touches the network
+# Server("emulator", transport=EmulatorTransport()) runs the whole object model in memory
+class EmulatorTransport(object):
+    def __init__(self, emulator=None):
+        self.emulator = emulator if emulator is not None else Emulator()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def request(self, method, url, headers={}, body=None):
+        status, response_headers, payload = self.emulator.handle(method, url, headers, body)
+        if type(payload) is not bytes:
+            payload = b"".join(payload)
+        return PoolResponse(status, REASONS.get(status, ""), response_headers, payload)
+
+    def stream(self, method, url, headers={}, body=None, chunk_size=65536):
+        status, response_headers, payload = self.emulator.handle(method, url, headers, body)
+        if type(payload) is bytes:
+            return PoolStream(status, REASONS.get(status, ""), response_headers, iter([payload]), None)
+        return PoolStream(status, REASONS.get(status, ""), response_headers, iter(payload), payload.close)
+
+    # The data lives on in the emulator, there are no connections to close
+    def close(self):
+        pass
+
+
+# Async Emulator Transport Class - the same for an AsyncServer, feeds wait in a worker thread
+class AsyncEmulatorTransport(object):
+    def __init__(self, emulator=None):
+        self.transport = EmulatorTransport(emulator)
+        self.emulator = self.transport.emulator
+
+    async def open(self):
+        pass
+
+    async def request(self, method, url, headers={}, body=None):
+        if "feed=" in url:
+            return await asyncio.get_running_loop().run_in_executor(None, self.transport.request, method, url, headers, body)
+        return self.transport.request(method, url, headers, body)
+
+    async def close(self):
+        pass
@@ -0,0 +1,178 @@
+import fnmatch
+import logging
+import threading
+import time
+
+# Database info fields kept per database
+KEPT_FIELDS = ("doc_count", "doc_del_count", "update_seq", "purge_seq", "sizes")
+
+
+# Fleet Snapshot Class - sizes, doc counts and update_seq of every database, kept between calls
+# The first read loads every database with batched _dbs_info, later reads older than ttl seconds only
+# ask _db_updates which databases were created, updated or deleted since, and fetch the info of those
+# full_every: seconds between full reloads, None for never (a failing _db_updates always falls back to one)
+# include / exclude: fnmatch patterns on database names
+# Reads never wait on each other: while one caller refreshes, the others get the data held
+class FleetSnapshot(object):
+    def __init__(self, server, ttl=30, include=None, exclude=None, chunk_size=100, concurrency=4, full_every=None):
+        self.server = server
+        self.ttl = ttl
+        self.include = [include] if type(include) is str else include
+        self.exclude = [exclude] if type(exclude) is str else exclude
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.full_every = full_every
+        self.since = None
+        self.refreshed = None
+        self.loaded = None
+        self.errors = {}
+        self._databases = {}
+        self._lock = threading.Lock()
+        self._refreshing = threading.RLock()
+
+    # Seconds since the last refresh, None before the first one
+    @property
+    def age(self):
+        if self.refreshed is None:
+            return None
+        return time.monotonic() - self.refreshed
+
+    # Database name -> info (doc_count, doc_del_count, update_seq, purge_seq, sizes, refreshed)
+    def databases(self):
+        self._fresh()
+        with self._lock:
+            return dict(self._databases)
+
+    def get(self, name):
+        self._fresh()
+        with self._lock:
+            return self._databases.get(name)
+
+    def __len__(self):
+        self._fresh()
+        return len(self._databases)
+
+    # Sums over the fleet
+    def totals(self):
+        databases = self.databases()
+        totals = {
+            "databases": len(databases),
+            "doc_count": 0,
+            "doc_del_count": 0,
+            "file": 0,
+            "active": 0,
+            "external": 0
+        }
+        for info in databases.values():
+            totals["doc_count"] += info.get("doc_count") or 0
+            totals["doc_del_count"] += info.get("doc_del_count") or 0
+            for size in ("file", "active", "external"):
+                totals[size] += (info.get("sizes") or {}).get(size) or 0
+        return totals
+
+    # Brings the snapshot up to date now, full reloads every database
+    def refresh(self, full=False):
+        logger = logging.getLogger('FleetSnapshot::refresh')
+        with self._refreshing:
+            started = time.monotonic()
+            if not full and self.since is not None and (self.full_every is None or started - self.loaded < self.full_every):
+                result = self._update()
+                if result is not None:
+                    self.refreshed = started
+                    return result
+                logger.warning("_db_updates failed, reloading every database")
+            result = self._load()
+            if result is not None:
+                self.refreshed = started
+                self.loaded = started
+            return result
+
+    def _fresh(self):
+        if self.refreshed is not None and time.monotonic() - self.refreshed < self.ttl:
+            return
+        if not self._refreshing.acquire(blocking=self.refreshed is None):
+            # Someone else is refreshing, the data held will do
+            return
+        try:
+            if self.refreshed is None or time.monotonic() - self.refreshed >= self.ttl:
+                self.refresh()
+        finally:
+            self._refreshing.release()
+
+    # Every database: the _db_updates position first, so nothing written during the load is missed
+    def _load(self):
+        logger = logging.getLogger('FleetSnapshot::_load')
+        position = self.server.db_updates(since="now")
+        names = self.server.all_dbs()
+        if type(names) is not list:
+            logger.error(f"Invalid List!! {names}")
+            return None
+        names = self._selected(names)
+        databases = self._fetch(names)
+        with self._lock:
+            # Databases that failed this time keep what was known of them
+            for name in names:
+                if name in self.errors.keys() and name in self._databases.keys():
+                    databases[name] = self._databases[name]
+            self._databases = databases
+        self.since = position.get("last_seq") if type(position) is dict else None
+        logger.debug(f"Loaded {len(databases)} databases")
+        return {"full": True, "refreshed": len(databases), "removed": 0, "databases": len(databases)}
+
+    # Only the databases _db_updates reports since the last refresh, None when the feed can't be read
+    def _update(self):
+        logger = logging.getLogger('FleetSnapshot::_update')
+        updates = self.server.db_updates(since=self.since)
+        if type(updates) is not dict or "results" not in updates.keys():
+            logger.error(f"Error reading _db_updates: {updates}")
+            return None
+        # Last event of each database wins
+        events = {}
+        for row in updates["results"]:
+            name = row.get("db_name")
+            if name is not None:
+                events[name] = row.get("type")
+        names = self._selected(list(events.keys()))
+        changed = [name for name in names if events[name] != "deleted"]
+        deleted = [name for name in names if events[name] == "deleted"]
+        fetched = self._fetch(changed) if changed else {}
+        with self._lock:
+            for name in deleted:
+                self._databases.pop(name, None)
+            for name in changed:
+                if name in fetched.keys():
+                    self._databases[name] = fetched[name]
+                elif name not in self.errors.keys():
+                    # Gone again by the time its info was asked
+                    self._databases.pop(name, None)
+            databases = len(self._databases)
+        self.since = updates.get("last_seq", self.since)
+        logger.debug(f"{len(fetched)} databases refreshed, {len(deleted)} removed")
+        return {"full": False, "refreshed": len(fetched), "removed": len(deleted), "databases": databases}
+
+    # Batched _dbs_info, name -> kept fields, failures recorded in errors
+    def _fetch(self, names):
+        rows = self.server.dbs_info(names, chunk_size=self.chunk_size, concurrency=self.concurrency)
+        if type(rows) is not list:
+            rows = [{"key": name, "error": "error", "reason": rows} for name in names]
+        now = time.time()
+        databases = {}
+        for row in rows:
+            name = row.get("key")
+            info = row.get("info")
+            if info is None:
+                if row.get("error") != "not_found":
+                    self.errors[name] = row
+                continue
+            self.errors.pop(name, None)
+            kept = {field: info[field] for field in KEPT_FIELDS if field in info.keys()}
+            kept["refreshed"] = now
+            databases[name] = kept
+        return databases
+
+    def _selected(self, names):
+        if self.include:
+            names = [name for name in names if any(fnmatch.fnmatchcase(name, pattern) for pattern in self.include)]
+        if self.exclude:
+            names = [name for name in names if not any(fnmatch.fnmatchcase(name, pattern) for pattern in self.exclude)]
+        return names
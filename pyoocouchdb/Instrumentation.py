@@ -0,0 +1,236 @@
+import collections
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Placeholder for a path segment, by the segment before it
+PLACEHOLDERS = {
+    None: "{db}",
+    "{db}": "{doc}",
+    "{doc}": "{attachment}",
+    "_design": "{ddoc}",
+    "_local": "{doc}",
+    "_view": "{view}",
+    "_show": "{func}",
+    "_list": "{func}",
+    "_update": "{func}",
+    "_node": "{node}",
+    "_config": "{section}",
+    "{section}": "{key}",
+    "_index": "{ddoc}",
+}
+
+
+# Endpoint template of a path, e.g. mydb/abc123 -> {db}/{doc}, mydb/_design/app/_view/by_x -> {db}/_design/{ddoc}/_view/{view}
+def endpoint_template(path):
+    template = []
+    previous = None
+    for segment in path.strip("/").split("/"):
+        if not segment:
+            continue
+        if segment.startswith("_") and previous == "_node":
+            # _node/_local stands for the node answering
+            template.append(segment)
+            previous = "{node}"
+        elif segment.startswith("_") and previous not in ("_design", "_local"):
+            template.append(segment)
+            previous = segment
+        else:
+            placeholder = PLACEHOLDERS.get(previous, "{id}")
+            template.append(placeholder)
+            previous = placeholder
+    return "/".join(template) or "/"
+
+
+# Bytes in a request body, 0 for files and iterators sent as they are read
+def body_size(body):
+    try:
+        return len(body) if body else 0
+    except TypeError:
+        return 0
+
+
+# Request Info Class - what hooks get to see about a request
+class RequestInfo(object):
+    def __init__(self, method, url, endpoint, bytes_sent):
+        self.method = method
+        self.url = url
+        self.endpoint = endpoint
+        self.bytes_sent = bytes_sent
+        self.bytes_received = 0
+        self.status = None
+        self.error = None
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+    def __repr__(self):
+        return f"<RequestInfo {self.method} {self.endpoint} {self.status} {self.elapsed}>"
+
+
+# Histogram Class - fixed millisecond buckets, quantiles are bucket upper bounds
+class Histogram(object):
+    BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, float("inf"))
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, milliseconds):
+        for index, bound in enumerate(self.BUCKETS):
+            if milliseconds <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.total += milliseconds
+        self.max = max(self.max, milliseconds)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        for index, bound in enumerate(self.BUCKETS):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+            "buckets": {str(bound): count for bound, count in zip(self.BUCKETS, self.counts) if count}
+        }
+
+
+# Tracker Class - requests and time spent inside a "with instrumentation.track()" block
+class Tracker(object):
+    def __init__(self, instrumentation):
+        self.instrumentation = instrumentation
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.request_time = 0.0
+        self.elapsed = None
+        self.by_endpoint = collections.Counter()
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self.instrumentation._add_tracker(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrumentation._remove_tracker(self)
+        self.elapsed = time.perf_counter() - self._started
+
+    def record(self, info):
+        self.requests += 1
+        if info.error is not None or (info.status is not None and info.status >= 400):
+            self.errors += 1
+        self.bytes_sent += info.bytes_sent
+        self.bytes_received += info.bytes_received
+        self.request_time += info.elapsed
+        self.by_endpoint[f"{info.method} {info.endpoint}"] += 1
+
+
+# Instrumentation Class - hooks, counters and latency histograms around every request of a Server
+# pre hooks are called with a RequestInfo before the request is sent, post hooks once it completed
+class Instrumentation(object):
+    def __init__(self):
+        self.pre_hooks = []
+        self.post_hooks = []
+        self._lock = threading.Lock()
+        self._trackers = []
+        self._endpoints = {}
+
+    def add_pre_hook(self, hook):
+        self.pre_hooks.append(hook)
+
+    def add_post_hook(self, hook):
+        self.post_hooks.append(hook)
+
+    def remove_hook(self, hook):
+        if hook in self.pre_hooks:
+            self.pre_hooks.remove(hook)
+        if hook in self.post_hooks:
+            self.post_hooks.remove(hook)
+
+    # Records every request made through the server while the block runs, whatever the thread
+    def track(self):
+        return Tracker(self)
+
+    # Called by Core right before a request
+    def before(self, method, url, root, body=None):
+        path = urlsplit(url).path
+        root_path = urlsplit(root).path
+        if path.startswith(root_path):
+            path = path[len(root_path):]
+        info = RequestInfo(method, url, endpoint_template(path), body_size(body))
+        for hook in self.pre_hooks:
+            hook(info)
+        return info
+
+    # Called by Core once a request completed or failed
+    def after(self, info, status=None, bytes_received=0, error=None):
+        info.elapsed = time.perf_counter() - info.started
+        info.status = status
+        info.bytes_received = bytes_received
+        info.error = error
+        key = f"{info.method} {info.endpoint}"
+        with self._lock:
+            if key not in self._endpoints:
+                self._endpoints[key] = {
+                    "count": 0,
+                    "errors": 0,
+                    "bytes_sent": 0,
+                    "bytes_received": 0,
+                    "status": collections.Counter(),
+                    "latency": Histogram()
+                }
+            endpoint = self._endpoints[key]
+            endpoint["count"] += 1
+            if error is not None or (status is not None and status >= 400):
+                endpoint["errors"] += 1
+            endpoint["bytes_sent"] += info.bytes_sent
+            endpoint["bytes_received"] += bytes_received
+            endpoint["status"][status if error is None else "error"] += 1
+            endpoint["latency"].observe(info.elapsed * 1000)
+            for tracker in self._trackers:
+                tracker.record(info)
+        for hook in self.post_hooks:
+            hook(info)
+        return info
+
+    # Counters and latency percentiles (ms) per "METHOD endpoint template"
+    def stats(self):
+        with self._lock:
+            return {
+                key: {
+                    "count": endpoint["count"],
+                    "errors": endpoint["errors"],
+                    "bytes_sent": endpoint["bytes_sent"],
+                    "bytes_received": endpoint["bytes_received"],
+                    "status": dict(endpoint["status"]),
+                    "latency_ms": endpoint["latency"].snapshot()
+                }
+                for key, endpoint in self._endpoints.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+
+    def _add_tracker(self, tracker):
+        with self._lock:
+            self._trackers.append(tracker)
+
+    def _remove_tracker(self, tracker):
+        with self._lock:
+            self._trackers.remove(tracker)
@@ -0,0 +1,223 @@
+import http.client
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+from .Pool import requests_module, body_position, rewind
+if requests_module:
+    import requests
+
+POLICIES = ("round_robin", "least_outstanding", "latency")
+# Methods that can be sent again to another node whatever happened to the first attempt
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+# POST endpoints that only read
+READ_ONLY_POSTS = ("_all_docs", "_find", "_explain", "_bulk_get", "_dbs_info", "_changes", "_revs_diff")
+
+TRANSPORT_ERRORS = (OSError, http.client.HTTPException)
+NOT_SENT_ERRORS = (ConnectionRefusedError,)
+# Answers that tell a node is unwell, a 500 is CouchDB reporting an application error (broken view, os_process_error)
+FAILURE_STATUSES = (502, 503, 504)
+if requests_module:
+    TRANSPORT_ERRORS = TRANSPORT_ERRORS + (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    NOT_SENT_ERRORS = NOT_SENT_ERRORS + (requests.exceptions.ConnectTimeout,)
+
+
+# True when a request may be sent to another node after it failed on the wire
+def can_failover(method, url, error=None):
+    if error is not None and isinstance(error, NOT_SENT_ERRORS):
+        return True
+    if method in IDEMPOTENT_METHODS:
+        return True
+    path = urlsplit(url).path.rstrip("/")
+    return method == "POST" and (path.rsplit("/", 1)[-1] in READ_ONLY_POSTS or "/_view/" in path)
+
+
+# Node Endpoint Class - one cluster node as seen by the balancer
+class NodeEndpoint(object):
+    def __init__(self, netloc):
+        self.netloc = netloc
+        self.outstanding = 0
+        self.latency = None
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0
+        self.ejected_until = 0
+
+    def status(self):
+        return {
+            "node": self.netloc,
+            "healthy": self.ejected_until <= time.monotonic(),
+            "outstanding": self.outstanding,
+            "latency_ms": round(self.latency * 1000, 3) if self.latency is not None else None,
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_failures": self.failures
+        }
+
+
+# Load Balancer Class - spreads the requests of a Server over several cluster nodes
+# It has the ConnectionPool interface (request / stream / close) and routes every URL aimed at
+# one of the `routed` host:port to a node picked by `policy`:
+#   round_robin: nodes in turn, least_outstanding: fewest requests in flight,
+#   latency: random pick weighted by the inverse of each node's smoothed latency
+# max_failures: consecutive transport errors or 502/503/504 answers that eject a node for eject_seconds
+# health_interval: seconds between background _up checks re-admitting (or ejecting) nodes, None disables them
+# Requests failing on the wire go to another node when resending them is safe (see can_failover)
+class LoadBalancer(object):
+    def __init__(self, pool, nodes, routed=None, policy="round_robin", max_failures=3, eject_seconds=30, health_interval=None, health_headers=None, scheme="http"):
+        logger = logging.getLogger('LoadBalancer::__init__')
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown balancing policy {policy}, expected one of {POLICIES}")
+        self.pool = pool
+        self.policy = policy
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        self.health_headers = dict(health_headers or {})
+        self.scheme = scheme
+        self.nodes = []
+        self.routed = set(routed or [])
+        self._lock = threading.Lock()
+        self._next = 0
+        for netloc in nodes:
+            self.add_node(netloc)
+        logger.debug(f"Balancing over {[node.netloc for node in self.nodes]} with {policy}")
+        self._stopped = threading.Event()
+        self._health_thread = None
+        if health_interval:
+            self._health_thread = threading.Thread(target=self._health_loop, name="pyoocouchdb-health", daemon=True)
+            self._health_thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Adds a node, accepting host:port or a URL
+    def add_node(self, node):
+        netloc = urlsplit(node).netloc if "//" in node else node
+        with self._lock:
+            if any(existing.netloc == netloc for existing in self.nodes):
+                return
+            self.nodes.append(NodeEndpoint(netloc))
+            self.routed.add(netloc)
+
+    def remove_node(self, node):
+        netloc = urlsplit(node).netloc if "//" in node else node
+        with self._lock:
+            self.nodes = [existing for existing in self.nodes if existing.netloc != netloc]
+
+    # Per node counters
+    def status(self):
+        with self._lock:
+            return [node.status() for node in self.nodes]
+
+    def request(self, method, url, headers={}, body=None):
+        return self._send(self.pool.request, method, url, headers, body)
+
+    def stream(self, method, url, headers={}, body=None, chunk_size=65536):
+        return self._send(self.pool.stream, method, url, headers, body, chunk_size=chunk_size)
+
+    def close(self):
+        self._stopped.set()
+        self.pool.close()
+
+    # Asks every node for _up, admitting the ones that answer and ejecting the others
+    def check(self):
+        logger = logging.getLogger('LoadBalancer::check')
+        for node in list(self.nodes):
+            try:
+                response = self.pool.request("GET", f"{self.scheme}://{node.netloc}/_up", headers=dict(self.health_headers, Host=node.netloc))
+                healthy = response.status == 200
+            except TRANSPORT_ERRORS as te:
+                logger.debug(f"{node.netloc} health check failed: {te}")
+                healthy = False
+            with self._lock:
+                if healthy:
+                    if node.ejected_until:
+                        logger.info(f"Node {node.netloc} is back")
+                    node.failures = 0
+                    node.ejected_until = 0
+                else:
+                    node.failures = max(node.failures, self.max_failures)
+                    node.ejected_until = time.monotonic() + self.eject_seconds
+        return self.status()
+
+    def _health_loop(self):
+        while not self._stopped.wait(self.health_interval):
+            self.check()
+
+    def _send(self, send, method, url, headers, body, **kwargs):
+        logger = logging.getLogger('LoadBalancer::_send')
+        parts = urlsplit(url)
+        if parts.netloc not in self.routed:
+            return send(method, url, headers, body, **kwargs)
+        tried = []
+        last_error = None
+        position = body_position(body)
+        while True:
+            node = self._pick(exclude=tried)
+            if node is None:
+                if last_error is not None:
+                    raise last_error
+                raise ConnectionError(f"No cluster node to send {method} {url} to")
+            tried.append(node)
+            node_headers = dict(headers)
+            node_headers["Host"] = node.netloc
+            started = time.perf_counter()
+            try:
+                response = send(method, urlunsplit((parts.scheme, node.netloc, parts.path, parts.query, parts.fragment)), node_headers, body, **kwargs)
+            except TRANSPORT_ERRORS as te:
+                self._done(node, None, failed=True)
+                last_error = te
+                if not can_failover(method, url, te) or not rewind(body, position):
+                    raise
+                logger.warning(f"{method} on {node.netloc} failed ({te}), trying another node")
+                continue
+            self._done(node, time.perf_counter() - started, failed=response.status in FAILURE_STATUSES)
+            return response
+
+    # Next node by policy, among the admitted ones not tried yet (ejected ones only if nothing else is left)
+    def _pick(self, exclude=()):
+        with self._lock:
+            candidates = [node for node in self.nodes if node not in exclude]
+            if not candidates:
+                return None
+            now = time.monotonic()
+            admitted = [node for node in candidates if node.ejected_until <= now]
+            if admitted:
+                candidates = admitted
+            if self.policy == "least_outstanding":
+                fewest = min(node.outstanding for node in candidates)
+                candidates = [node for node in candidates if node.outstanding == fewest]
+            if self.policy == "latency" and len(candidates) > 1:
+                known = [node.latency for node in candidates if node.latency is not None]
+                # Nodes without a measure yet get the best known latency, so they are tried soon
+                best = min(known) if known else 1.0
+                weights = [1 / max(node.latency if node.latency is not None else best, 1e-6) for node in candidates]
+                node = random.choices(candidates, weights=weights)[0]
+            else:
+                node = candidates[self._next % len(candidates)]
+                self._next += 1
+            node.outstanding += 1
+            return node
+
+    def _done(self, node, elapsed, failed=False):
+        logger = logging.getLogger('LoadBalancer::_done')
+        with self._lock:
+            node.outstanding -= 1
+            node.requests += 1
+            if elapsed is not None:
+                node.latency = elapsed if node.latency is None else node.latency * 0.8 + elapsed * 0.2
+            if failed:
+                node.errors += 1
+                node.failures += 1
+                if node.failures >= self.max_failures:
+                    if node.ejected_until <= time.monotonic():
+                        logger.warning(f"Ejecting node {node.netloc} for {self.eject_seconds}s after {node.failures} failures")
+                    node.ejected_until = time.monotonic() + self.eject_seconds
+            else:
+                node.failures = 0
+                node.ejected_until = 0
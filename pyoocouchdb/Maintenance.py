@@ -0,0 +1,93 @@
+import fnmatch
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .Database import Database
+
+
+# Maintenance Runner Class - runs a per-database action across the fleet
+# include / exclude: fnmatch patterns on database names
+# order: None (server order), "name", "size" (biggest file first) or "fragmentation" (most reclaimable bytes first)
+# progress: callable(name, row, done, total) called as each database finishes
+class MaintenanceRunner(object):
+    def __init__(self, server, concurrency=4, include=None, exclude=None, order=None, progress=None):
+        self.server = server
+        self.concurrency = concurrency
+        self.include = [include] if type(include) is str else include
+        self.exclude = [exclude] if type(exclude) is str else exclude
+        self.order = order
+        self.progress = progress
+
+    # Database names to process, filtered and ordered
+    def databases(self):
+        logger = logging.getLogger('MaintenanceRunner::databases')
+        db_list = self.server.all_dbs()
+        if type(db_list) is not list:
+            logger.error(f"Invalid List!! {db_list}")
+            return db_list
+        if self.include:
+            db_list = [name for name in db_list if any(fnmatch.fnmatchcase(name, pattern) for pattern in self.include)]
+        if self.exclude:
+            db_list = [name for name in db_list if not any(fnmatch.fnmatchcase(name, pattern) for pattern in self.exclude)]
+        if self.order == "name":
+            db_list = sorted(db_list)
+        elif self.order in ("size", "fragmentation") and db_list:
+            sizes = {}
+            for row in self.server.dbs_info(db_list):
+                if "info" in row.keys() and "sizes" in row["info"].keys():
+                    file_size = row["info"]["sizes"].get("file", 0)
+                    active_size = row["info"]["sizes"].get("active", 0)
+                    sizes[row["key"]] = file_size if self.order == "size" else file_size - active_size
+            db_list = sorted(db_list, key=lambda name: sizes.get(name, 0), reverse=True)
+        return db_list
+
+    # Runs action ("compact", "sync_shards" or a callable taking a Database) on every database
+    def run(self, action):
+        logger = logging.getLogger('MaintenanceRunner::run')
+        db_list = self.databases()
+        if type(db_list) is not list:
+            return db_list
+        result = {
+            "processed": 0,
+            "ok": 0,
+            "errors": 0,
+            "elapsed": 0,
+            "rows": {}
+        }
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {executor.submit(self._run_one, action, name): name for name in db_list}
+            for future in as_completed(futures):
+                name = futures[future]
+                row = future.result()
+                result["processed"] += 1
+                if row["ok"]:
+                    result["ok"] += 1
+                else:
+                    result["errors"] += 1
+                result["rows"][name] = row
+                logger.info(f"{name} done in {row['elapsed']:.3f}s ({result['processed']}/{len(db_list)})")
+                if self.progress is not None:
+                    self.progress(name, row, result["processed"], len(db_list))
+        result["elapsed"] = time.monotonic() - started
+        return result
+
+    def _run_one(self, action, name):
+        started = time.monotonic()
+        db = Database(server=self.server, name=name, lazy=True)
+        try:
+            if callable(action):
+                response = action(db)
+            else:
+                response = getattr(db, action)()
+        except Exception as e:
+            response = {
+                'status': 'error',
+                'fullerror': e.__str__()
+            }
+        ok = type(response) is dict and "error" not in response.keys() and response.get("status") != "error"
+        return {
+            "ok": ok,
+            "response": response,
+            "elapsed": time.monotonic() - started
+        }
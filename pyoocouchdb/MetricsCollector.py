@@ -0,0 +1,300 @@
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from .Node import Node
+from .Pool import ConnectionPool
+from .LoadBalancer import LoadBalancer
+
+# _system fields that only grow
+SYSTEM_COUNTERS = ("context_switches", "reductions", "garbage_collection_count", "words_reclaimed", "io_input", "io_output")
+UNSAFE_NAME = re.compile(r"[^a-zA-Z0-9_]")
+# _stats groups whose members become a label of one family
+LABELLED_GROUPS = {
+    "httpd_request_methods": ("method", "number of HTTP requests by method"),
+    "httpd_status_codes": ("code", "number of HTTP responses by status code")
+}
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def metric_name(*parts):
+    return UNSAFE_NAME.sub("_", "_".join(str(part) for part in parts if part != ""))
+
+
+# Series of a _stats tree: (family, sample, type, help, labels, value)
+# Counters get the _total suffix, histograms become summaries (percentiles as quantiles, n as _count)
+# The couchdb group is named after the prefix alone, httpd methods and status codes become labels
+def flatten_stats(stats, path, labels=None, description=None):
+    series = []
+    for key, item in stats.items():
+        if type(item) is not dict:
+            continue
+        if "type" not in item.keys() or "value" not in item.keys():
+            if key in LABELLED_GROUPS.keys():
+                label, group_description = LABELLED_GROUPS[key]
+                for member, leaf in item.items():
+                    series.extend(flatten_stats({key: leaf}, path, dict(labels or {}, **{label: member}), group_description))
+            else:
+                series.extend(flatten_stats(item, path if len(path) == 1 and key == path[0] else path + [key], labels))
+            continue
+        family = metric_name(*path, key)
+        kind = item["type"]
+        value = item["value"]
+        help_text = description or item.get("desc", "")
+        if kind == "histogram" and type(value) is dict:
+            for percentile, measure in value.get("percentile", []):
+                series.append((family, family, "summary", help_text, dict(labels or {}, quantile=str(percentile / 100)), measure))
+            if value.get("n") is not None:
+                series.append((family, f"{family}_count", "summary", help_text, dict(labels or {}), value["n"]))
+                series.append((family, f"{family}_sum", "summary", help_text, dict(labels or {}), (value.get("arithmetic_mean") or 0) * value["n"]))
+        elif type(value) in (int, float):
+            if kind == "counter":
+                series.append((f"{family}_total", f"{family}_total", "counter", help_text, dict(labels or {}), value))
+            else:
+                series.append((family, family, "gauge", help_text, dict(labels or {}), value))
+    return series
+
+
+# Series of a _system answer, Erlang VM figures with the memory, queue and peer breakdowns as labels
+def flatten_system(system, prefix):
+    series = []
+    for key, value in system.items():
+        if key == "memory" and type(value) is dict:
+            family = metric_name(prefix, "erlang_memory_bytes")
+            for kind, size in value.items():
+                series.append((family, family, "gauge", "Erlang VM memory by type", {"memory_type": kind}, size))
+        elif key == "message_queues" and type(value) is dict:
+            family = metric_name(prefix, "erlang_message_queue")
+            for queue, length in value.items():
+                # Pools of processes report count/min/max/..., single processes a plain length
+                length = length.get("count") if type(length) is dict else length
+                series.append((family, family, "gauge", "Messages waiting in an Erlang process queue", {"queue": queue}, length))
+        elif key == "distribution" and type(value) is dict:
+            for peer, figures in value.items():
+                for figure, amount in (figures or {}).items():
+                    if figure == "send_pend":
+                        family = metric_name(prefix, "erlang_distribution", figure)
+                        series.append((family, family, "gauge", f"Erlang distribution {figure}", {"peer": peer}, amount))
+                    else:
+                        family = metric_name(prefix, "erlang_distribution", figure, "total")
+                        series.append((family, family, "counter", f"Erlang distribution {figure}", {"peer": peer}, amount))
+        elif type(value) in (int, float):
+            if key in SYSTEM_COUNTERS:
+                family = metric_name(prefix, "erlang", key, "total")
+                series.append((family, family, "counter", f"Erlang VM {key}", {}, value))
+            else:
+                family = metric_name(prefix, "erlang", key)
+                series.append((family, family, "gauge", f"Erlang VM {key}", {}, value))
+    return series
+
+
+# Scrape Server Class - the server as Node sees it, with the collector's own pool in place of the server's
+class ScrapeServer(object):
+    def __init__(self, server, pool):
+        self._server = server
+        self.pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self._server, name)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_value(value):
+    if type(value) is bool:
+        return "1" if value else "0"
+    if type(value) is float:
+        return repr(value) if value == value else "NaN"
+    return str(value)
+
+
+# Metrics Collector Class - scrapes _stats and _system of every cluster node at once
+# nodes: node names, discovered from _membership when None (then _local for a single node)
+# timeout: seconds a scrape waits for the nodes, the ones still busy are reported down for that scrape
+#   Scrapes go through a pool of their own, 2 connections per node with timeout as socket timeout, so a
+#   slow node neither holds the server's connections nor keeps a request running past the next scrape
+#   (a transport given to the Server, e.g. an EmulatorTransport, is used as it is)
+# max_age: seconds a scrape is reused by metrics(), so concurrent HTTP scrapers share one
+# export_rates: also render the per second rate of every counter between the last two scrapes
+# After scrape(): series holds (family, sample, type, help, labels, value), rates the counter
+# (sample, labels) -> {"delta", "rate"} since the scrape before, nodes the per node up/duration/error
+class MetricsCollector(object):
+    def __init__(self, server, nodes=None, timeout=5, prefix="couchdb", max_age=1, export_rates=False):
+        self.server = server
+        self.nodes = nodes
+        self.timeout = timeout
+        self.prefix = prefix
+        self.max_age = max_age
+        self.export_rates = export_rates
+        self.series = []
+        self.rates = {}
+        self.node_status = {}
+        self.scraped = None
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_size = 0
+        self._abandoned = False
+
+    # Node names to scrape
+    def discover(self):
+        logger = logging.getLogger('MetricsCollector::discover')
+        if self.nodes:
+            return list(self.nodes)
+        membership = self.server.membership()
+        names = membership.get("cluster_nodes") or membership.get("all_nodes") if type(membership) is dict else None
+        if not names:
+            logger.warning(f"No cluster nodes found ({membership}), scraping _local")
+            return ["_local"]
+        return names
+
+    # One concurrent scrape of every node, returns the per node status
+    def scrape(self):
+        logger = logging.getLogger('MetricsCollector::scrape')
+        names = self.discover()
+        started = time.monotonic()
+        server = self._scrape_server(2 * len(names))
+        executor = ThreadPoolExecutor(max_workers=2 * len(names), thread_name_prefix="pyoocouchdb-metrics")
+        futures = {}
+        for name in names:
+            node = Node(server, name)
+            futures[executor.submit(self._timed, node.stats)] = (name, "stats")
+            futures[executor.submit(self._timed, node.system)] = (name, "system")
+        done, pending = wait(futures.keys(), timeout=self.timeout)
+        # Requests still running are left behind, they end with their socket timeout on a pool the next scrape no longer uses
+        executor.shutdown(wait=False, cancel_futures=True)
+        self._abandoned = len(pending) > 0
+        status = {name: {"up": True, "duration": 0, "error": None} for name in names}
+        series = []
+        for future, (name, part) in futures.items():
+            if future not in done:
+                status[name]["up"] = False
+                status[name]["error"] = f"timed out after {self.timeout}s"
+                status[name]["duration"] = self.timeout
+                continue
+            answer, elapsed = future.result()
+            status[name]["duration"] = max(status[name]["duration"], elapsed)
+            if type(answer) is not dict or "error" in answer.keys() or answer.get("status") == "error":
+                status[name]["up"] = False
+                status[name]["error"] = answer
+                continue
+            found = flatten_stats(answer, [self.prefix]) if part == "stats" else flatten_system(answer, self.prefix)
+            series.extend((family, sample, kind, description, dict(labels, node=name), value) for family, sample, kind, description, labels, value in found)
+        for name, state in status.items():
+            if not state["up"]:
+                logger.warning(f"Scraping {name} failed: {state['error']}")
+            series.append((metric_name(self.prefix, "up"), metric_name(self.prefix, "up"), "gauge", "1 when the node answered _stats and _system", {"node": name}, 1 if state["up"] else 0))
+            series.append((metric_name(self.prefix, "scrape_duration_seconds"), metric_name(self.prefix, "scrape_duration_seconds"), "gauge", "Seconds the node took to answer", {"node": name}, round(state["duration"], 6)))
+        self._compute_rates(series, time.monotonic())
+        self.series = series
+        self.node_status = status
+        self.scraped = time.monotonic()
+        logger.debug(f"Scraped {len(names)} nodes, {len(series)} series in {self.scraped - started:.3f}s")
+        return status
+
+    # Prometheus text exposition of the last scrape
+    def render(self):
+        families = {}
+        for family, sample, kind, description, labels, value in self.series:
+            if value is None:
+                continue
+            families.setdefault(family, (kind, description, []))[2].append((sample, labels, value))
+        if self.export_rates:
+            for (sample, labels), rate in self.rates.items():
+                family = f"{sample[:-len('_total')] if sample.endswith('_total') else sample}_per_second"
+                families.setdefault(family, ("gauge", f"Rate of {sample} between the last two scrapes", []))[2].append((family, dict(labels), rate["rate"]))
+        lines = []
+        for family, (kind, description, samples) in families.items():
+            lines.append(f"# HELP {family} {description.replace(chr(92), chr(92) * 2).replace(chr(10), ' ')}")
+            lines.append(f"# TYPE {family} {kind}")
+            for sample, labels, value in samples:
+                rendered = ",".join(f'{key}="{escape_label(label)}"' for key, label in labels.items())
+                lines.append(f"{sample}{{{rendered}}} {format_value(value)}" if rendered else f"{sample} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    # Text of a scrape no older than max_age, scraping again when needed
+    def metrics(self):
+        with self._lock:
+            if self.scraped is None or time.monotonic() - self.scraped >= self.max_age:
+                self.scrape()
+            return self.render()
+
+    # Serves metrics() on http://host:port/metrics from a daemon thread, returns the HTTP server (shutdown() stops it)
+    def serve(self, port=9985, host="127.0.0.1"):
+        logger = logging.getLogger('MetricsCollector::serve')
+        httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+        httpd.daemon_threads = True
+        httpd.collector = self
+        threading.Thread(target=httpd.serve_forever, name="pyoocouchdb-metrics-http", daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{httpd.server_address[1]}/metrics")
+        return httpd
+
+    # Closes the scrape pool
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    # Server for one scrape's Nodes, its pool sized for the requests of the scrape and replaced after a scrape left some behind
+    def _scrape_server(self, requests):
+        logger = logging.getLogger('MetricsCollector::_scrape_server')
+        if self.server.transport is not None:
+            return self.server
+        if self._pool is None or self._pool_size < requests or self._abandoned:
+            logger.debug(f"New scrape pool of {requests} connections, {self.timeout}s timeout")
+            self.close()
+            pool = ConnectionPool(size=requests, per_host=requests, timeout=self.timeout)
+            balancer = self.server._balancer()
+            if balancer is not None:
+                pool = LoadBalancer(pool, [node.netloc for node in balancer.nodes], routed=balancer.routed, policy=balancer.policy, scheme=balancer.scheme)
+            self._pool = pool
+            self._pool_size = requests
+        return ScrapeServer(self.server, self._pool)
+
+    def _timed(self, call):
+        started = time.monotonic()
+        answer = call()
+        return answer, time.monotonic() - started
+
+    # Delta and per second rate of every counter against the scrape before, a reset counts from zero
+    def _compute_rates(self, series, now):
+        counters = {}
+        rates = {}
+        for family, sample, kind, description, labels, value in series:
+            if kind != "counter" or value is None:
+                continue
+            key = (sample, tuple(sorted(labels.items())))
+            counters[key] = (value, now)
+            if key in self._counters.keys():
+                previous, then = self._counters[key]
+                delta = value - previous if value >= previous else value
+                rates[(sample, key[1])] = {"delta": delta, "rate": delta / (now - then) if now > then else 0.0}
+        self._counters = counters
+        self.rates = rates
+
+
+# Metrics Handler Class - GET /metrics for a MetricsCollector.serve
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logging.getLogger('MetricsHandler::log_message').debug(format % args)
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        try:
+            body = self.server.collector.metrics().encode()
+            status = 200
+        except Exception as e:
+            logging.getLogger('MetricsHandler::do_GET').critical(e.__str__())
+            body = f"# scrape failed: {e}\n".encode()
+            status = 500
+        self.send_response(status)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
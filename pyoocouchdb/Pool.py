@@ -0,0 +1,260 @@
+import http.client
+import io
+import json
+import logging
+import threading
+from urllib.parse import urlsplit
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    requests_module = True
+except ModuleNotFoundError as err:
+    requests_module = False
+
+BLOCK_SIZE = 65536
+
+
+# Read position of a file body, so a request can be sent again from the same place
+def body_position(body):
+    if body is None or not hasattr(body, "read"):
+        return None
+    try:
+        return body.tell()
+    except (OSError, ValueError, AttributeError, io.UnsupportedOperation):
+        return None
+
+
+# True when the body can go out a second time: bytes, or a file rewound to where it started
+def rewind(body, position):
+    if body is None or type(body) in (bytes, bytearray, str, memoryview):
+        return True
+    if position is None:
+        return False
+    try:
+        body.seek(position)
+        return True
+    except (OSError, ValueError, io.UnsupportedOperation):
+        return False
+
+
+# Real file behind a body, for sendfile
+def body_fileno(body):
+    if not hasattr(body, "read") or not hasattr(body, "fileno"):
+        return None
+    try:
+        return body.fileno()
+    except (OSError, ValueError, io.UnsupportedOperation):
+        return None
+
+
+# Uniform response handed back to Core, whatever module did the work
+class PoolResponse(object):
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = {key.lower(): value for key, value in headers.items()}
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body.decode())
+
+    def text(self):
+        return self.body.decode(errors='replace')
+
+
+# Streamed response, the connection goes back to the pool once it is read or closed
+class PoolStream(object):
+    def __init__(self, status, reason, headers, chunks, release):
+        self.status = status
+        self.reason = reason
+        self.headers = {key.lower(): value for key, value in headers.items()}
+        self._chunks = chunks
+        self._release = release
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def iter_content(self):
+        try:
+            for chunk in self._chunks:
+                if chunk:
+                    yield chunk
+        finally:
+            self.close()
+
+    # Whole remaining body, for error responses
+    def read(self):
+        return b"".join(self.iter_content())
+
+    def close(self):
+        if self._release is not None:
+            release = self._release
+            self._release = None
+            release()
+
+
+# Connection Pool Class - Keep-alive connections shared by everything hanging from a Server
+class ConnectionPool(object):
+    # Initialization
+    # size: connections in flight across all hosts (host pools kept when using requests)
+    # per_host: connections allowed at the same time against a single host
+    def __init__(self, size=10, per_host=10, timeout=None):
+        logger = logging.getLogger('ConnectionPool::__init__')
+        self.size = size
+        self.per_host = per_host
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        if requests_module:
+            logger.debug(f"Mounting requests session with {size} host pools of {per_host} connections")
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=size, pool_maxsize=per_host, pool_block=True)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+        else:
+            logger.debug(f"Using http.client pool with {size} connections, {per_host} per host")
+            self.session = None
+            self._idle = {}
+            self._host_slots = {}
+            self._slots = threading.BoundedSemaphore(size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Sends a request through a pooled connection and returns a PoolResponse
+    def request(self, method, url, headers={}, body=None):
+        if self.session is not None:
+            response = self.session.request(method=method, url=url, headers=headers, data=body, timeout=self.timeout)
+            return PoolResponse(response.status_code, response.reason, response.headers, response.content)
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        host_slots = self._host_semaphore(key)
+        self._slots.acquire()
+        host_slots.acquire()
+        try:
+            conn, reused = self._checkout(key)
+            position = body_position(body)
+            try:
+                response = self._send(conn, method, path, headers, body)
+            except (http.client.HTTPException, ConnectionError):
+                conn.close()
+                if not reused or not rewind(body, position):
+                    raise
+                # Server dropped an idle keep-alive connection, retry once on a fresh one
+                conn = self._connect(key)
+                response = self._send(conn, method, path, headers, body)
+            if response.will_close:
+                conn.close()
+            else:
+                self._checkin(key, conn)
+            return PoolResponse(response.status, response.reason, dict(response.getheaders()), response.data)
+        finally:
+            host_slots.release()
+            self._slots.release()
+
+    # Sends a request and returns a PoolStream whose body is read chunk by chunk
+    def stream(self, method, url, headers={}, body=None, chunk_size=65536):
+        if self.session is not None:
+            response = self.session.request(method=method, url=url, headers=headers, data=body, timeout=self.timeout, stream=True)
+            return PoolStream(response.status_code, response.reason, response.headers, response.iter_content(chunk_size), response.close)
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        host_slots = self._host_semaphore(key)
+        self._slots.acquire()
+        host_slots.acquire()
+        try:
+            conn, reused = self._checkout(key)
+            position = body_position(body)
+            try:
+                response = self._send(conn, method, path, headers, body, read=False)
+            except (http.client.HTTPException, ConnectionError):
+                conn.close()
+                if not reused or not rewind(body, position):
+                    raise
+                conn = self._connect(key)
+                response = self._send(conn, method, path, headers, body, read=False)
+        except BaseException:
+            host_slots.release()
+            self._slots.release()
+            raise
+
+        def chunks():
+            while True:
+                chunk = response.read1(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+        def release():
+            if response.isclosed() and not response.will_close:
+                self._checkin(key, conn)
+            else:
+                # Unread body left on the wire, the connection can't be reused
+                conn.close()
+            host_slots.release()
+            self._slots.release()
+        return PoolStream(response.status, response.reason, dict(response.getheaders()), chunks(), release)
+
+    # Closes every idle connection
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            return
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def _host_semaphore(self, key):
+        with self._lock:
+            if key not in self._host_slots:
+                self._host_slots[key] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[key]
+
+    # Bodies read from files and iterators go out in blocks of BLOCK_SIZE
+    def _connect(self, key):
+        scheme, netloc = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout, blocksize=BLOCK_SIZE)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout, blocksize=BLOCK_SIZE)
+
+    def _checkout(self, key):
+        with self._lock:
+            conns = self._idle.get(key)
+            if conns:
+                return conns.pop(), True
+        return self._connect(key), False
+
+    def _checkin(self, key, conn):
+        with self._lock:
+            self._idle.setdefault(key, []).append(conn)
+
+    def _send(self, conn, method, path, headers, body, read=True):
+        fileno = body_fileno(body)
+        if fileno is not None and any(name.lower() == "content-length" for name in headers.keys()):
+            # Regular file of known length: headers first, then the kernel copies the file to the socket
+            names = {name.lower() for name in headers.keys()}
+            conn.putrequest(method, path, skip_host="host" in names, skip_accept_encoding="accept-encoding" in names)
+            for name, value in headers.items():
+                conn.putheader(name, value)
+            conn.endheaders()
+            conn.sock.sendfile(body, offset=body.tell(), count=int(next(value for name, value in headers.items() if name.lower() == "content-length")))
+        else:
+            conn.request(method=method, url=path, body=body, headers=headers)
+        response = conn.getresponse()
+        if read:
+            response.data = response.read()
+        return response
@@ -0,0 +1,82 @@
+import logging
+from . import Core as f
+from .Stream import RowStream
+
+
+# Raised when a Mango query would be answered by scanning _all_docs
+class FullScanError(Exception):
+    pass
+
+
+# Find Iterator Class - streams _find results page by page following bookmarks
+# query: a full _find body, or just a selector
+# fields: projection sent to the server so only those fields travel
+# page_size: docs per request, limit: docs overall, the query's own limit when None
+# execution_stats: ask the server for stats, summed up across pages in .stats
+# on_full_scan: None, "warn" (log the server warning) or "raise" (check _explain first and raise FullScanError)
+class FindIterator(object):
+    def __init__(self, database, query, fields=None, sort=None, use_index=None, page_size=1000, limit=None, execution_stats=False, on_full_scan="warn"):
+        self.database = database
+        if "selector" not in query.keys():
+            query = {"selector": query}
+        self.query = dict(query)
+        if fields is not None:
+            self.query["fields"] = fields
+        if sort is not None:
+            self.query["sort"] = sort
+        if use_index is not None:
+            self.query["use_index"] = use_index
+        if execution_stats:
+            self.query["execution_stats"] = True
+        self.page_size = page_size
+        # limit and skip of the query apply to the whole result, not to each page
+        self.limit = limit if limit is not None else self.query.pop("limit", None)
+        self.skip = self.query.pop("skip", None)
+        self.on_full_scan = on_full_scan
+        self.stats = {}
+        self.warnings = []
+        self.pages = 0
+        self.bookmark = None
+
+    def __iter__(self):
+        logger = logging.getLogger('FindIterator::__iter__')
+        if self.on_full_scan == "raise":
+            plan = self.database.explain(self.query)
+            if plan.get("index", {}).get("type") == "special":
+                raise FullScanError(f"Query on {self.database.name} would scan _all_docs: {self.query['selector']}")
+        headers = {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+        yielded = 0
+        while True:
+            query = dict(self.query)
+            query["limit"] = self.page_size
+            if self.limit is not None:
+                query["limit"] = min(self.page_size, self.limit - yielded)
+            if self.bookmark is not None:
+                query["bookmark"] = self.bookmark
+            elif self.skip:
+                query["skip"] = self.skip
+            stream = f.endpoint_stream(self.database, endpoint='_find', headers=headers, json_data=query, method='POST')
+            docs = RowStream(stream, key="docs")
+            count = 0
+            for doc in docs:
+                count += 1
+                yielded += 1
+                yield doc
+            self.pages += 1
+            meta = docs.meta
+            if "error" in meta.keys():
+                logger.error(f"Error running query: {meta}")
+                return
+            for key, value in meta.get("execution_stats", {}).items():
+                self.stats[key] = self.stats.get(key, 0) + value
+            warning = meta.get("warning")
+            if warning and warning not in self.warnings:
+                self.warnings.append(warning)
+                if self.on_full_scan is not None:
+                    logger.warning(f"{self.database.name}: {warning}")
+            self.bookmark = meta.get("bookmark")
+            if count < query["limit"] or self.bookmark is None or (self.limit is not None and yielded >= self.limit):
+                return
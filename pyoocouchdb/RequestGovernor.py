@@ -0,0 +1,156 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+from .LoadBalancer import TRANSPORT_ERRORS, can_failover
+from .Pool import body_position, rewind
+
+# Statuses telling the client to slow down, 429 is refused before any work is done
+THROTTLED = (429, 503)
+OVERLOADED = (429, 502, 503, 504)
+
+
+# Seconds asked by a Retry-After header (delay or HTTP date), None when absent or unreadable
+def retry_after(headers):
+    value = (headers or {}).get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+# Request Governor Class - retries and adaptive concurrency limit in front of the pool
+# It has the ConnectionPool interface (request / stream / close) and:
+#   - lets at most `limit` requests in flight, the limit moving between min_limit and max_limit by AIMD:
+#     halved on 429/502/503/504 or a transport error, at most once per round trip (smoothed latency,
+#     or `cooldown` seconds when set), grown by 1/limit (about one per round trip) on every other answer
+#     while the limit is what holds the requests back
+#   - retries 429 always, 502/503/504 and transport errors when the request is safe to send again
+#     (see LoadBalancer.can_failover), up to `retries` times with full-jitter exponential backoff
+#     (random between 0 and min(max_backoff, backoff * 2**attempt)), waiting at least the Retry-After asked
+# When the retries are spent the last answer is returned (or the last error raised) as without a governor
+# Streams hold their slot until the headers arrive, so long feeds do not starve the other requests
+class RequestGovernor(object):
+    def __init__(self, pool, retries=5, backoff=0.1, max_backoff=10, limit=16, min_limit=1, max_limit=256, cooldown=None, max_retry_after=60):
+        self.pool = pool
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limit = float(limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.cooldown = cooldown
+        self.max_retry_after = max_retry_after
+        self.in_flight = 0
+        self.requests = 0
+        self.retried = 0
+        self.throttled = 0
+        self.gave_up = 0
+        self.latency = None
+        self._last_decrease = 0
+        self._slots = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def status(self):
+        with self._slots:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "latency_ms": round(self.latency * 1000, 3) if self.latency is not None else None,
+                "requests": self.requests,
+                "retried": self.retried,
+                "throttled": self.throttled,
+                "gave_up": self.gave_up
+            }
+
+    def request(self, method, url, headers={}, body=None):
+        return self._send(self.pool.request, method, url, headers, body)
+
+    def stream(self, method, url, headers={}, body=None, chunk_size=65536):
+        return self._send(self.pool.stream, method, url, headers, body, chunk_size=chunk_size)
+
+    def close(self):
+        self.pool.close()
+
+    def _send(self, send, method, url, headers, body, **kwargs):
+        logger = logging.getLogger('RequestGovernor::_send')
+        position = body_position(body)
+        attempt = 0
+        while True:
+            self._acquire()
+            error = None
+            response = None
+            started = time.perf_counter()
+            try:
+                response = send(method, url, headers, body, **kwargs)
+            except TRANSPORT_ERRORS as te:
+                error = te
+            finally:
+                self._release(time.perf_counter() - started, overloaded=error is not None or (response is not None and response.status in OVERLOADED))
+            if error is not None:
+                retryable = can_failover(method, url, error)
+                wait = None
+            else:
+                if response.status not in OVERLOADED:
+                    return response
+                retryable = response.status == 429 or can_failover(method, url)
+                wait = retry_after(response.headers)
+                if response.status in THROTTLED:
+                    with self._slots:
+                        self.throttled += 1
+            # Bodies read while sending (iterators, files that cannot seek) cannot go out twice
+            if retryable:
+                retryable = rewind(body, position)
+            if not retryable or attempt >= self.retries or (wait is not None and wait > self.max_retry_after):
+                with self._slots:
+                    self.gave_up += 1
+                if error is not None:
+                    raise error
+                return response
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            if wait is not None:
+                delay = max(delay, wait)
+            attempt += 1
+            with self._slots:
+                self.retried += 1
+            if response is not None and hasattr(response, "close"):
+                response.close()
+            logger.warning(f"{method} {url} got {error if error is not None else response.status}, retry {attempt}/{self.retries} in {delay:.3f}s")
+            time.sleep(delay)
+
+    def _acquire(self):
+        with self._slots:
+            while self.in_flight >= int(self.limit):
+                self._slots.wait()
+            self.in_flight += 1
+            self.requests += 1
+
+    def _release(self, elapsed, overloaded=False):
+        logger = logging.getLogger('RequestGovernor::_release')
+        with self._slots:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            now = time.monotonic()
+            if overloaded:
+                cooldown = self.cooldown if self.cooldown is not None else (self.latency or 0)
+                if now - self._last_decrease >= cooldown:
+                    self._last_decrease = now
+                    self.limit = max(float(self.min_limit), self.limit / 2)
+                    logger.info(f"Server overloaded, concurrency limit down to {int(self.limit)}")
+            else:
+                self.latency = elapsed if self.latency is None else self.latency * 0.9 + elapsed * 0.1
+                if saturated:
+                    self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._slots.notify_all()
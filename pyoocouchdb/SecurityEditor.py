@@ -0,0 +1,143 @@
+import copy
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+SECTIONS = ("admins", "members")
+KINDS = ("names", "roles")
+
+
+# Security Editor Class - queues add / remove operations on _security, applies them to many databases at once
+# Each database costs one GET and, only when the operations change something, one PUT
+# concurrency: databases edited at a time
+# verify: read _security back after the PUT and apply again, up to retries times, when a concurrent writer
+#   overwrote the change (the _security object has no revision to guard the write with)
+# Operations are chainable and apply in the order given:
+#   editor = server.security_editor()
+#   editor.add_member_role("tenant-a").add_admin_user("alice").remove_member_user("bob")
+#   report = editor.apply(["orders", "invoices"])
+class SecurityEditor(object):
+    def __init__(self, server, concurrency=8, verify=False, retries=2):
+        self.server = server
+        self.concurrency = concurrency
+        self.verify = verify
+        self.retries = retries
+        self.operations = []
+
+    def add(self, section, kind, value):
+        return self._queue("add", section, kind, value)
+
+    def remove(self, section, kind, value):
+        return self._queue("remove", section, kind, value)
+
+    def add_admin_user(self, username):
+        return self.add("admins", "names", username)
+
+    def remove_admin_user(self, username):
+        return self.remove("admins", "names", username)
+
+    def add_admin_role(self, role_name):
+        return self.add("admins", "roles", role_name)
+
+    def remove_admin_role(self, role_name):
+        return self.remove("admins", "roles", role_name)
+
+    def add_member_user(self, username):
+        return self.add("members", "names", username)
+
+    def remove_member_user(self, username):
+        return self.remove("members", "names", username)
+
+    def add_member_role(self, role_name):
+        return self.add("members", "roles", role_name)
+
+    def remove_member_role(self, role_name):
+        return self.remove("members", "roles", role_name)
+
+    def clear(self):
+        self.operations = []
+        return self
+
+    # The security object after the operations, and the diff {"added": {"members.roles": [...]}, "removed": {...}}
+    def edit(self, security):
+        edited = copy.deepcopy(security) if type(security) is dict else {}
+        added = {}
+        removed = {}
+        for action, section, kind, value in self.operations:
+            present = (edited.get(section) or {}).get(kind) or []
+            field = f"{section}.{kind}"
+            if action == "add" and value not in present:
+                edited.setdefault(section, {}).setdefault(kind, []).append(value)
+                if value in removed.get(field, []):
+                    removed[field].remove(value)
+                else:
+                    added.setdefault(field, []).append(value)
+            elif action == "remove" and value in present:
+                edited[section][kind].remove(value)
+                if value in added.get(field, []):
+                    added[field].remove(value)
+                else:
+                    removed.setdefault(field, []).append(value)
+        return edited, {
+            "added": {field: values for field, values in added.items() if values},
+            "removed": {field: values for field, values in removed.items() if values}
+        }
+
+    # Applies the operations to every database (names or Database objects), returns name -> report
+    # report: {"status": "updated" | "unchanged" | "error", "added": ..., "removed": ...}, errors carry fullerror
+    # dry_run: reads and diffs only, status "changed" instead of "updated"
+    def apply(self, databases, dry_run=False):
+        logger = logging.getLogger('SecurityEditor::apply')
+        names = [database if type(database) is str else database.name for database in databases]
+        logger.debug(f"Applying {len(self.operations)} operations to {len(names)} databases")
+        if self.concurrency <= 1 or len(names) <= 1:
+            reports = [self._apply_one(name, dry_run) for name in names]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(names))) as executor:
+                reports = list(executor.map(lambda name: self._apply_one(name, dry_run), names))
+        return dict(zip(names, reports))
+
+    def _queue(self, action, section, kind, value):
+        if section not in SECTIONS or kind not in KINDS:
+            raise ValueError(f"Unknown security field {section}.{kind}")
+        self.operations.append((action, section, kind, value))
+        return self
+
+    # One read-modify-write, the PUT only when the diff is not empty
+    def _apply_one(self, name, dry_run):
+        logger = logging.getLogger('SecurityEditor::_apply_one')
+        endpoint = f"{quote(name, safe='')}/_security"
+        headers = {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+        report = None
+        writes = 0
+        while True:
+            security = self.server.endpoint(endpoint=endpoint, method="GET")
+            if type(security) is not dict or "error" in security.keys() or security.get("status") == "error":
+                logger.error(f"Error reading the security of {name}: {security}")
+                return dict(report or {}, status="error", fullerror=security)
+            edited, diff = self.edit(security)
+            if report is None:
+                report = diff
+            if not diff["added"] and not diff["removed"]:
+                # Nothing to do, or the write read back intact
+                report["status"] = "updated" if writes else "unchanged"
+                return report
+            if dry_run:
+                report["status"] = "changed"
+                return report
+            if writes > self.retries:
+                logger.error(f"Security of {name} kept being overwritten")
+                return dict(report, status="error", fullerror=f"overwritten by a concurrent writer {writes} times")
+            if writes:
+                logger.warning(f"Security of {name} was overwritten, applying again")
+            answer = self.server.endpoint(endpoint=endpoint, headers=headers, json_data=edited, method="PUT")
+            writes += 1
+            if type(answer) is not dict or not answer.get("ok"):
+                logger.error(f"Error writing the security of {name}: {answer}")
+                return dict(report, status="error", fullerror=answer)
+            if not self.verify:
+                report["status"] = "updated"
+                return report
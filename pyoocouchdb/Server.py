@@ -1,19 +1,32 @@
 import logging
 import json
 import http.client
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
 from . import Core as f
 from .Database import Database
 from .Document import Document
 from .Node import Node
+from .Pool import ConnectionPool
+from .LoadBalancer import LoadBalancer
+from .RequestGovernor import RequestGovernor
+from .UUIDPool import UUIDPool
+from .Maintenance import MaintenanceRunner
+from .FleetSnapshot import FleetSnapshot
+from .MetricsCollector import MetricsCollector
+from .SecurityEditor import SecurityEditor
+from .Codec import get_codec
 
 MASTER_LOG_LEVEL = logging.DEBUG
 
 # Server Class - As in a CouchDB Instance/Cluster
 class Server(object):
     # Initialization
-    def __init__(self, hostname, port=5984, admin_port=5986, username="", password="", compatibility=False, log_level=MASTER_LOG_LEVEL):
+    def __init__(self, hostname, port=5984, admin_port=5986, username="", password="", compatibility=False, log_level=None, pool_size=10, pool_per_host=10, timeout=None, uuid_batch=1000, uuid_generator=None, cache=None, instrumentation=None, codec=None, transport=None, nodes=None, balance="round_robin", discover_nodes=False, health_interval=None, governor=None):
         logger = logging.getLogger('Server::__init__')
-        logging.basicConfig(level=log_level)
+        # Logging is left to the application unless a level is asked for explicitly
+        if log_level is not None:
+            logging.basicConfig(level=log_level)
         logger.debug('Initializing static variables')
         self.hostname = hostname
         self.admin_port = admin_port
@@ -25,11 +38,41 @@ class Server(object):
         self.url = f'http://{self.couchdb_host}/'
         self.admin_url = f'http://{self.admin_host}/'
         self.compatible=compatibility
+        self.auth_header = f.basic_auth_header(username, password)
+        # JSON codec for request and response bodies: None/"json", "orjson", "ujson", "fastest" or a dumps/loads object
+        self.codec = get_codec(codec)
+        # Keep-alive pool reused by every Database, Document and Node linked to this server
+        self.pool_size = pool_size
+        self.pool_per_host = pool_per_host
+        self.timeout = timeout
+        if getattr(self, "pool", None) is not None and self.pool is not transport:
+            self.pool.close()
+        # transport: anything with request/stream/close used instead of the pool, e.g. an EmulatorTransport
+        self.transport = transport
+        self.pool = transport if transport is not None else ConnectionPool(size=pool_size, per_host=pool_per_host, timeout=timeout)
+        # nodes: host:port of several cluster nodes, requests to hostname:port are spread over them with the balance
+        # policy (round_robin, least_outstanding, latency), discover_nodes adds the ones listed by _membership
+        self.nodes = nodes
+        self.balance = balance
+        self.discover_nodes = discover_nodes
+        self.health_interval = health_interval
+        if transport is None and (nodes or discover_nodes):
+            health_headers = {"Authorization": self.auth_header} if self.auth_header else {}
+            self.pool = LoadBalancer(self.pool, nodes or [self.couchdb_host], routed=[self.couchdb_host], policy=balance, health_interval=health_interval, health_headers=health_headers)
+        # governor: True or RequestGovernor settings (dict), retries with backoff and an adaptive concurrency limit
+        self.governor = governor
+        if transport is None and governor:
+            self.pool = RequestGovernor(self.pool, **(governor if type(governor) is dict else {}))
+        # Ids for new documents, prefetched from _uuids or made by uuid_generator
+        self.uuid_pool = UUIDPool(server=self, batch=uuid_batch, generator=uuid_generator)
+        # Opt-in DocumentCache shared by every database of this server
+        self.cache = cache
+        # Opt-in Instrumentation, sees every request made through this server
+        self.instrumentation = instrumentation
         try:
             response = f.endpoint_api(object=self, endpoint="")
-            logger.debug(f"Response from connection: {response}")
             if "error" not in response.keys():
-                logger.debug(f"Response:\n{json.dumps(response,indent=2)}")
+                logger.debug("Response: %s", f.Payload(response))
                 if "version" in response.keys():
                     self.version = response['version']
                 if "features" in response.keys():
@@ -38,12 +81,14 @@ class Server(object):
                     self.vendor = response['vendor']['name']
                 if "all_nodes" in response.keys():
                     self.all_nodes = self.membership()['all_nodes']
+                if discover_nodes and self._balancer() is not None:
+                    self.discover()
                 if "version" in dir(self):
                     logger.info(f'Connected to CouchDB v{self.version} instance on {self.hostname}')
                 else:
                     logger.info(f'Connected to CouchDB instance on {self.hostname}')
             else:
-                logger.info(f'Error connecting to CouchDB:\n{json.dumps(response,indent=2)}')
+                logger.info('Error connecting to CouchDB: %s', f.Payload(response))
         except http.client.HTTPException as he:
             logger.error('HTTPException while trying the connection')
             response = {
@@ -51,9 +96,51 @@ class Server(object):
                 "content": str(he)
             }
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     # Refresh connection
     def refresh_connection(self):
-        self.__init__(hostname=self.hostname, port=self.port, admin_port=self.admin_port, username=self.username, password=self.password)
+        self.__init__(hostname=self.hostname, port=self.port, admin_port=self.admin_port, username=self.username, password=self.password, compatibility=self.compatible, pool_size=self.pool_size, pool_per_host=self.pool_per_host, timeout=self.timeout, uuid_batch=self.uuid_pool.batch, uuid_generator=self.uuid_pool.generator, cache=self.cache, instrumentation=self.instrumentation, codec=self.codec, transport=self.transport, nodes=self.nodes, balance=self.balance, discover_nodes=self.discover_nodes, health_interval=self.health_interval, governor=self.governor)
+
+    # Adds the cluster nodes listed by _membership to the balancer, reached on the port of this server
+    def discover(self):
+        logger = logging.getLogger('Server::discover')
+        balancer = self._balancer()
+        if balancer is None:
+            logger.warning('Node discovery needs a Server built with nodes or discover_nodes')
+            return []
+        response = self.membership()
+        if "cluster_nodes" not in response.keys():
+            logger.error('Could not discover the cluster nodes: %s', f.Payload(response))
+            return [node["node"] for node in balancer.status()]
+        for name in response["cluster_nodes"]:
+            host = name.split("@", 1)[-1]
+            # A single node started without a name has nothing to balance over
+            if host in ("nohost", "127.0.0.1", "localhost"):
+                continue
+            balancer.add_node(f"{host}:{self.port}")
+        logger.debug(f"Balancing over {[node['node'] for node in balancer.status()]}")
+        return [node["node"] for node in balancer.status()]
+
+    # Per node state of the load balancer: health, requests in flight, latency and error counts
+    def nodes_status(self):
+        balancer = self._balancer()
+        if balancer is not None:
+            return balancer.status()
+        return [{"node": self.couchdb_host, "healthy": True}]
+
+    # LoadBalancer of this server, behind the RequestGovernor when there is one
+    def _balancer(self):
+        pool = self.pool.pool if isinstance(self.pool, RequestGovernor) else self.pool
+        return pool if isinstance(pool, LoadBalancer) else None
+
+    # Close pooled connections
+    def close(self):
+        self.pool.close()
 
     # API Endpoint Interaction
     def endpoint(self, endpoint, headers={}, data=None, json_data=None, method='GET', admin=False):
@@ -80,22 +167,44 @@ class Server(object):
         # self.refresh_connection()
         return self.endpoint(endpoint='_all_dbs', headers=headers)
 
-    # DBs Info
-    def dbs_info(self, dbs_list = None):
+    # DBs Info, asked chunk_size names per request (the server default limit is 100), concurrency requests at a time
+    # Rows keep the order of the names, a chunk that fails gives error rows for its names
+    def dbs_info(self, dbs_list = None, chunk_size=100, concurrency=4):
         logger = logging.getLogger('Server::dbs_info')
         if dbs_list is None:
             logger.debug("No dbs_list provided")
             dbs = self.all_dbs()
-            logger.debug(f"List from the server itself {dbs}")
+            logger.debug("List from the server itself %s", f.Payload(dbs))
         elif type(dbs_list) is str:
-            logger.debug(f"String list provided")
+            logger.debug("String list provided")
             dbs = dbs_list.split(',')
             if len(dbs) == 1:
                 dbs = dbs_list.split(' ')
-            logger.debug(f"DBs list: {dbs}")
+            logger.debug("DBs list: %s", f.Payload(dbs))
+        else:
+            dbs = list(dbs_list)
+            logger.debug("DBs list: %s", f.Payload(dbs))
+        if type(dbs) is not list:
+            logger.error("Invalid List!! %s", f.Payload(dbs))
+            return dbs
+        chunks = [dbs[start:start + chunk_size] for start in range(0, len(dbs), chunk_size)] or [[]]
+        logger.debug('Querying _dbs_info for %s databases in %s requests', len(dbs), len(chunks))
+        if len(chunks) == 1 or concurrency <= 1:
+            answers = [self._dbs_info_chunk(chunk) for chunk in chunks]
         else:
-            dbs = dbs_list
-            logger.debug(f"DBs list: {dbs}")
+            with ThreadPoolExecutor(max_workers=min(concurrency, len(chunks))) as executor:
+                answers = list(executor.map(self._dbs_info_chunk, chunks))
+        if len(answers) == 1:
+            return answers[0]
+        rows = []
+        for chunk, answer in zip(chunks, answers):
+            if type(answer) is list:
+                rows.extend(answer)
+            else:
+                rows.extend({"key": name, "error": answer.get("error", "error"), "reason": answer.get("reason") or answer.get("fullerror")} for name in chunk)
+        return rows
+
+    def _dbs_info_chunk(self, dbs):
         headers = {
             'Accept': 'application/json',
             'Content-Type': 'application/json'
@@ -103,10 +212,20 @@ class Server(object):
         json_data = {
             'keys': dbs
         }
-        logger.debug('Querying _dbs_info')
-        # self.refresh_connection()
         return self.endpoint(endpoint='_dbs_info', headers=headers, json_data=json_data, method='POST')
 
+    # Cached sizes, doc counts and update_seq of every database, refreshed from _db_updates, see FleetSnapshot
+    def fleet_snapshot(self, ttl=30, include=None, exclude=None, chunk_size=100, concurrency=4):
+        return FleetSnapshot(server=self, ttl=ttl, include=include, exclude=exclude, chunk_size=chunk_size, concurrency=concurrency)
+
+    # Prometheus metrics of every cluster node, see MetricsCollector
+    def metrics_collector(self, nodes=None, timeout=5, prefix="couchdb", max_age=1, export_rates=False):
+        return MetricsCollector(server=self, nodes=nodes, timeout=timeout, prefix=prefix, max_age=max_age, export_rates=export_rates)
+
+    # Queued _security edits applied to many databases, one read-modify-write each, see SecurityEditor
+    def security_editor(self, concurrency=8, verify=False, retries=2):
+        return SecurityEditor(server=self, concurrency=concurrency, verify=verify, retries=retries)
+
     # Cluster Setup Status
     def cluster_setup_status(self, username, password):
         logger = logging.getLogger('Server::cluster_setup_status')
@@ -262,52 +381,36 @@ class Server(object):
             }
         return response
 
-    # Sync all 
-    def sync_all_shards(self):
+    # Sync all
+    # concurrency / include / exclude / order / progress: see MaintenanceRunner
+    def sync_all_shards(self, concurrency=4, include=None, exclude=None, order=None, progress=None):
         logger = logging.getLogger("Server::sync_all_shards")
-        result = {
-            "processed": 0,
-            "rows": {}
-        }
-        db_list = self.all_dbs()
-        logger.debug(f"dblist type is {type(db_list)}")
-        if type(db_list) is list:
-            for item in db_list:
-                logger.info(f"Syncing shards for {item}")
-                result["processed"] += 1
-                db = Database(server=self, name=item)
-                result["rows"][item] = db.sync_shards()
-            return result
-        else:
-            logger.error("Invalid List!!")
-            return db_list
-
-    # Compact all
-    def compact_all(self):
-        result = {
-            "processed": 0,
-            "rows": {}
-        }
-        db_list = self.all_dbs()
-        if "error" not in db_list.keys():
-            for item in db_list:
-                result["processed"] += 1
-                db = Database(server=self, name=item)
-                result["rows"][item] = db.compact()
-            return result
-        else:
-            return db_list
+        logger.debug("Syncing shards for every database")
+        runner = MaintenanceRunner(server=self, concurrency=concurrency, include=include, exclude=exclude, order=order, progress=progress)
+        return runner.run("sync_shards")
+
+    # Compact all, order="fragmentation" starts with the databases that free the most space
+    def compact_all(self, concurrency=4, include=None, exclude=None, order=None, progress=None):
+        logger = logging.getLogger("Server::compact_all")
+        logger.debug("Compacting every database")
+        runner = MaintenanceRunner(server=self, concurrency=concurrency, include=include, exclude=exclude, order=order, progress=progress)
+        return runner.run("compact")
 
-    # DB Updates
-    def db_updates(self):
+    # DB Updates, since: a last_seq from an earlier call or "now"
+    def db_updates(self, since=None, limit=None):
         logger = logging.getLogger('Server::db_updates')
         headers = {
             'Accept': 'application/json',
             'Content-Type': 'application/json'
         }
         logger.debug('Querying /_db_updates')
+        params = []
+        if since is not None:
+            params.append(f"since={quote(str(since), safe='')}")
+        if limit is not None:
+            params.append(f"limit={limit}")
         # self.refresh_connection()
-        return self.endpoint(endpoint='_db_updates', headers=headers)
+        return self.endpoint(endpoint=f"_db_updates{'?' + '&'.join(params) if params else ''}", headers=headers)
 
     # Cluster Membership
     def membership(self):
@@ -352,7 +455,7 @@ class Server(object):
         return self.endpoint(endpoint='_up', headers=headers)
 
     # UUIDs
-    def uuids(self):
+    def uuids(self, count=1):
         logger = logging.getLogger('Server::uuids')
         headers = {
             'Accept': 'application/json',
@@ -360,4 +463,4 @@ class Server(object):
         }
         logger.debug('Querying /_uuids')
         # self.refresh_connection()
-        return self.endpoint(endpoint='_uuids', headers=headers)
+        return self.endpoint(endpoint=f'_uuids?count={count}', headers=headers)
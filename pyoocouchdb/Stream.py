@@ -0,0 +1,73 @@
+import codecs
+import json
+import logging
+
+
+# Row Stream Class - yields the items of one top-level JSON array while the body downloads
+# key: name of the array ("rows" for _all_docs and views, "results" for _changes, "docs" for _find)
+# meta: every other top-level field, available once the stream is exhausted
+class RowStream(object):
+    def __init__(self, stream, key="rows"):
+        self.stream = stream
+        self.key = key
+        self.meta = {}
+        self.status = stream.status
+        self._decoder = json.JSONDecoder()
+
+    def __iter__(self):
+        logger = logging.getLogger('RowStream::__iter__')
+        if self.status >= 400:
+            body = self.stream.read()
+            try:
+                self.meta = json.loads(body.decode())
+            except ValueError:
+                self.meta = {"status": "error", "content": body.decode(errors='replace')}
+            logger.error(f"Error streaming {self.key}: {self.meta}")
+            return
+        text = codecs.getincrementaldecoder('utf-8')()
+        chunks = self.stream.iter_content()
+        buffer = ""
+        head = None
+        position = 0
+        try:
+            # Find the start of the array
+            marker = f'"{self.key}"'
+            while head is None:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    self.meta = json.loads(buffer) if buffer.strip() else {}
+                    return
+                buffer += text.decode(chunk)
+                found = buffer.find(marker)
+                if found >= 0:
+                    bracket = buffer.find("[", found + len(marker))
+                    if bracket >= 0:
+                        head = buffer[:bracket]
+                        buffer = buffer[bracket + 1:]
+            # Decode one item at a time, pulling chunks only when an item is incomplete
+            while True:
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position < len(buffer) and buffer[position] == "]":
+                    tail = buffer[position + 1:]
+                    break
+                try:
+                    if position >= len(buffer):
+                        raise ValueError("Need more data")
+                    item, end = self._decoder.raw_decode(buffer, position)
+                except ValueError:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        raise ValueError(f"Truncated {self.key} array")
+                    buffer = buffer[position:] + text.decode(chunk)
+                    position = 0
+                    continue
+                position = end
+                yield item
+            for chunk in chunks:
+                tail += text.decode(chunk)
+            tail += text.decode(b"", final=True)
+            self.meta = json.loads(f"{head}[]{tail}")
+            del self.meta[self.key]
+        finally:
+            self.stream.close()
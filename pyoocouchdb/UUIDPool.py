@@ -0,0 +1,64 @@
+import collections
+import logging
+import os
+import threading
+import time
+import uuid
+
+
+# Time-ordered ids (CouchDB's utc_random algorithm), neighbouring ids land in the same B-tree nodes
+def utc_random():
+    return f"{time.time_ns() // 1000:014x}{os.urandom(9).hex()}"
+
+
+# UUID Pool Class - ids for new documents without a round trip per document
+class UUIDPool(object):
+    # Initialization
+    # batch: ids fetched per _uuids call (CouchDB caps count at 1000 by default)
+    # low_water: ids left when a background refill starts
+    # generator: callable returning ids locally, the server is never asked when set
+    def __init__(self, server, batch=1000, low_water=None, generator=None):
+        self.server = server
+        self.batch = batch
+        self.low_water = batch // 4 if low_water is None else low_water
+        self.generator = generator
+        self._ids = collections.deque()
+        self._fill_lock = threading.Lock()
+        self._refilling = threading.Event()
+
+    # Next id from the pool
+    def next(self):
+        if self.generator is not None:
+            return self.generator()
+        try:
+            doc_id = self._ids.popleft()
+        except IndexError:
+            with self._fill_lock:
+                if not self._ids:
+                    self._fill()
+            try:
+                doc_id = self._ids.popleft()
+            except IndexError:
+                logging.getLogger('UUIDPool::next').warning("Server gave no uuids, generating one locally")
+                return uuid.uuid4().hex
+        if len(self._ids) < self.low_water and not self._refilling.is_set():
+            self._refilling.set()
+            threading.Thread(target=self._background_fill, daemon=True).start()
+        return doc_id
+
+    def _fill(self):
+        logger = logging.getLogger('UUIDPool::_fill')
+        response = self.server.uuids(count=self.batch)
+        if type(response) is dict and "uuids" in response.keys():
+            logger.debug(f"Got {len(response['uuids'])} uuids from the server")
+            self._ids.extend(response["uuids"])
+        else:
+            logger.error(f"Error getting uuids: {response}")
+
+    def _background_fill(self):
+        try:
+            with self._fill_lock:
+                if len(self._ids) < self.low_water:
+                    self._fill()
+        finally:
+            self._refilling.clear()
@@ -0,0 +1,156 @@
+import json
+import logging
+from urllib.parse import quote
+from . import Core as f
+from .Stream import RowStream
+
+
+# View Query Class - streams the rows of a design document view page by page
+# ddoc, view: design document (with or without "_design/") and view names
+# key, keys, startkey / endkey (startkey_docid, endkey_docid, inclusive_end): rows asked for,
+#   None means not set, keys=[None] asks for the null key
+# reduce: None keeps the view default, False reads the map rows; group / group_level group reduced rows
+# include_docs: documents along with the map rows
+# update: True, False or "lazy" (answer from the index as it is, refresh it afterwards)
+# stable: answer from the same shard copies every time
+# page_size: rows per request, pages continue from the last key and doc id seen, skipping only the rows
+#   of that key and doc id already read
+# keys_batch: keys POSTed per request, long key lists never go in the URL
+# limit: rows overall
+# total_rows and offset come from the first page, error holds the error body that stopped the query
+class ViewQuery(object):
+    def __init__(self, database, ddoc, view, key=None, keys=None, startkey=None, endkey=None, startkey_docid=None, endkey_docid=None, inclusive_end=True, descending=False, reduce=None, group=False, group_level=None, include_docs=False, update=None, stable=False, page_size=1000, keys_batch=1000, limit=None):
+        self.database = database
+        if ddoc.startswith("_design/"):
+            ddoc = ddoc[len("_design/"):]
+        self.path = f"_design/{quote(ddoc, safe='')}/_view/{quote(view, safe='')}"
+        if key is not None:
+            startkey, endkey, inclusive_end = key, key, True
+        self.keys = keys
+        self.startkey = startkey
+        self.endkey = endkey
+        self.startkey_docid = startkey_docid
+        self.endkey_docid = endkey_docid
+        self.inclusive_end = inclusive_end
+        self.descending = descending
+        self.reduce = reduce
+        self.group = group
+        self.group_level = group_level
+        self.include_docs = include_docs
+        self.update = update
+        self.stable = stable
+        self.page_size = page_size
+        self.keys_batch = keys_batch
+        self.limit = limit
+        self.total_rows = None
+        self.offset = None
+        self.error = None
+        self.pages = 0
+
+    def __iter__(self):
+        logger = logging.getLogger('ViewQuery::__iter__')
+        headers = {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+        yielded = 0
+        if self.keys is not None:
+            keys = list(self.keys)
+            for start in range(0, len(keys), self.keys_batch):
+                limit = None if self.limit is None else self.limit - yielded
+                stream = f.endpoint_stream(self.database, endpoint=self.path + self.params(startkey=None, endkey=None, limit=limit), headers=headers, json_data={"keys": keys[start:start + self.keys_batch]}, method="POST")
+                rows = RowStream(stream, key="rows")
+                for row in rows:
+                    yield row
+                    yielded += 1
+                    if self.limit is not None and yielded >= self.limit:
+                        stream.close()
+                        return
+                if not self._page_done(rows):
+                    return
+            return
+        startkey, startkey_docid, skip = self.startkey, self.startkey_docid, 0
+        # (key, id) of the last row yielded and how many rows in a row had it, a document
+        # emitting the same key several times gives rows that differ in value only
+        last, repeated = None, 0
+        while True:
+            page_size = self.page_size if self.limit is None else min(self.page_size, self.limit - yielded)
+            # One extra row tells whether there is another page and where it starts
+            logger.debug(f"Fetching {self.path} page starting at {startkey} (skip {skip})")
+            stream = f.endpoint_stream(self.database, endpoint=self.path + self.params(startkey=startkey, startkey_docid=startkey_docid, skip=skip, limit=page_size + 1), headers=headers)
+            rows = RowStream(stream, key="rows")
+            count = 0
+            following = None
+            for row in rows:
+                if count == page_size:
+                    # Last row of the response, reading on hands the connection back to the pool
+                    following = row
+                    continue
+                count += 1
+                position = (row.get("key"), row.get("id"))
+                if position == last:
+                    repeated += 1
+                else:
+                    last, repeated = position, 1
+                yield row
+                yielded += 1
+            if not self._page_done(rows) or following is None:
+                return
+            if self.limit is not None and yielded >= self.limit:
+                return
+            # The next page starts at the first row of the look-ahead's (key, id), skipping the ones already read
+            start = (following["key"], following.get("id"), repeated if (following["key"], following.get("id")) == last else 0)
+            if start == (startkey, startkey_docid, skip):
+                self.error = {"error": "no_progress", "reason": f"page did not move past key {startkey!r}, id {startkey_docid!r}"}
+                logger.error(f"Error querying {self.database.name}/{self.path}: {self.error}")
+                return
+            startkey, startkey_docid, skip = start
+
+    # Query string for one request, the range and limit given explicitly since pages move them
+    def params(self, startkey=None, startkey_docid=None, endkey=False, skip=0, limit=None):
+        params = []
+        if self.descending:
+            params.append("descending=true")
+        if startkey is not None:
+            params.append(f"startkey={quote(json.dumps(startkey))}")
+        if startkey_docid is not None:
+            params.append(f"startkey_docid={quote(startkey_docid, safe='')}")
+        if endkey is False:
+            endkey = self.endkey
+        if endkey is not None:
+            params.append(f"endkey={quote(json.dumps(endkey))}")
+            if self.endkey_docid is not None:
+                params.append(f"endkey_docid={quote(self.endkey_docid, safe='')}")
+        if not self.inclusive_end:
+            params.append("inclusive_end=false")
+        if self.reduce is not None:
+            params.append(f"reduce={'true' if self.reduce else 'false'}")
+        if self.group:
+            params.append("group=true")
+        if self.group_level is not None:
+            params.append(f"group_level={self.group_level}")
+        if self.include_docs:
+            params.append("include_docs=true")
+        if self.update is not None:
+            params.append(f"update={self.update if type(self.update) is str else ('true' if self.update else 'false')}")
+        if self.stable:
+            params.append("stable=true")
+        if skip:
+            params.append(f"skip={skip}")
+        if limit is not None:
+            params.append(f"limit={limit}")
+        return f"?{'&'.join(params)}" if params else ""
+
+    # Keeps the totals of the first page, False when the page ended on an error
+    def _page_done(self, rows):
+        logger = logging.getLogger('ViewQuery::_page_done')
+        self.pages += 1
+        meta = rows.meta
+        if "error" in meta.keys() or meta.get("status") == "error":
+            self.error = meta
+            logger.error(f"Error querying {self.database.name}/{self.path}: {meta}")
+            return False
+        if self.pages == 1:
+            self.total_rows = meta.get("total_rows")
+            self.offset = meta.get("offset")
+        return True
@@ -2,3 +2,16 @@ from .Server import Server
 from .Node import Node
 from .Database import Database
 from . import Core
+from .AsyncServer import AsyncServer
+from .AsyncDatabase import AsyncDatabase
+from .AsyncDocument import AsyncDocument
+from .Query import FullScanError
+from .View import ViewQuery
+from .Attachment import AttachmentError, DigestMismatchError
+from .Cache import DocumentCache
+from .Instrumentation import Instrumentation
+from .MetricsCollector import MetricsCollector
+from .SecurityEditor import SecurityEditor
+from .LoadBalancer import LoadBalancer
+from .RequestGovernor import RequestGovernor
+from .Emulator import Emulator, EmulatorTransport, AsyncEmulatorTransport
@@ -0,0 +1,17 @@
+import pytest
+from pyoocouchdb import Server, Database, EmulatorTransport
+
+
+# Server on an in-process emulator, no CouchDB needed
+@pytest.fixture
+def server():
+    server = Server("emulator", transport=EmulatorTransport())
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def database(server):
+    database = Database(server, "tests")
+    database.create()
+    return database
@@ -0,0 +1,49 @@
+import asyncio
+from pyoocouchdb import AsyncServer, AsyncDatabase, AsyncEmulatorTransport
+from pyoocouchdb.AsyncDocument import AsyncDocument
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_update_with_unknown_revision_keeps_the_edit():
+    async def scenario():
+        server = AsyncServer("emulator", transport=AsyncEmulatorTransport())
+        database = AsyncDatabase(server, "tests")
+        await database.create()
+        await AsyncDocument(database, doc_id="a", content={"x": 1}).create()
+        doc = AsyncDocument(database, doc_id="a", content={"x": 99})
+        assert doc.revision is None
+        response = await doc.update()
+        assert response.get("ok")
+        assert (await AsyncDocument(database, doc_id="a").load())["x"] == 99
+    run(scenario())
+
+
+def test_update_retries_a_conflict_with_the_edit():
+    async def scenario():
+        server = AsyncServer("emulator", transport=AsyncEmulatorTransport())
+        database = AsyncDatabase(server, "tests")
+        await database.create()
+        first = AsyncDocument(database, doc_id="a", content={"x": 1})
+        await first.create()
+        other = AsyncDocument(database, doc_id="a")
+        await other.load()
+        other.content["x"] = 2
+        await other.update()
+        first.content["x"] = 3
+        response = await first.update()
+        assert response.get("ok")
+        assert (await AsyncDocument(database, doc_id="a").load())["x"] == 3
+    run(scenario())
+
+
+def test_update_missing_document():
+    async def scenario():
+        server = AsyncServer("emulator", transport=AsyncEmulatorTransport())
+        database = AsyncDatabase(server, "tests")
+        await database.create()
+        response = await AsyncDocument(database, doc_id="nope", content={"x": 1}).update()
+        assert response["status"] == "error"
+    run(scenario())
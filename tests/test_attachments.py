@@ -0,0 +1,48 @@
+import base64
+import gzip
+import hashlib
+import pytest
+from pyoocouchdb import Server, Database, EmulatorTransport, DigestMismatchError
+from pyoocouchdb.Document import Document
+from pyoocouchdb.Pool import PoolStream
+
+TEXT = b"".join(b"line %d of a compressible attachment\n" % n for n in range(200))
+STORED = gzip.compress(TEXT)
+
+
+def md5(data):
+    return "md5-" + base64.b64encode(hashlib.md5(data).digest()).decode()
+
+
+# Serves notes.txt the way CouchDB serves a gzip-stored attachment: no Content-MD5, gzip only when accepted
+class GzipStoredTransport(EmulatorTransport):
+    def __init__(self, stored=STORED):
+        EmulatorTransport.__init__(self)
+        self.stored = stored
+
+    def stream(self, method, url, headers={}, body=None, chunk_size=65536):
+        if not url.endswith("/notes.txt"):
+            return EmulatorTransport.stream(self, method, url, headers, body, chunk_size)
+        if "gzip" in headers.get("Accept-Encoding", ""):
+            return PoolStream(200, "OK", {"Content-Type": "text/plain", "Content-Encoding": "gzip"}, iter([self.stored[:100], self.stored[100:]]), None)
+        return PoolStream(200, "OK", {"Content-Type": "text/plain"}, iter([TEXT]), None)
+
+
+def notes(transport):
+    database = Database(Server("emulator", transport=transport), "tests")
+    stub = {"content_type": "text/plain", "encoding": "gzip", "digest": md5(STORED), "length": len(TEXT), "encoded_length": len(STORED), "stub": True}
+    return Document(database, doc_id="notes", data={"_id": "notes", "_rev": "1-abc", "_attachments": {"notes.txt": stub}})
+
+
+def test_gzip_stored_attachment_verifies_and_inflates():
+    assert b"".join(notes(GzipStoredTransport()).iter_attachment("notes.txt")) == TEXT
+
+
+def test_gzip_stored_attachment_range_is_cut_after_inflating():
+    assert b"".join(notes(GzipStoredTransport()).iter_attachment("notes.txt", start=100, end=499)) == TEXT[100:500]
+
+
+def test_gzip_stored_attachment_corrupted():
+    corrupted = gzip.compress(TEXT.replace(b"line 7 ", b"line 8 "))
+    with pytest.raises(DigestMismatchError):
+        b"".join(notes(GzipStoredTransport(stored=corrupted)).iter_attachment("notes.txt"))
@@ -0,0 +1,29 @@
+def test_bulk_create_batches(database):
+    report = database.bulk_create(({"_id": f"doc-{n:03d}", "n": n} for n in range(25)), batch_size=10, concurrency=2)
+    assert (report["ok"], report["batches"], report["conflict"], report["error"]) == (25, 3, 0, 0)
+    assert len(database.all_docs()["rows"]) == 25
+
+
+def test_bulk_create_max_bytes_splits_batches(database):
+    docs = [{"_id": f"doc-{n}", "padding": "x" * 100} for n in range(6)]
+    report = database.bulk_create(docs, batch_size=100, max_bytes=300)
+    assert (report["ok"], report["batches"]) == (6, 3)
+
+
+def test_bulk_create_conflicts(database):
+    database.bulk_create([{"_id": "a", "v": 1}, {"_id": "b", "v": 1}])
+    report = database.bulk_create([{"_id": "a", "v": 2}, {"_id": "c", "v": 2}])
+    assert (report["ok"], report["conflict"]) == (1, 1)
+    assert [row["id"] for row in report["conflicts"]] == ["a"]
+
+
+def test_bulk_create_retry_conflicts(database):
+    database.bulk_create([{"_id": "a", "v": 1}])
+    report = database.bulk_create([{"_id": "a", "v": 2}], retry_conflicts=True)
+    assert (report["ok"], report["conflict"]) == (1, 0)
+    assert database.get_many(["a"])["docs"][0].content["v"] == 2
+
+
+def test_bulk_create_docs_body(database):
+    report = database.bulk_create({"docs": [{"_id": "a"}, {"_id": "b"}]})
+    assert report["ok"] == 2
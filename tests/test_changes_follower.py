@@ -0,0 +1,47 @@
+from pyoocouchdb.ChangesFollower import FileCheckpoint, LocalDocCheckpoint
+
+
+def ids(batches):
+    return [change["id"] for batch in batches for change in batch]
+
+
+# Reads batches until count changes are in, stopping before the next batch is asked for
+def read(follower, count):
+    batches = []
+    for batch in follower:
+        batches.append(batch)
+        if len(ids(batches)) >= count:
+            follower.stop()
+    return batches
+
+
+def test_follower_resumes_from_checkpoint(database, tmp_path):
+    database.bulk_create([{"_id": f"doc-{n}"} for n in range(5)])
+    checkpoint = FileCheckpoint(str(tmp_path / "changes.json"))
+    first = database.follow_changes(feed="longpoll", timeout=50, batch_size=2, checkpoint=checkpoint)
+    batches = iter(first)
+    assert ids([next(batches)]) == ["doc-0", "doc-1"]
+    # Asking for the second batch checkpoints the first, the second is never acknowledged
+    assert ids([next(batches)]) == ["doc-2", "doc-3"]
+    first.stop()
+    second = database.follow_changes(feed="longpoll", timeout=50, batch_size=2, checkpoint=FileCheckpoint(checkpoint.path))
+    assert ids(read(second, 3)) == ["doc-2", "doc-3", "doc-4"]
+    assert checkpoint.load() == second.since
+    database.bulk_create([{"_id": "doc-5"}])
+    third = database.follow_changes(feed="longpoll", timeout=50, batch_size=2, checkpoint=FileCheckpoint(checkpoint.path))
+    assert ids(read(third, 1)) == ["doc-5"]
+
+
+def test_follower_local_doc_checkpoint(database):
+    database.bulk_create([{"_id": f"doc-{n}"} for n in range(3)])
+    first = database.follow_changes(feed="longpoll", timeout=50, batch_size=10, checkpoint=LocalDocCheckpoint(database, "follower"))
+    assert ids(read(first, 3)) == ["doc-0", "doc-1", "doc-2"]
+    database.bulk_create([{"_id": "doc-3"}])
+    second = database.follow_changes(feed="longpoll", timeout=50, batch_size=10, checkpoint=LocalDocCheckpoint(database, "follower"))
+    assert ids(read(second, 1)) == ["doc-3"]
+
+
+def test_follower_continuous_batches(database):
+    database.bulk_create([{"_id": f"doc-{n}"} for n in range(5)])
+    follower = database.follow_changes(feed="continuous", heartbeat=50, batch_size=2)
+    assert [len(batch) for batch in read(follower, 5)] == [2, 2, 1]
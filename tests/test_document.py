@@ -0,0 +1,56 @@
+from pyoocouchdb.Document import Document
+
+
+def test_create_update_delete(database):
+    doc = Document(database, doc_id="crud", content={"x": 1}, lazy=True)
+    assert doc.create()["ok"]
+    assert doc.revision.startswith("1-")
+    doc.content["x"] = 2
+    assert doc.update()["ok"]
+    assert Document(database, doc_id="crud").content["x"] == 2
+    assert doc.delete()["ok"]
+    assert not Document(database, doc_id="crud").exists
+
+
+def test_create_taken_id(database):
+    Document(database, doc_id="taken", content={"x": 1}, lazy=True).create()
+    again = Document(database, doc_id="taken", content={"x": 2}, lazy=True)
+    assert again.create()["status"] == "error"
+    assert Document(database, doc_id="taken").content["x"] == 1
+
+
+def test_update_retries_a_conflict(database):
+    Document(database, doc_id="shared", content={"x": 1}, lazy=True).create()
+    mine = Document(database, doc_id="shared")
+    theirs = Document(database, doc_id="shared")
+    theirs.content["x"] = 2
+    theirs.update()
+    mine.content["x"] = 3
+    assert mine.update()["ok"]
+    assert mine.revision.startswith("3-")
+    assert Document(database, doc_id="shared").content["x"] == 3
+
+
+def test_update_conflict_without_retries(database):
+    Document(database, doc_id="shared", content={"x": 1}, lazy=True).create()
+    mine = Document(database, doc_id="shared")
+    theirs = Document(database, doc_id="shared")
+    theirs.content["x"] = 2
+    theirs.update()
+    mine.content["x"] = 3
+    assert mine.update(retries=0)["error"] == "conflict"
+    assert Document(database, doc_id="shared").content["x"] == 2
+
+
+def test_delete_retries_a_conflict(database):
+    Document(database, doc_id="shared", content={"x": 1}, lazy=True).create()
+    mine = Document(database, doc_id="shared")
+    theirs = Document(database, doc_id="shared")
+    theirs.content["x"] = 2
+    theirs.update()
+    assert mine.delete()["ok"]
+    assert not Document(database, doc_id="shared").exists
+
+
+def test_delete_missing(database):
+    assert Document(database, doc_id="never").delete()["status"] == "error"
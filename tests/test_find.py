@@ -0,0 +1,38 @@
+import pytest
+from pyoocouchdb import FullScanError
+from pyoocouchdb.Document import Document
+
+
+@pytest.fixture
+def numbered(database):
+    for i in range(25):
+        Document(database, doc_id=f"doc{i:02d}", content={"n": i, "odd": i % 2 == 1}, lazy=True).create()
+    return database
+
+
+def test_iter_find_pages_with_bookmarks(numbered):
+    query = numbered.iter_find({"n": {"$gte": 0}}, page_size=4, on_full_scan=None)
+    assert sorted(doc["n"] for doc in query) == list(range(25))
+    assert query.pages == 7
+
+
+def test_iter_find_limit_argument(numbered):
+    assert len(list(numbered.iter_find({"n": {"$gte": 0}}, page_size=4, limit=10, on_full_scan=None))) == 10
+
+
+def test_iter_find_limit_and_skip_of_the_query(numbered):
+    query = {"selector": {"n": {"$gte": 0}}, "sort": [{"_id": "asc"}], "skip": 5, "limit": 7}
+    docs = list(numbered.iter_find(query, page_size=2, on_full_scan=None))
+    assert [doc["n"] for doc in docs] == list(range(5, 12))
+
+
+def test_iter_find_fields(numbered):
+    docs = list(numbered.iter_find({"odd": True}, fields=["n"], on_full_scan=None))
+    assert len(docs) == 12
+    assert all(list(doc.keys()) == ["n"] for doc in docs)
+
+
+def test_iter_find_full_scan(numbered):
+    query = numbered.iter_find({"n": {"$gte": 0}}, on_full_scan="raise")
+    with pytest.raises(FullScanError):
+        list(query)
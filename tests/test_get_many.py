@@ -0,0 +1,40 @@
+from pyoocouchdb.Document import Document
+
+
+def test_get_many_chunks_keep_order(database):
+    ids = [f"doc{i:03d}" for i in range(25)]
+    for doc_id in ids:
+        Document(database, doc_id=doc_id, content={"n": doc_id}, lazy=True).create()
+    result = database.get_many(reversed(ids), chunk_size=4, concurrency=3)
+    assert [doc.id for doc in result["docs"]] == list(reversed(ids))
+    assert all(doc.exists and doc.content["n"] == doc.id for doc in result["docs"])
+
+
+def test_get_many_missing_and_deleted(database):
+    Document(database, doc_id="kept", content={}, lazy=True).create()
+    gone = Document(database, doc_id="gone", content={}, lazy=True)
+    gone.create()
+    gone.delete()
+    result = database.get_many(["kept", "gone", "never"])
+    assert [doc.id for doc in result["docs"]] == ["kept"]
+    assert result["deleted"] == ["gone"]
+    assert result["missing"] == ["never"]
+
+
+def test_get_many_documents_with_a_doc_field(database):
+    Document(database, doc_id="a", content={"doc": "hello"}, lazy=True).create()
+    Document(database, doc_id="b", content={"doc": {"nested": True}}, lazy=True).create()
+    docs = database.get_many(["a", "b"])["docs"]
+    assert [doc.id for doc in docs] == ["a", "b"]
+    assert all(doc.exists and doc.revision for doc in docs)
+    assert docs[0].content["doc"] == "hello"
+    assert docs[1].content["doc"] == {"nested": True}
+
+
+def test_get_many_all_docs_fallback(database):
+    Document(database, doc_id="b", content={"doc": {"nested": True}}, lazy=True).create()
+    database._bulk_get_supported = False
+    docs = database.get_many(["b", "never"])
+    assert [doc.id for doc in docs["docs"]] == ["b"]
+    assert docs["docs"][0].content["doc"] == {"nested": True}
+    assert docs["missing"] == ["never"]
@@ -0,0 +1,46 @@
+import threading
+import pytest
+from pyoocouchdb import Server, Database
+from benchmarks.standin import start
+
+
+# Server with a single pooled connection against the HTTP stand-in, a request made while another
+# response is still open waits for that connection forever
+@pytest.fixture
+def narrow_database():
+    standin = start()
+    server = Server("127.0.0.1", port=standin.port, pool_size=1, pool_per_host=1)
+    database = Database(server, "narrow")
+    database.create()
+    yield database
+    server.close()
+    standin.shutdown()
+    standin.server_close()
+
+
+# Runs call in a thread, fails instead of hanging the suite when the pool deadlocks
+def finishes(call, timeout=10):
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(value=call()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "deadlocked on the connection pool"
+    return result["value"]
+
+
+def test_delete_all_docs_with_one_connection(narrow_database):
+    narrow_database.bulk_create([{"_id": f"doc-{n:03d}", "n": n} for n in range(25)])
+    result = finishes(lambda: narrow_database.delete_all_docs(batch_size=4, concurrency=2))
+    assert result["deleted"]["ok"] == 25
+    assert result["deleted"]["errors"] == []
+    assert result["purged"]["purged"] == 25
+    assert narrow_database.all_docs()["rows"] == []
+
+
+def test_purge_all_with_one_connection(narrow_database):
+    narrow_database.bulk_create([{"_id": f"doc-{n:03d}"} for n in range(12)])
+    rows = narrow_database.all_docs()["rows"]
+    narrow_database.bulk_create([{"_id": row["id"], "_rev": row["value"]["rev"], "_deleted": True} for row in rows[:7]])
+    result = finishes(lambda: narrow_database.purge_all(batch_size=3))
+    assert result == {"purged": 7, "batches": 3, "errors": []}
+    assert len(narrow_database.all_docs()["rows"]) == 5
@@ -0,0 +1,61 @@
+import pytest
+from pyoocouchdb.Document import Document
+
+
+@pytest.fixture
+def by_group(server, database):
+    for i in range(20):
+        Document(database, doc_id=f"doc{i:02d}", content={"group": i % 3, "n": i}, lazy=True).create()
+    Document(database, doc_id="_design/app", content={"views": {"by_group": {"map": "emulated", "reduce": "_count"}}}, lazy=True).create()
+    server.transport.emulator.define_view(database.name, "app", "by_group", lambda doc: [(doc["group"], doc["n"])], reduce="_count")
+    return database
+
+
+@pytest.fixture
+def repeated(server, database):
+    for i in range(10):
+        Document(database, doc_id=f"doc{i:02d}", content={}, lazy=True).create()
+    Document(database, doc_id="_design/app", content={"views": {"repeated": {"map": "emulated"}}}, lazy=True).create()
+    server.transport.emulator.define_view(database.name, "app", "repeated", lambda doc: [(["same", 1], n) for n in range(3)])
+    return database
+
+
+@pytest.mark.parametrize("page_size", [1, 3, 7, 100])
+def test_iter_view_pages_match_one_request(by_group, page_size):
+    expected = by_group.view("app", "by_group", reduce=False)["rows"]
+    query = by_group.iter_view("app", "by_group", reduce=False, page_size=page_size)
+    assert list(query) == expected
+    assert query.error is None
+    assert query.total_rows == 20
+
+
+@pytest.mark.parametrize("page_size", [1, 2, 4, 5, 29, 30])
+@pytest.mark.parametrize("descending", [False, True])
+def test_iter_view_rows_sharing_key_and_id(repeated, page_size, descending):
+    rows = []
+    for row in repeated.iter_view("app", "repeated", page_size=page_size, descending=descending):
+        rows.append((row["id"], row["value"]))
+        assert len(rows) <= 30
+    assert sorted(rows) == sorted((f"doc{i:02d}", n) for i in range(10) for n in range(3))
+
+
+def test_iter_view_range_and_limit(by_group):
+    rows = list(by_group.iter_view("app", "by_group", reduce=False, startkey=1, endkey=2, page_size=4, limit=9))
+    assert len(rows) == 9
+    assert all(row["key"] in (1, 2) for row in rows)
+
+
+def test_iter_view_keys_in_batches(by_group):
+    rows = list(by_group.iter_view("app", "by_group", reduce=False, keys=[2, 0], keys_batch=1))
+    assert [row["key"] for row in rows] == [2] * 6 + [0] * 7
+
+
+def test_iter_view_grouped_reduce(by_group):
+    rows = list(by_group.iter_view("app", "by_group", group=True))
+    assert rows == [{"key": 0, "value": 7}, {"key": 1, "value": 7}, {"key": 2, "value": 6}]
+
+
+def test_iter_view_missing_view(by_group):
+    query = by_group.iter_view("app", "nope")
+    assert list(query) == []
+    assert query.error["error"] == "not_found"